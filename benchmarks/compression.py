@@ -0,0 +1,148 @@
+"""
+Compare the size and speed of the ways shots can be stored.
+
+Run with `python benchmarks/compression.py`. Codecs whose packages aren't
+installed are skipped. The signals are made to look like 12 bit digitizer
+data changed into volts and saved as float64, like `Data.get` returns them.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from scipy.io import loadmat, savemat
+
+from wipplpy.modules.compression import CODECS, dequantize, import_codec, quantize
+from wipplpy.modules.npy_store import NpyStore
+
+
+def make_signals(num_channels, num_samples, bits=12, seed=0):
+    """
+    Make signals that are on the grid of a digitizer.
+
+    Returns
+    -------
+    dict
+        Float64 signal of each channel keyed by its name.
+    """
+    rng = np.random.default_rng(seed)
+    max_code = 2**bits - 1
+    signals = {}
+    for i in range(num_channels):
+        # A slow wave with noise of a few levels, like a probe signal.
+        wave = np.sin(np.linspace(0, 20 * np.pi, num_samples) + i)
+        codes = np.clip(
+            np.rint(
+                max_code / 2 + 0.3 * max_code * wave + rng.normal(0, 4, num_samples)
+            ),
+            0,
+            max_code,
+        )
+        gain = 20 / max_code
+        signals[f"channel_{i:02}"] = codes * gain - 10
+    return signals
+
+
+def _mat(quantize_bits=None, lossy=False, compress=False):
+    def write(signals, path):
+        calls = dict(signals)
+        records = {}
+        if quantize_bits is not None:
+            for name, signal in signals.items():
+                result = quantize(signal, quantize_bits, lossy)
+                if result is not None:
+                    calls[name] = result[0]
+                    records[name] = result[1:]
+        savemat(path + ".mat", calls, do_compression=compress)
+        return records
+
+    def read(path, records):
+        loaded = loadmat(path + ".mat", squeeze_me=True)
+        for name, (scale, offset) in records.items():
+            loaded[name] = dequantize(loaded[name], scale, offset)
+        return loaded
+
+    return write, read
+
+
+def _store(codec=None):
+    def write(signals, path):
+        store = NpyStore(path, codec)
+        for name, signal in signals.items():
+            store.put(name, signal)
+
+    def read(path, _):
+        store = NpyStore(path, codec)
+        # Read every array into memory so that memory mapped files are timed fairly.
+        keys = store.keys()
+        return {key: np.array(store.get(key)) for key in keys}
+
+    return write, read
+
+
+def _size(path):
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)
+        )
+    return os.path.getsize(path + ".mat")
+
+
+def run(num_channels, num_samples, repeats):
+    signals = make_signals(num_channels, num_samples)
+    raw_bytes = sum(signal.nbytes for signal in signals.values())
+    methods = {
+        "mat": _mat(),
+        "mat zlib": _mat(compress=True),
+        "mat 16 bit codes": _mat(quantize_bits=16),
+        "mat 16 bit codes + zlib": _mat(quantize_bits=16, compress=True),
+        "npy store": _store(),
+    }
+    for codec in CODECS:
+        try:
+            import_codec(codec)
+        except ImportError:
+            print(f"Skipping '{codec}' since its package is not installed.")
+            continue
+        methods[f"npy store {codec}"] = _store(codec)
+
+    print(
+        f"{num_channels} channels of {num_samples} samples, {raw_bytes / 2**20:.1f} MiB as float64."
+    )
+    print(f"{'method':<26}{'ratio':>8}{'write MiB/s':>14}{'read MiB/s':>14}  exact")
+    directory = tempfile.mkdtemp()
+    try:
+        for method_name, (write, read) in methods.items():
+            write_times = []
+            read_times = []
+            for repeat in range(repeats):
+                path = os.path.join(
+                    directory, f"{method_name.replace(' ', '_')}_{repeat}"
+                )
+                start = time.perf_counter()
+                records = write(signals, path)
+                write_times.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                loaded = read(path, records)
+                read_times.append(time.perf_counter() - start)
+            exact = all(
+                np.allclose(loaded[name], signal, rtol=0, atol=1e-9)
+                for name, signal in signals.items()
+            )
+            print(
+                f"{method_name:<26}{raw_bytes / _size(path):>8.2f}{raw_bytes / 2**20 / min(write_times):>14.0f}{raw_bytes / 2**20 / min(read_times):>14.0f}  {exact}"
+            )
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--channels", type=int, default=16)
+    parser.add_argument("--samples", type=int, default=1_000_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    arguments = parser.parse_args()
+    run(arguments.channels, arguments.samples, arguments.repeats)
@@ -2,8 +2,8 @@
 Create objects pertaining to accessing databases for the BRB device.
 """
 
-from WiPPLPy.modules.config_reader import MDSplusConfigReader
-from WiPPLPy.modules.connection import MDSPlusConnection
+from wipplpy.modules.config_reader import MDSplusConfigReader
+from wipplpy.modules.connection import MDSPlusConnection
 
 
 class BRBConnection(MDSPlusConnection):
@@ -11,18 +11,39 @@ class BRBConnection(MDSPlusConnection):
     Open the BRB-MDSplus database for a given shot number.
     """
 
-    def __init__(self, config_reader=MDSplusConfigReader()):
+    def __init__(self, config_reader=None):
         """
         Initialize class attributes.
 
         Parameters
         ----------
-        config_reader : `WiPPLPy.modules.config_reader.MDSplusConfigReader`
+        config_reader : `wipplpy.modules.config_reader.MDSplusConfigReader`, default=None
             Class object that reads from the INI file containing MDSplus
-            labels.
+            labels. If `None`, read the standard INI file.
         """
+        super().__init__()
+        if config_reader is None:
+            config_reader = MDSplusConfigReader()
         self.config_reader = config_reader
 
+    def location(self, shot_number):
+        """
+        Determine the tree and server holding the given shot number's data.
+
+        Parameters
+        ----------
+        shot_number : `int`
+            The shot number from which to extract MDSplus data.
+
+        Returns
+        -------
+        tree_name : `str`
+            String representing the tree name of the BRB-MDSplus database.
+        server_name : `str`
+            String representing the server in which the shot's data is located.
+        """
+        return self.config_reader.BRB_tree, self.config_reader.BRB_remote_server
+
     def make_connection(self, shot_number):
         """
         Establish an MDSplus connection to the appropriate BRB data server.
@@ -32,8 +53,4 @@ class BRBConnection(MDSPlusConnection):
         shot_number : `int`
             The shot number from which to extract MDSplus data.
         """
-        self._local_and_remote_connection(
-            shot_number,
-            self.config_reader.BRB_tree,
-            self.config_reader.BRB_remote_server,
-        )
+        self._local_and_remote_connection(shot_number, *self.location(shot_number))
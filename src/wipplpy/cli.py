@@ -0,0 +1,220 @@
+"""Command line interface of the `wipplpy` package."""
+
+import argparse
+import logging
+import sys
+
+
+def _export(arguments):
+    from wipplpy.modules.export import export_shots, parse_shots
+
+    deadlines = None
+    if arguments.call_timeout is not None:
+        deadlines = {"call": arguments.call_timeout}
+    manifest = export_shots(
+        parse_shots(arguments.shots),
+        arguments.output,
+        call_strings=arguments.call,
+        probe_paths=arguments.probe,
+        machine=arguments.machine,
+        export_format=arguments.format,
+        jobs=arguments.jobs,
+        verify=arguments.verify,
+        ignore_errors=arguments.ignore_errors,
+        deadlines=deadlines,
+        config_filepath=arguments.config,
+    )
+    num_failures = len(manifest["failures"])
+    if num_failures != 0:
+        logging.error(
+            f"{num_failures} shots failed to export: {sorted(manifest['failures'], key=int)}. Run the same command again to retry them."
+        )
+        return 1
+    return 0
+
+
+def _mirror(arguments):
+    from wipplpy.modules.mirror import sync_mirror
+
+    deadlines = None
+    if arguments.call_timeout is not None:
+        deadlines = {"call": arguments.call_timeout}
+    summary = sync_mirror(
+        arguments.archive,
+        call_strings=arguments.call,
+        probe_paths=arguments.probe,
+        machine=arguments.machine,
+        first_shot=arguments.first_shot,
+        last_shot=arguments.last_shot,
+        jobs=arguments.jobs,
+        rate=arguments.rate,
+        max_shots=arguments.max_shots,
+        revalidate_seconds=arguments.revalidate_hours * 3600,
+        export_format=arguments.format,
+        ignore_errors=arguments.ignore_errors,
+        deadlines=deadlines,
+        config_filepath=arguments.config,
+        tree_directory=arguments.tree_directory,
+    )
+    logging.info(
+        f"Mirror is at shot {summary['most_recent_shot']}. {len(summary['new'])} new shots, {len(summary['revalidated'])} revalidated, {len(summary['changed'])} changed, and {len(summary['missing'])} don't exist."
+    )
+    if len(summary["failures"]) != 0:
+        logging.error(
+            f"{len(summary['failures'])} shots failed to sync: {sorted(summary['failures'])}. They are tried again on the next sync."
+        )
+        return 1
+    return 0
+
+
+def _add_data_arguments(parser):
+    """Add the arguments that choose which data to get and how."""
+    from wipplpy.modules.export import EXPORT_FORMATS
+
+    parser.add_argument(
+        "-m",
+        "--machine",
+        choices=["brb", "mst"],
+        default=None,
+        help="Machine whose connection class finds the tree and server of each shot. By default use the shot loading config.",
+    )
+    parser.add_argument(
+        "-c",
+        "--call",
+        action="append",
+        default=[],
+        help="MDSplus call to export. Can be given many times.",
+    )
+    parser.add_argument(
+        "-p",
+        "--probe",
+        action="append",
+        default=[],
+        help="Probe class, like 'package.module:ClassName', to export all data of. Can be given many times.",
+    )
+    parser.add_argument("-f", "--format", choices=sorted(EXPORT_FORMATS), default="mat")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of shots to export at the same time.",
+    )
+    parser.add_argument(
+        "--ignore-errors",
+        action="store_true",
+        help="Skip calls that fail instead of failing the shot.",
+    )
+    parser.add_argument(
+        "--call-timeout",
+        type=float,
+        default=None,
+        help="Seconds to wait for each call to the server.",
+    )
+    parser.add_argument("--config", default=None, help="Path to the MDSplus INI file.")
+
+
+def _make_parser():
+    parser = argparse.ArgumentParser(
+        prog="wipplpy",
+        description="Tools for data from machines at the Wisconsin Plasma Physics Laboratory.",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="count",
+        default=0,
+        help="Log more. Give twice for debug logging.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser(
+        "export",
+        help="Export shots to files.",
+        description="Export shots to files in parallel. Running the same command again resumes an interrupted export.",
+    )
+    export_parser.add_argument(
+        "shots",
+        nargs="+",
+        help="Shot numbers and inclusive ranges, like '1000-1010,1020'.",
+    )
+    export_parser.add_argument(
+        "-o", "--output", required=True, help="Directory to export into."
+    )
+    _add_data_arguments(export_parser)
+    export_parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Check checksums of already exported files instead of only their sizes before skipping them.",
+    )
+    export_parser.set_defaults(run=_export)
+
+    mirror_parser = subparsers.add_parser(
+        "mirror",
+        help="Keep a local archive in step with the server.",
+        description="Download new shots and shots of the last run day whose data changed. Running it again when everything is current downloads nothing.",
+    )
+    mirror_parser.add_argument("archive", help="Directory of the archive.")
+    mirror_parser.add_argument(
+        "--first-shot",
+        type=int,
+        default=None,
+        help="First shot of the archive. Only needed the first time.",
+    )
+    mirror_parser.add_argument(
+        "--last-shot",
+        type=int,
+        default=None,
+        help="Last shot to mirror. By default the most recent shot on the server.",
+    )
+    _add_data_arguments(mirror_parser)
+    mirror_parser.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="Largest number of shots to start downloading per second.",
+    )
+    mirror_parser.add_argument(
+        "--max-shots",
+        type=int,
+        default=None,
+        help="Largest number of shots to download in this sync.",
+    )
+    mirror_parser.add_argument(
+        "--revalidate-hours",
+        type=float,
+        default=36.0,
+        help="Hours after a new shot is mirrored that it is checked for changes.",
+    )
+    mirror_parser.add_argument(
+        "--tree-directory",
+        default=None,
+        help="Directory of the tree files of the machine, if this host can read it, to list shots from instead of checking each shot on the server.",
+    )
+    mirror_parser.set_defaults(run=_mirror)
+    return parser
+
+
+def main(argv=None):
+    """
+    Run the `wipplpy` command.
+
+    Parameters
+    ----------
+    argv : list of str or None, default=None
+        Command line arguments. If None, use `sys.argv`.
+
+    Returns
+    -------
+    int
+        Exit status.
+    """
+    arguments = _make_parser().parse_args(argv)
+    logging.basicConfig(
+        level=[logging.WARNING, logging.INFO, logging.DEBUG][min(arguments.verbose, 2)]
+    )
+    return arguments.run(arguments)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
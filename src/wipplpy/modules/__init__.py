@@ -3,6 +3,48 @@ The `~wipplypy.modules` subpackage contains commonly used functions and classes
 for loading and modifying data.
 """
 
-__all__ = ["shot_loader", "generic_get_data"]
+__all__ = [
+    "shot_loader",
+    "generic_get_data",
+    "call_cache",
+    "columnar",
+    "compression",
+    "deadlines",
+    "dispatcher",
+    "ensemble",
+    "export",
+    "mirror",
+    "negative_cache",
+    "npy_store",
+    "prefetch",
+    "pyramid",
+    "query_planner",
+    "resample",
+    "scheduler",
+    "single_flight",
+    "spectral",
+    "timebase_registry",
+]
 
-from wipplpy.modules import generic_get_data, shot_loader
+from wipplpy.modules import (
+    call_cache,
+    columnar,
+    compression,
+    deadlines,
+    dispatcher,
+    ensemble,
+    export,
+    generic_get_data,
+    mirror,
+    negative_cache,
+    npy_store,
+    prefetch,
+    pyramid,
+    query_planner,
+    resample,
+    scheduler,
+    shot_loader,
+    single_flight,
+    spectral,
+    timebase_registry,
+)
@@ -0,0 +1,337 @@
+"""Hold saved calls in memory up to a budget and move the least recently used ones out of memory."""
+
+import contextlib
+import itertools
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+import numpy as np
+
+# Largest number of bytes that every cache in this process can hold in memory together. If None, there is no limit.
+_process_memory_budget = None
+# Caches are keyed by id since mappings that compare by content can't be hashed.
+_caches = weakref.WeakValueDictionary()
+_caches_lock = threading.RLock()
+# Order in which entries of every cache were last used so that the least recently used entry in the process can be found.
+_access_counter = itertools.count()
+
+
+def set_process_memory_budget(num_bytes):
+    """
+    Set the largest number of bytes that all call caches in this process can hold in memory together.
+
+    Parameters
+    ----------
+    num_bytes : int or None
+        Memory budget in bytes. If None, there is no limit.
+    """
+    global _process_memory_budget  # noqa: PLW0603
+    _process_memory_budget = num_bytes
+    _enforce_process_budget()
+
+
+def process_memory_used():
+    """
+    Get the number of bytes held in memory by all call caches in this process.
+
+    Returns
+    -------
+    int
+    """
+    with _caches_lock:
+        return sum(cache.nbytes for cache in list(_caches.values()))
+
+
+def _enforce_process_budget():
+    if _process_memory_budget is None:
+        return
+    with _caches_lock:
+        total = sum(cache.nbytes for cache in list(_caches.values()))
+        while total > _process_memory_budget:
+            # Evict the least recently used entry out of every cache.
+            oldest_cache = None
+            oldest_stamp = None
+            for cache in list(_caches.values()):
+                stamp = cache._oldest_evictable_stamp()
+                if stamp is not None and (oldest_stamp is None or stamp < oldest_stamp):
+                    oldest_cache = cache
+                    oldest_stamp = stamp
+            if oldest_cache is None:
+                break
+            total -= oldest_cache._evict_oldest()
+
+
+def _entry_size(value):
+    """
+    Get the number of bytes of memory an entry uses.
+
+    Parameters
+    ----------
+    value : object
+
+    Returns
+    -------
+    int
+    """
+    if isinstance(value, np.memmap):
+        # Pages of memory mapped files belong to the file and not the process.
+        return 0
+    elif isinstance(value, np.ndarray) and not value.flags.writeable:
+        # Read-only arrays, such as shared timebases, are held elsewhere so dropping them frees nothing.
+        return 0
+    elif isinstance(value, np.ndarray):
+        return value.nbytes
+    else:
+        return sys.getsizeof(value)
+
+
+def _is_evictable(value):
+    return (
+        isinstance(value, np.ndarray)
+        and not isinstance(value, np.memmap)
+        and value.flags.writeable
+        and value.dtype != object
+        and value.nbytes != 0
+    )
+
+
+class CallCache(MutableMapping):
+    def __init__(self, memory_budget=None, spill=True, spill_directory=None):
+        """
+        Dictionary of saved calls that keeps its memory use under a budget.
+
+        Parameters
+        ----------
+        memory_budget : int or None, default=None
+            Largest number of bytes this cache holds in memory. If None, there is no limit other than the process budget.
+        spill : bool, default=True
+            Whether entries that are evicted from memory are written to a memory mapped file and restored when they are next used. If False, evicted entries are dropped.
+        spill_directory : str or None, default=None
+            Directory to write spilled entries to. If None, use a new temporary directory that is deleted with this cache.
+
+        Attributes
+        ----------
+        nbytes : int
+            Number of bytes held in memory.
+        dropped : set of str
+            Names of entries that were evicted without spilling and are no longer held.
+
+        Notes
+        -----
+        Only writeable numpy arrays are evicted. Other values are small or are
+        held elsewhere, such as shared timebases, and always stay in memory.
+        """
+        self.memory_budget = memory_budget
+        self.spill = spill
+        self._spill_directory = spill_directory
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._stamps = {}
+        self._spilled = {}
+        self.dropped = set()
+        self.nbytes = 0
+        self._holds = 0
+        self._lock = threading.RLock()
+        with _caches_lock:
+            _caches[id(self)] = self
+
+    def __getstate__(self):
+        # Spilled entries are read back from their files since the files belong to this process.
+        with self._lock:
+            entries = {}
+            for name in self:
+                value = self.peek(name)
+                entries[name] = (
+                    np.array(value) if isinstance(value, np.memmap) else value
+                )
+            return {
+                "memory_budget": self.memory_budget,
+                "spill": self.spill,
+                "entries": entries,
+                "dropped": set(self.dropped),
+            }
+
+    def __setstate__(self, state):
+        self.__init__(state["memory_budget"], state["spill"])
+        self.update(state["entries"])
+        self.dropped = state["dropped"]
+
+    def __repr__(self):
+        return f"CallCache({len(self._entries)} in memory, {len(self._spilled)} spilled, {self.nbytes} bytes)"
+
+    def __contains__(self, name):
+        return name in self._entries or name in self._spilled
+
+    def __len__(self):
+        return len(self._entries) + len(self._spilled)
+
+    def __iter__(self):
+        with self._lock:
+            names = list(self._entries) + list(self._spilled)
+        return iter(names)
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                self._stamps[name] = next(_access_counter)
+                return self._entries[name]
+            if name not in self._spilled:
+                raise KeyError(name)
+            logging.debug(f"Restoring '{name}' from spilled file into memory.")
+            spilled = self._peek_spilled(name)
+            value = np.array(spilled)
+            del spilled
+            self._remove_spill_file(name)
+        self[name] = value
+        return value
+
+    def __setitem__(self, name, value):
+        with self._lock:
+            if name in self:
+                self._remove(name)
+            self.dropped.discard(name)
+            self._entries[name] = value
+            self._sizes[name] = _entry_size(value)
+            self._stamps[name] = next(_access_counter)
+            self.nbytes += self._sizes[name]
+            if self.memory_budget is not None:
+                # Never evict the entry that was just added.
+                while self.nbytes > self.memory_budget and self._evict_oldest(
+                    keep=name
+                ):
+                    pass
+        _enforce_process_budget()
+
+    def __delitem__(self, name):
+        with self._lock:
+            if name not in self:
+                raise KeyError(name)
+            self._remove(name)
+
+    def peek(self, name):
+        """
+        Get an entry without restoring it into memory or changing how recently it was used.
+
+        Parameters
+        ----------
+        name : str
+
+        Returns
+        -------
+        object
+            The entry, or a read-only memory mapped array if the entry was spilled.
+        """
+        with self._lock:
+            if name in self._entries:
+                return self._entries[name]
+            if name in self._spilled:
+                return self._peek_spilled(name)
+            raise KeyError(name)
+
+    def _peek_spilled(self, name):
+        return np.load(self._spilled[name], mmap_mode="r")
+
+    def _remove(self, name):
+        if name in self._entries:
+            del self._entries[name]
+            del self._stamps[name]
+            self.nbytes -= self._sizes.pop(name)
+        else:
+            self._remove_spill_file(name)
+
+    def _remove_spill_file(self, name):
+        path = self._spilled.pop(name)
+        try:
+            os.remove(path)
+        except OSError as e:
+            logging.debug(f"Could not remove spill file '{path}'. Exception was:\n{e}")
+
+    @contextlib.contextmanager
+    def hold_in_memory(self):
+        """
+        Keep every entry in memory, over the budgets if need be, until the context exits.
+
+        Used while saving so that entries called again to replace dropped
+        ones don't drop others. The budgets are enforced again on exit.
+        """
+        with self._lock:
+            self._holds += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._holds -= 1
+                if self.memory_budget is not None:
+                    while self.nbytes > self.memory_budget and self._evict_oldest():
+                        pass
+            _enforce_process_budget()
+
+    def _oldest_evictable_stamp(self):
+        with self._lock:
+            if self._holds:
+                return None
+            for name, value in self._entries.items():
+                if _is_evictable(value):
+                    return self._stamps[name]
+        return None
+
+    def _evict_oldest(self, keep=None):
+        """
+        Evict the least recently used array out of memory.
+
+        Parameters
+        ----------
+        keep : str or None, default=None
+            Name of an entry that shouldn't be evicted.
+
+        Returns
+        -------
+        int
+            Number of bytes freed.
+        """
+        with self._lock:
+            if self._holds:
+                return 0
+            for name, value in self._entries.items():
+                if name != keep and _is_evictable(value):
+                    break
+            else:
+                return 0
+
+            freed = self._sizes[name]
+            if self.spill:
+                path = os.path.join(
+                    self._get_spill_directory(), f"spill_{next(_access_counter)}.npy"
+                )
+                logging.debug(f"Spilling '{name}' ({freed} bytes) to '{path}'.")
+                spilled = np.lib.format.open_memmap(
+                    path, mode="w+", dtype=value.dtype, shape=value.shape
+                )
+                spilled[...] = value
+                spilled.flush()
+                del spilled
+                self._spilled[name] = path
+            else:
+                logging.debug(f"Dropping '{name}' ({freed} bytes) from memory.")
+                self.dropped.add(name)
+            del self._entries[name]
+            del self._stamps[name]
+            del self._sizes[name]
+            self.nbytes -= freed
+            return freed
+
+    def _get_spill_directory(self):
+        if self._spill_directory is None:
+            self._spill_directory = tempfile.mkdtemp(prefix="wipplpy_spill_")
+            weakref.finalize(
+                self, shutil.rmtree, self._spill_directory, ignore_errors=True
+            )
+        return self._spill_directory
@@ -0,0 +1,444 @@
+"""Write scalars and reduced traces of many shots into a Parquet dataset that can be queried across a campaign."""
+
+import hashlib
+import json
+import logging
+import os
+import uuid
+
+import numpy as np
+
+from wipplpy.modules.export import _CallsData, machine_location, run_exports
+from wipplpy.modules.generic_get_data import Get
+
+# Name of the file in a dataset directory that records which columns the dataset holds. Parquet readers skip files starting with an underscore.
+SPEC_NAME = "_columnar_spec.json"
+# Column holding the shot number of each row.
+SHOT_COLUMN = "shot"
+# Column the dataset is partitioned by. Each partition holds the shots in a block of `partition_size` shots.
+PARTITION_COLUMN = "shot_block"
+DEFAULT_PARTITION_SIZE = 1000
+
+
+def import_pyarrow():
+    """
+    Import the parts of `pyarrow` used for datasets.
+
+    Returns
+    -------
+    pa, pq, ds : module
+        `pyarrow`, `pyarrow.parquet`, and `pyarrow.dataset`.
+
+    Raises
+    ------
+    ImportError
+        If `pyarrow` is not installed.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "Columnar datasets need the 'pyarrow' package. Install it with `pip install pyarrow` or `pip install wipplpy[columnar]`."
+        ) from e
+    return pa, pq, ds
+
+
+def reduce_trace(signal, length):
+    """
+    Reduce a signal to a fixed number of points by averaging blocks of neighboring samples.
+
+    Parameters
+    ----------
+    signal : np.array
+    length : int
+        Number of points to reduce the signal to.
+
+    Returns
+    -------
+    np.array
+        Mean of each of `length` blocks of nearly equal size. Signals shorter than `length` are linearly interpolated instead.
+    """
+    signal = np.asarray(signal, dtype=np.float64).ravel()
+    if signal.size == 0:
+        raise ValueError("Can't reduce an empty signal.")
+    if signal.size < length:
+        return np.interp(
+            np.linspace(0, signal.size - 1, length), np.arange(signal.size), signal
+        )
+    edges = np.linspace(0, signal.size, length + 1).astype(np.int64)
+    return np.add.reduceat(signal, edges[:-1]) / np.diff(edges)
+
+
+class Trace:
+    def __init__(self, call_string, length, index_range=None, name=None):
+        """
+        Signal reduced to a fixed number of points to keep in one column of a dataset.
+
+        Parameters
+        ----------
+        call_string : str
+            String to use when calling the signal from the database.
+        length : int
+            Number of points to reduce the signal to. See `reduce_trace`.
+        index_range : None or tuple of two int, default=None
+            Indices of the first and last sample of the signal to reduce. If None, reduce the whole signal.
+        name : str or None, default=None
+            Name of the column. If None, use the name of the get call.
+        """
+        self.get_call = Get(call_string)
+        self.length = int(length)
+        self.index_range = None if index_range is None else tuple(index_range)
+        self.name = self.get_call.name if name is None else name
+
+    def __repr__(self):
+        return (
+            f"Trace({self.get_call.call_string!r}, {self.length}, {self.index_range})"
+        )
+
+    def spec(self):
+        """Plain values describing the trace for the dataset spec."""
+        return {
+            "call": self.get_call.call_string,
+            "length": self.length,
+            "index_range": None if self.index_range is None else list(self.index_range),
+            "name": self.name,
+        }
+
+    @classmethod
+    def from_spec(cls, spec):
+        return cls(spec["call"], spec["length"], spec["index_range"], spec["name"])
+
+
+def _to_scalar(value):
+    """Change the result of a call into a float or None if it isn't a single number."""
+    array = np.asarray(value)
+    if array.size != 1 or not np.issubdtype(array.dtype, np.number):
+        return None
+    return float(array.ravel()[0])
+
+
+def shot_row(  # noqa: PLR0913
+    shot_number,
+    scalar_calls=(),
+    trace_specs=(),
+    machine=None,
+    ignore_errors=True,
+    deadlines=None,
+    config_filepath=None,
+    load_filepath_format=None,
+):
+    """
+    Get the row of a dataset for one shot.
+
+    Parameters
+    ----------
+    shot_number : int
+    scalar_calls : list of str, default=()
+        Calls that give one number each.
+    trace_specs : list of dict, default=()
+        Specs of the traces from `Trace.spec`.
+    machine, deadlines, config_filepath
+        See `wipplpy.modules.export.export_shot`.
+    ignore_errors : bool, default=True
+        Whether to leave the values of calls that fail empty and get the other calls instead of failing the shot at the first call that fails.
+    load_filepath_format : str or None, default=None
+        Path of a file saved by `Data.save` to take calls from before calling the server, with `{shot}` in place of the shot number, such as 'archive/{shot}/calls.mat'.
+
+    Returns
+    -------
+    dict
+        Value of each column keyed by its name. Values that couldn't be got are None.
+
+    Notes
+    -----
+    This is run in worker processes so all arguments are plain values that can be pickled.
+    """
+    tree_name, server_name = machine_location(machine, shot_number, config_filepath)
+    data = _CallsData(shot_number, ignore_errors, deadlines)
+    # The tree is only opened if a call isn't in the loaded file.
+    data.tree_name = tree_name
+    data.server_name = server_name
+    if load_filepath_format is not None:
+        data._load_file(load_filepath_format.format(shot=shot_number))
+
+    row = {SHOT_COLUMN: int(shot_number)}
+    for call_string in scalar_calls:
+        get_call = Get(call_string, signal=False)
+        row[get_call.name] = _to_scalar(data.get(get_call))
+    for spec in trace_specs:
+        trace = Trace.from_spec(spec)
+        signal = np.asarray(data.get_range(trace.get_call, trace.index_range))
+        if signal.size == 0:
+            row[trace.name] = None
+        else:
+            row[trace.name] = reduce_trace(signal, trace.length)
+    return row
+
+
+def _schema(pa, scalar_names, traces):
+    fields = [pa.field(SHOT_COLUMN, pa.int64(), nullable=False)]
+    fields += [pa.field(name, pa.float64()) for name in scalar_names]
+    fields += [pa.field(t.name, pa.list_(pa.float64(), t.length)) for t in traces]
+    fields.append(pa.field(PARTITION_COLUMN, pa.int64(), nullable=False))
+    return pa.schema(fields)
+
+
+def read_spec(directory):
+    """
+    Read which columns a dataset holds.
+
+    Parameters
+    ----------
+    directory : str
+
+    Returns
+    -------
+    dict or None
+        The spec or None if there is no dataset in the directory.
+    """
+    try:
+        with open(os.path.join(directory, SPEC_NAME)) as spec_file:
+            return json.load(spec_file)
+    except FileNotFoundError:
+        return None
+
+
+def existing_shots(directory):
+    """
+    Get the shots that a dataset already holds by reading only its shot column.
+
+    Parameters
+    ----------
+    directory : str
+
+    Returns
+    -------
+    set of int
+    """
+    if read_spec(directory) is None:
+        return set()
+    table = read_dataset(directory, columns=[SHOT_COLUMN])
+    return set(table.column(SHOT_COLUMN).to_pylist())
+
+
+def _write_rows(directory, rows, schema, partition_size):
+    """
+    Write rows into new files of their partitions so that files already written are never changed.
+
+    Parameters
+    ----------
+    directory : str
+    rows : list of dict
+    schema : pyarrow.Schema
+    partition_size : int
+    """
+    pa, pq, _ = import_pyarrow()
+    partitions = {}
+    for row in rows:
+        block = row[SHOT_COLUMN] // partition_size * partition_size
+        partitions.setdefault(block, []).append({**row, PARTITION_COLUMN: block})
+    for block, block_rows in partitions.items():
+        block_rows.sort(key=lambda row: row[SHOT_COLUMN])
+        # The partition column is held by the directory name so it isn't written into the file.
+        file_schema = schema.remove(schema.get_field_index(PARTITION_COLUMN))
+        table = pa.Table.from_pylist(
+            [
+                {k: v for k, v in row.items() if k != PARTITION_COLUMN}
+                for row in block_rows
+            ],
+            schema=file_schema,
+        )
+        partition_directory = os.path.join(directory, f"{PARTITION_COLUMN}={block}")
+        os.makedirs(partition_directory, exist_ok=True)
+        name = f"part-{block_rows[0][SHOT_COLUMN]}-{block_rows[-1][SHOT_COLUMN]}-{uuid.uuid4().hex[:8]}.parquet"
+        partial_path = os.path.join(partition_directory, f".{name}.partial")
+        pq.write_table(table, partial_path)
+        os.replace(partial_path, os.path.join(partition_directory, name))
+        logging.debug(f"Wrote {len(block_rows)} shots to '{name}'.")
+
+
+def write_dataset(  # noqa: PLR0913
+    shot_numbers,
+    directory,
+    scalar_calls=(),
+    traces=(),
+    machine=None,
+    jobs=1,
+    batch_size=100,
+    partition_size=DEFAULT_PARTITION_SIZE,
+    ignore_errors=True,
+    deadlines=None,
+    config_filepath=None,
+    load_filepath_format=None,
+    write_incomplete=False,
+):
+    """
+    Add the scalars and reduced traces of shots to a Parquet dataset partitioned by blocks of shots.
+
+    Parameters
+    ----------
+    shot_numbers : list of int
+    directory : str
+        Directory of the dataset.
+    scalar_calls : list of str, default=()
+        Calls that give one number each. Each is a float column named after the call.
+    traces : list of Trace, default=()
+        Signals to reduce. Each is a column of fixed length lists.
+    machine, deadlines, config_filepath
+        See `wipplpy.modules.export.export_shot`.
+    jobs : int, default=1
+        Number of processes that get shots at the same time. If 1, get them in this process.
+    batch_size : int, default=100
+        Number of finished shots to collect before writing them to new files.
+    partition_size : int, default=DEFAULT_PARTITION_SIZE
+        Number of shots in each partition. Only used when the dataset is made.
+    ignore_errors, load_filepath_format
+        See `shot_row`.
+    write_incomplete : bool, default=False
+        Whether to write rows of shots with calls that failed, leaving their values empty. Shots in the dataset are never got again, so only use this when the calls are known to be missing for good.
+
+    Returns
+    -------
+    dict
+        Shots that were written under 'written' and the errors of shots that failed under 'failures'. Shots with calls that failed are in 'failures' and aren't written unless `write_incomplete`, so they are got again by the next write.
+
+    Notes
+    -----
+    Shots already in the dataset are skipped, so running the same
+    write again after adding shots only gets the new ones. Rows are
+    written in batches to new files so a write that is stopped part way
+    keeps every batch written before it stopped.
+    """
+    pa, _, _ = import_pyarrow()
+    traces = list(traces)
+    scalar_names = [Get(call_string).name for call_string in scalar_calls]
+    column_names = [SHOT_COLUMN, *scalar_names, *(t.name for t in traces)]
+    if len(set(column_names)) != len(column_names):
+        raise ValueError(f"Columns {column_names} don't have unique names.")
+    spec = {
+        "scalars": list(scalar_calls),
+        "traces": [t.spec() for t in traces],
+        "machine": machine,
+    }
+    spec_hash = hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+    existing_spec = read_spec(directory)
+    if existing_spec is None:
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, SPEC_NAME), "w") as spec_file:
+            json.dump(
+                {
+                    "spec": spec,
+                    "spec_hash": spec_hash,
+                    "partition_size": partition_size,
+                },
+                spec_file,
+                indent=1,
+            )
+    elif existing_spec["spec_hash"] != spec_hash:
+        raise ValueError(
+            f"'{directory}' holds a dataset of {existing_spec['spec']} which is not {spec}. Use another directory for different columns."
+        )
+    else:
+        partition_size = existing_spec["partition_size"]
+    schema = _schema(pa, scalar_names, traces)
+
+    done_shots = existing_shots(directory)
+    to_write = [s for s in shot_numbers if int(s) not in done_shots]
+    logging.info(
+        f"Adding {len(to_write)} shots to dataset. {len(shot_numbers) - len(to_write)} shots were already in it."
+    )
+    summary = {"written": [], "failures": {}}
+    batch = []
+
+    def finish(shot_number, get_row):
+        try:
+            row = get_row()
+        except Exception as e:
+            logging.error(f"Failed to get shot {shot_number}. Exception was:\n{e}")
+            summary["failures"][shot_number] = f"{type(e).__name__}: {e}"
+            return
+        missing = [name for name, value in row.items() if value is None]
+        if len(missing) != 0:
+            summary["failures"][shot_number] = f"No values for columns {missing}."
+            if not write_incomplete:
+                logging.error(
+                    f"Not writing shot {shot_number} since calls for columns {missing} failed."
+                )
+                return
+        batch.append(row)
+        if len(batch) >= batch_size:
+            _write_rows(directory, batch, schema, partition_size)
+            summary["written"].extend(row[SHOT_COLUMN] for row in batch)
+            batch.clear()
+
+    run_exports(
+        to_write,
+        finish,
+        jobs,
+        worker=shot_row,
+        scalar_calls=tuple(scalar_calls),
+        trace_specs=tuple(t.spec() for t in traces),
+        machine=machine,
+        ignore_errors=ignore_errors,
+        deadlines=deadlines,
+        config_filepath=config_filepath,
+        load_filepath_format=load_filepath_format,
+    )
+    if len(batch) != 0:
+        _write_rows(directory, batch, schema, partition_size)
+        summary["written"].extend(row[SHOT_COLUMN] for row in batch)
+    return summary
+
+
+def read_dataset(directory, columns=None, row_filter=None, shots=None):
+    """
+    Read a dataset, reading only the columns, partitions, and row groups that are needed.
+
+    Parameters
+    ----------
+    directory : str
+    columns : list of str or None, default=None
+        Columns to read. If None, read all of them.
+    row_filter : pyarrow.dataset.Expression or None, default=None
+        Condition rows must meet, such as `pyarrow.dataset.field("ip") > 1e5`. Files whose statistics show that no row meets it aren't read.
+    shots : tuple of two int or None, default=None
+        First and last shot to read, including both ends. Partitions outside the range aren't read.
+
+    Returns
+    -------
+    pyarrow.Table
+        Use `to_pandas` on it for a data frame.
+    """
+    spec = read_spec(directory)
+    if spec is None:
+        raise FileNotFoundError(f"No dataset in '{directory}'.")
+    pa, _, ds = import_pyarrow()
+    schema = _schema(
+        pa,
+        [Get(call_string).name for call_string in spec["spec"]["scalars"]],
+        [Trace.from_spec(trace_spec) for trace_spec in spec["spec"]["traces"]],
+    )
+    # Give the schema so that a dataset without files yet can still be read.
+    dataset = ds.dataset(
+        directory,
+        schema=schema,
+        format="parquet",
+        partitioning=ds.partitioning(
+            pa.schema([schema.field(PARTITION_COLUMN)]), flavor="hive"
+        ),
+    )
+    if shots is not None:
+        partition_size = spec["partition_size"]
+        shot_filter = (
+            (ds.field(PARTITION_COLUMN) >= shots[0] // partition_size * partition_size)
+            & (
+                ds.field(PARTITION_COLUMN)
+                <= shots[1] // partition_size * partition_size
+            )
+            & (ds.field(SHOT_COLUMN) >= shots[0])
+            & (ds.field(SHOT_COLUMN) <= shots[1])
+        )
+        row_filter = shot_filter if row_filter is None else shot_filter & row_filter
+    return dataset.to_table(columns=columns, filter=row_filter)
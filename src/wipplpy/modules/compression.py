@@ -0,0 +1,245 @@
+"""Compress saved arrays with fast codecs and quantize digitizer signals back to integer codes."""
+
+import json
+import logging
+import struct
+
+import numpy as np
+
+# Codecs that `compress_array` can use and the extension of files written with each.
+CODECS = {"zstd": ".zst", "blosc": ".blosc"}
+# Name of the entry in saved files that records how to change quantized calls back into their original values.
+QUANTIZATION_NAME = "wipplpy_quantization"
+# Start of files written by `compress_array` so that they can be told apart from other files.
+_MAGIC = b"WPYZ"
+# Fewest values that have a gap between them to find the grid spacing from.
+_MIN_QUANTIZE_SIZE = 2
+
+
+def import_codec(codec):
+    """
+    Import the package that a codec needs.
+
+    Raises
+    ------
+    ImportError
+        If the package is not installed.
+    """
+    if codec not in CODECS:
+        raise ValueError(
+            f"Unknown codec '{codec}'. Possible codecs are {sorted(CODECS)}."
+        )
+    package_name = "zstandard" if codec == "zstd" else "blosc"
+    try:
+        if codec == "zstd":
+            import zstandard as package
+        else:
+            import blosc as package
+    except ImportError as e:
+        raise ImportError(
+            f"Codec '{codec}' needs the '{package_name}' package. Install it with `pip install {package_name}` or `pip install wipplpy[compression]`."
+        ) from e
+    return package
+
+
+def compress_array(array, codec, level=None):
+    """
+    Compress an array into bytes that hold its data type and shape.
+
+    Parameters
+    ----------
+    array : np.array
+    codec : {"zstd", "blosc"}
+        Codec to compress with. Blosc uses zstd inside after shuffling the bytes of each value so that bytes of the same significance are next to each other.
+    level : int or None, default=None
+        Compression level. If None, use 3 for zstd and 5 for blosc which are fast and still compress well.
+
+    Returns
+    -------
+    bytes
+    """
+    package = import_codec(codec)
+    array = np.ascontiguousarray(array)
+    if array.dtype.hasobject:
+        raise TypeError("Arrays of objects can't be compressed.")
+    raw = array.tobytes()
+    if codec == "zstd":
+        payload = package.ZstdCompressor(level=3 if level is None else level).compress(
+            raw
+        )
+    else:
+        payload = package.compress(
+            raw,
+            typesize=max(array.dtype.itemsize, 1),
+            clevel=5 if level is None else level,
+            shuffle=package.SHUFFLE,
+            cname="zstd",
+        )
+    header = json.dumps(
+        {"codec": codec, "dtype": array.dtype.str, "shape": list(array.shape)}
+    ).encode()
+    return _MAGIC + struct.pack("<I", len(header)) + header + payload
+
+
+def decompress_array(buffer):
+    """
+    Change bytes written by `compress_array` back into an array.
+
+    Parameters
+    ----------
+    buffer : bytes
+
+    Returns
+    -------
+    np.array
+    """
+    if buffer[: len(_MAGIC)] != _MAGIC:
+        raise ValueError("Bytes were not written by `compress_array`.")
+    start = len(_MAGIC) + 4
+    (header_length,) = struct.unpack("<I", buffer[len(_MAGIC) : start])
+    header = json.loads(buffer[start : start + header_length])
+    payload = buffer[start + header_length :]
+    package = import_codec(header["codec"])
+    if header["codec"] == "zstd":
+        raw = package.ZstdDecompressor().decompress(payload)
+    else:
+        raw = package.decompress(payload)
+    # Copy out of the read-only bytes so that the array can be changed like a loaded array.
+    return (
+        np.frombuffer(raw, dtype=np.dtype(header["dtype"]))
+        .reshape(header["shape"])
+        .copy()
+    )
+
+
+def _code_type(bits):
+    for code_type in (np.uint8, np.uint16, np.uint32):
+        if bits <= 8 * np.dtype(code_type).itemsize:
+            return code_type
+    raise ValueError(f"Can't quantize to {bits} bits. The most is 32.")
+
+
+def quantize(array, bits, lossy=False, sample_size=100_000):
+    """
+    Change a floating point signal into integer codes of a bit depth and the scale and offset that change them back.
+
+    Parameters
+    ----------
+    array : np.array
+        Floating point signal.
+    bits : int
+        Bit depth of the digitizer that recorded the signal.
+    lossy : bool, default=False
+        Whether to round the signal to `2**bits` evenly spaced levels when it isn't already on a grid of at most that many levels. Rounding changes each value by at most half a level.
+    sample_size : int, default=100_000
+        Number of values to look at when finding the spacing of the grid.
+
+    Returns
+    -------
+    tuple or None
+        Codes, scale, and offset so that `codes * scale + offset` gives the signal back. None if the signal can't be quantized, such as when it has values that aren't finite or isn't on a grid and `lossy` is False.
+
+    Notes
+    -----
+    Digitizer data changed into volts is an offset plus a gain times an
+    integer code. The spacing of the grid is found as the smallest gap
+    between different values in a sample of the signal. The signal is only
+    quantized without `lossy` if every value is within a millionth of a
+    level of the grid, so the codes give back the digitized values.
+    """
+    array = np.asarray(array)
+    if array.size < _MIN_QUANTIZE_SIZE or not np.issubdtype(array.dtype, np.floating):
+        return None
+    code_type = _code_type(bits)
+    minimum = array.min()
+    maximum = array.max()
+    if not (np.isfinite(minimum) and np.isfinite(maximum)):
+        return None
+    max_code = 2**bits - 1
+    if maximum == minimum:
+        return np.zeros(array.shape, code_type), 1.0, float(minimum)
+
+    flat = array.ravel()
+    sample = flat[:: max(1, flat.size // sample_size)]
+    gaps = np.diff(np.unique(sample))
+    scale = float(gaps.min())
+    # Round the number of levels since the spacing found from float values is off by a rounding error.
+    if np.rint((maximum - minimum) / scale) <= max_code:
+        codes = np.rint((array - minimum) / scale)
+        error = np.abs(codes * scale + minimum - array).max()
+        if error <= 1e-6 * scale:
+            return codes.astype(code_type), scale, float(minimum)
+    if not lossy:
+        return None
+    scale = float(maximum - minimum) / max_code
+    codes = np.rint((array - minimum) / scale).astype(code_type)
+    logging.debug(
+        f"Rounded signal to {bits} bits with a largest change of {scale / 2:.3g}."
+    )
+    return codes, scale, float(minimum)
+
+
+def dequantize(codes, scale, offset, np_data_type=np.float64):
+    """
+    Change integer codes back into a signal.
+
+    Parameters
+    ----------
+    codes : np.array
+    scale, offset : float
+    np_data_type : data-type, default=np.float64
+
+    Returns
+    -------
+    np.array
+    """
+    signal = np.asarray(codes).astype(np_data_type)
+    signal *= scale
+    signal += offset
+    return signal
+
+
+def write_quantization(records):
+    """
+    Write how quantized calls are changed back to save in a file.
+
+    Parameters
+    ----------
+    records : dict
+        Scale, offset, and original data type string of each quantized call keyed by its save name.
+
+    Returns
+    -------
+    str
+        Each line holds the save name, scale, offset, and data type separated by tabs.
+    """
+    return "\n".join(
+        f"{name}\t{scale!r}\t{offset!r}\t{dtype}"
+        for name, (scale, offset, dtype) in records.items()
+    )
+
+
+def read_quantization(text):
+    """
+    Read how quantized calls are changed back from a file.
+
+    Parameters
+    ----------
+    text : str or None
+        Text written by `write_quantization`.
+
+    Returns
+    -------
+    dict
+        Scale, offset, and data type of each quantized call keyed by its save name.
+    """
+    records = {}
+    if not isinstance(text, str):
+        return records
+    for line in text.splitlines():
+        try:
+            name, scale, offset, dtype = line.split("\t")
+            records[name] = (float(scale), float(offset), np.dtype(dtype))
+        except (ValueError, TypeError):
+            logging.warning(f"Could not read quantization line '{line}'. Skipping.")
+    return records
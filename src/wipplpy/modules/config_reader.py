@@ -7,7 +7,7 @@ import configparser
 import logging
 import os
 
-from WiPPLPy.modules.generic_get_data import lazy_get
+from wipplpy.modules.generic_get_data import lazy_get
 
 
 class MDSplusConfigReader:
@@ -3,11 +3,20 @@ Define generic objects for accessing WiPPL devices' databases.
 """
 
 import logging
-import socket
+import threading
+import time
 from abc import ABC, abstractmethod
+from concurrent.futures import Future, as_completed
 
 import MDSplus as mds
 
+# Seconds a connection route that worked is remembered before both routes are
+# tried again.
+ROUTE_CACHE_TTL = 600
+
+_route_cache = {}
+_route_cache_lock = threading.Lock()
+
 
 class MDSPlusConnection(ABC):
     """
@@ -16,6 +25,9 @@ class MDSPlusConnection(ABC):
 
     def __init__(self):
         self.connection_is_remote = None
+        self.tree = None
+        # Server of the open remote connection, reused for later shots on it.
+        self._connected_server = None
 
     @abstractmethod
     def make_connection(self, shot_number):
@@ -34,49 +46,53 @@ class MDSPlusConnection(ABC):
             String representing the tree name of the device's MDSplus database.
         server_name : `str`
             String representing the server in which the shot's data is located.
+
+        Notes
+        -----
+        The route that worked for a server is remembered for
+        `ROUTE_CACHE_TTL` seconds and is tried alone on later connections.
+        Only the kind of route is shared between objects, so each object has
+        its own tree and never changes the shot of another object's tree.
+        An object keeps its own remote connection and opens later shots on
+        the same server on it instead of connecting again. Local trees hold
+        one shot each and are cheap to open, so they are opened again. If
+        no route is remembered, the local and remote routes are tried at the
+        same time and the first one to connect is used.
         """
-        local_server = socket.gethostname()
-        if local_server == server_name:
+        route = _get_cached_route(server_name)
+        if route is not None:
             try:
-                self._local_connect(shot_number, tree_name)
-            except Exception as e:
-                logging.warning(
-                    "Failed attempted local connection: `%s`\nTrying a"
-                    " remote connection ...",
-                    e,
-                )
-                try:
+                if route.is_remote:
                     self._remote_connect(shot_number, tree_name, server_name)
-                except Exception as e:
-                    self.connection_is_remote = None  # reset the flag
-                    logging.exception(
-                        "Error -- unable to locally or remotely connect to `%s`"
-                        ": `%s`",
-                        server_name,
-                        e,
-                    )
-                    raise
-
-        else:
-            try:
-                self._remote_connect(shot_number, tree_name, server_name)
+                else:
+                    self._local_connect(shot_number, tree_name)
             except Exception as e:
                 logging.warning(
-                    "Failed attempted remote connection: `%s`\nTrying a"
-                    " local connection ...",
+                    "Failed connection using the remembered %s route to `%s`:"
+                    " `%s`\nTrying local and remote connections ...",
+                    "remote" if route.is_remote else "local",
+                    server_name,
                     e,
                 )
-                try:
-                    self._local_connect(shot_number, tree_name)
-                except Exception as e:
-                    self.connection_is_remote = None  # reset the flag
-                    logging.exception(
-                        "Error -- unable to locally or remotely connect to `%s`"
-                        ": `%s`",
-                        server_name,
-                        e,
-                    )
-                    raise
+                forget_route(server_name)
+            else:
+                _remember_route(server_name, self.connection_is_remote)
+                return
+
+        try:
+            self.tree, self.connection_is_remote = _probe_routes(
+                shot_number, tree_name, server_name
+            )
+            self._connected_server = server_name if self.connection_is_remote else None
+        except Exception as e:
+            self.connection_is_remote = None  # reset the flag
+            logging.exception(
+                "Error -- unable to locally or remotely connect to `%s`: `%s`",
+                server_name,
+                e,
+            )
+            raise
+        _remember_route(server_name, self.connection_is_remote)
 
     def _local_connect(self, shot_number, tree_name):
         """
@@ -90,13 +106,8 @@ class MDSPlusConnection(ABC):
             String representing the tree name of the device's MDSplus database.
         """
         self.connection_is_remote = False
-
-        logging.debug(
-            "Attempting a local connection to shot `%s` in the `%s` tree ...",
-            shot_number,
-            tree_name,
-        )
-        self.tree = mds.Tree(tree_name, shot_number)
+        self._connected_server = None
+        self.tree = _open_local_tree(shot_number, tree_name)
 
     def _remote_connect(self, shot_number, tree_name, server_name):
         """
@@ -112,12 +123,223 @@ class MDSPlusConnection(ABC):
             String representing the server in which the shot's data is located.
         """
         self.connection_is_remote = True
+        if (
+            isinstance(self.tree, mds.Connection)
+            and self._connected_server == server_name
+        ):
+            try:
+                self.tree.openTree(tree_name, shot_number)
+                logging.debug(
+                    "Opened shot `%s` on the open connection to `%s`.",
+                    shot_number,
+                    server_name,
+                )
+                return
+            except Exception as e:
+                logging.debug(
+                    "Could not reuse the connection to `%s`: `%s`", server_name, e
+                )
+        self._connected_server = None
+        self.tree = _open_remote_tree(shot_number, tree_name, server_name)
+        self._connected_server = server_name
+
+
+class _Route:
+    """
+    Remember which connection route to a server worked.
+    """
+
+    def __init__(self, is_remote):
+        self.is_remote = is_remote
+        self.last_success = time.monotonic()
+
+
+def _get_cached_route(server_name):
+    """
+    Get the remembered route to a server if it has not expired.
+
+    Parameters
+    ----------
+    server_name : `str`
+        String representing the server in which the shot's data is located.
+
+    Returns
+    -------
+    route : `_Route` or `None`
+    """
+    with _route_cache_lock:
+        route = _route_cache.get(server_name)
+        if route is None:
+            return None
+        if time.monotonic() - route.last_success > ROUTE_CACHE_TTL:
+            logging.debug("Remembered route to `%s` has expired.", server_name)
+            del _route_cache[server_name]
+            return None
+        return route
+
+
+def _remember_route(server_name, is_remote):
+    with _route_cache_lock:
+        _route_cache[server_name] = _Route(is_remote)
+
+
+def route_is_local(server_name):
+    """
+    Check whether the remembered route to a server opens its trees locally.
+
+    Parameters
+    ----------
+    server_name : `str`
+        String representing the server in which the shot's data is located.
+
+    Returns
+    -------
+    is_local : `bool` or `None`
+        Whether the remembered route is local, or `None` if no route is
+        remembered.
+    """
+    route = _get_cached_route(server_name)
+    if route is None:
+        return None
+    return not route.is_remote
+
+
+def forget_route(server_name=None):
+    """
+    Forget the remembered connection route to a server.
+
+    Parameters
+    ----------
+    server_name : `str`, default=None
+        Server to forget the route to. If `None`, forget every route.
+    """
+    with _route_cache_lock:
+        if server_name is None:
+            _route_cache.clear()
+        else:
+            _route_cache.pop(server_name, None)
+
+
+def _open_local_tree(shot_number, tree_name):
+    logging.debug(
+        "Attempting a local connection to shot `%s` in the `%s` tree ...",
+        shot_number,
+        tree_name,
+    )
+    return mds.Tree(tree_name, shot_number)
+
+
+def _open_remote_tree(shot_number, tree_name, server_name):
+    logging.debug(
+        "Attempting a remote connection to `%s` ...\nIf it is taking"
+        " too long to connect, double-check that you are using your"
+        " WiscVPN static IP address.",
+        server_name,
+    )
+    connection = mds.Connection(server_name)
+    connection.openTree(tree_name, shot_number)
+    return connection
 
+
+def _close_tree(future):
+    """
+    Close the tree opened by a route that lost the race in `_probe_routes`.
+
+    Parameters
+    ----------
+    future : `concurrent.futures.Future`
+        Future of the route's tree.
+    """
+    if future.cancelled() or future.exception() is not None:
+        return
+    tree = future.result()
+    try:
+        if isinstance(tree, mds.Connection):
+            tree.closeAllTrees()
+        else:
+            tree.close()
+    except Exception as e:
+        logging.debug("Could not close the unused tree: `%s`", e)
+
+
+def _run_in_daemon_thread(function, *args):
+    """
+    Run a function in a daemon thread.
+
+    Returns
+    -------
+    future : `concurrent.futures.Future`
+        Future of the result of the function.
+
+    Notes
+    -----
+    A route that hangs keeps its thread forever, so probes don't run in a
+    `ThreadPoolExecutor`, whose threads are joined when the interpreter
+    exits.
+    """
+    future = Future()
+    future.set_running_or_notify_cancel()
+
+    def run():
+        try:
+            future.set_result(function(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="wipplpy: route probe", daemon=True).start()
+    return future
+
+
+def _probe_routes(shot_number, tree_name, server_name):
+    """
+    Try the local and remote routes at the same time and keep the first one
+    that connects.
+
+    Parameters
+    ----------
+    shot_number : `int`
+        The shot number from which to extract MDSplus data.
+    tree_name : `str`
+        String representing the tree name of the device's MDSplus database.
+    server_name : `str`
+        String representing the server in which the shot's data is located.
+
+    Returns
+    -------
+    tree : `mds.Tree` or `mds.Connection`
+        The opened tree.
+    is_remote : `bool`
+        Whether the tree was opened through a remote connection.
+    """
+    # Don't wait for the slower route to finish once one has connected.
+    futures = {
+        _run_in_daemon_thread(_open_local_tree, shot_number, tree_name): False,
+        _run_in_daemon_thread(
+            _open_remote_tree, shot_number, tree_name, server_name
+        ): True,
+    }
+
+    errors = []
+    for future in as_completed(futures):
+        is_remote = futures[future]
+        try:
+            tree = future.result()
+        except Exception as e:
+            logging.warning(
+                "Failed attempted %s connection: `%s`",
+                "remote" if is_remote else "local",
+                e,
+            )
+            errors.append(e)
+            continue
         logging.debug(
-            "Attempting a remote connection to `%s` ...\nIf it is taking"
-            " too long to connect, double-check that you are using your"
-            " WiscVPN static IP address.",
+            "Connected to `%s` using a %s connection.",
             server_name,
+            "remote" if is_remote else "local",
         )
-        self.tree = mds.Connection(server_name)
-        self.tree.openTree(tree_name, shot_number)
+        for other in futures:
+            if other is not future:
+                other.add_done_callback(_close_tree)
+        return tree, is_remote
+
+    raise errors[-1]
@@ -0,0 +1,186 @@
+"""Limit how long calls to an MDSplus server can block and how they are retried."""
+
+import logging
+import random
+import threading
+
+# Seconds each kind of call may take before giving up on it. A value of None means wait forever.
+DEFAULT_DEADLINES = {
+    # Making a connection to the server.
+    "connect": 30.0,
+    # Opening a tree for a shot on a connection.
+    "open_tree": 60.0,
+    # A single get call on an open tree.
+    "call": 300.0,
+    # A keepalive probe of an idle connection. See `wipplpy.modules.shot_loader.start_keepalive`.
+    "probe": 5.0,
+    # Total time a single Data object may spend waiting on the server.
+    "budget": None,
+    # Number of attempts for calls that fail with a retryable error.
+    "max_tries": 3,
+    # Base and largest delay in seconds between attempts. The delay doubles every attempt and is jittered.
+    "backoff_base": 0.5,
+    "backoff_cap": 10.0,
+}
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call to the server takes longer than its deadline."""
+
+
+def get_deadlines(overrides=None):
+    """
+    Get the deadlines to use by updating the defaults with any overrides.
+
+    Parameters
+    ----------
+    overrides : dict or None, default=None
+        Deadlines to change from `DEFAULT_DEADLINES`.
+
+    Returns
+    -------
+    dict
+    """
+    deadlines = dict(DEFAULT_DEADLINES)
+    if overrides is not None:
+        unknown_keys = set(overrides) - set(DEFAULT_DEADLINES)
+        if len(unknown_keys) != 0:
+            raise ValueError(
+                f"Unknown deadline names {sorted(unknown_keys)}. Possible names are {sorted(DEFAULT_DEADLINES)}."
+            )
+        deadlines.update(overrides)
+    return deadlines
+
+
+def call_with_deadline(function, timeout, description, *args, **kwargs):
+    """
+    Call a function and stop waiting for it after a timeout.
+
+    Parameters
+    ----------
+    function : function
+        Function to call.
+    timeout : float or None
+        Seconds to wait for the function to return. If None, wait forever.
+    description : str
+        Description of the call used in error messages.
+    *args, **kwargs
+        Arguments to call the function with.
+
+    Returns
+    -------
+    Result of the function.
+
+    Raises
+    ------
+    DeadlineExceeded
+        If the function did not return in time.
+
+    Notes
+    -----
+    MDSplus calls can't be interrupted so a call that times out keeps running
+    in a daemon thread and its result is thrown away. The connection it used
+    should not be used again.
+    """
+    if timeout is None:
+        return function(*args, **kwargs)
+
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = function(*args, **kwargs)
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run, name=f"wipplpy: {description}", daemon=True)
+    thread.start()
+    thread.join(max(timeout, 0))
+    if thread.is_alive():
+        raise DeadlineExceeded(f"Timed out after {timeout:.3g} s while {description}.")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def backoff_delay(attempt, base, cap):
+    """
+    Get the delay before retrying a call using exponential backoff with full jitter.
+
+    Parameters
+    ----------
+    attempt : int
+        Number of attempts that have already failed minus one.
+    base : float
+        Largest delay after the first failure.
+    cap : float
+        Largest delay after any failure.
+
+    Returns
+    -------
+    float
+        Delay in seconds.
+    """
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class Budget:
+    def __init__(self, seconds=None):
+        """
+        Keep track of the total time spent waiting on a server.
+
+        Parameters
+        ----------
+        seconds : float or None, default=None
+            Total seconds that can be spent. If None, there is no limit.
+        """
+        self.seconds = seconds
+        self.spent = 0.0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"seconds": self.seconds, "spent": self.spent}
+
+    def __setstate__(self, state):
+        self.__init__(state["seconds"])
+        self.spent = state["spent"]
+
+    def remaining(self):
+        """Seconds left in the budget or None if there is no limit."""
+        if self.seconds is None:
+            return None
+        return self.seconds - self.spent
+
+    def spend(self, seconds):
+        with self._lock:
+            self.spent += seconds
+
+    def timeout_for(self, timeout):
+        """
+        Get the timeout for a call so that it doesn't go over the budget.
+
+        Parameters
+        ----------
+        timeout : float or None
+            Timeout of the call on its own.
+
+        Returns
+        -------
+        float or None
+
+        Raises
+        ------
+        DeadlineExceeded
+            If the budget is already used up.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if remaining <= 0:
+            logging.debug(f"Budget of {self.seconds} s has been used up.")
+            raise DeadlineExceeded(
+                f"Used all of the {self.seconds:.3g} s budget for waiting on the server."
+            )
+        if timeout is None:
+            return remaining
+        return min(timeout, remaining)
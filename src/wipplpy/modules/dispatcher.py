@@ -0,0 +1,267 @@
+"""Fetch shots from many servers at once with a separate group of workers for each server."""
+
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from wipplpy.modules.export import _CallsData, machine_location
+from wipplpy.modules.generic_get_data import Get
+from wipplpy.modules.shot_loader import default_location, get_remote_shot_tree
+
+# Number of worker processes for each server when no limit is given for it.
+DEFAULT_SERVER_LIMIT = 2
+
+
+def fetch_calls(  # noqa: PLR0913
+    shot_number,
+    call_strings,
+    tree_name=None,
+    server_name=None,
+    ignore_errors=False,
+    deadlines=None,
+):
+    """
+    Get the data of calls from one shot.
+
+    Parameters
+    ----------
+    shot_number : int
+    call_strings : list of str
+    tree_name, server_name : str or None, default=None
+        Where the shot is stored. If None, use the shot loading config.
+    ignore_errors : bool, default=False
+        Whether to give an empty array for calls that fail instead of failing the shot.
+    deadlines : dict or None, default=None
+        See `Data`.
+
+    Returns
+    -------
+    dict
+        Data of each call keyed by its call string.
+
+    Notes
+    -----
+    This is run in worker processes so all arguments are plain values that can be pickled.
+    """
+    tree = get_remote_shot_tree(
+        shot_number,
+        tree_name=tree_name,
+        server_name=server_name,
+        deadlines=deadlines,
+    )
+    data = _CallsData(tree, ignore_errors, deadlines)
+    return {call_string: data.get(Get(call_string)) for call_string in call_strings}
+
+
+class FetchDispatcher:
+    def __init__(
+        self,
+        server_limits=None,
+        default_limit=DEFAULT_SERVER_LIMIT,
+        deadlines=None,
+        config_filepath=None,
+        load_config_path=None,
+    ):
+        """
+        Send the fetches of each shot to a group of workers for the server holding it.
+
+        Parameters
+        ----------
+        server_limits : dict or None, default=None
+            Number of worker processes of each server keyed by the server name.
+        default_limit : int, default=DEFAULT_SERVER_LIMIT
+            Number of worker processes of servers not in `server_limits`.
+        deadlines : dict or None, default=None
+            See `Data`. Used for every fetch that doesn't give its own.
+        config_filepath : str or None, default=None
+            See `wipplpy.modules.export.machine_location`.
+        load_config_path : str or None, default=None
+            Path to the shot loading config giving the tree and server of shots fetched without a machine. If None, use the config of `wipplpy.modules.shot_loader.default_location`.
+
+        Notes
+        -----
+        Each server gets its own process pool, so each has its own limit and
+        queue of waiting fetches. A server that is slow or down only fills
+        its own workers while fetches from other servers keep going, so a
+        scan mixing run-day and past MST shots, or BRB and MST shots, reads
+        from every server at once. Workers are processes because each
+        process holds one global connection. Since a pool only talks to one
+        server, its workers keep their connections open between shots.
+        Pools are started the first time a shot on their server is fetched.
+        """
+        if default_limit < 1:
+            raise ValueError("Each server needs at least one worker.")
+        self.server_limits = dict(server_limits or {})
+        self.default_limit = default_limit
+        self.deadlines = deadlines
+        self.config_filepath = config_filepath
+        self.load_config_path = load_config_path
+        self._locations = {}
+        self._pools = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __repr__(self):
+        return f"FetchDispatcher(servers={sorted(self._pools)})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def location(self, shot_number, machine=None):
+        """
+        Get the tree and server holding a shot.
+
+        Parameters
+        ----------
+        shot_number : int
+        machine : str or None, default=None
+            'brb' or 'mst' to find the server with the connection classes of that machine, reading `config_filepath`. If None, use the shot loading config at `load_config_path`.
+
+        Returns
+        -------
+        tree_name, server_name : str
+        """
+        key = (None if machine is None else machine.lower(), shot_number)
+        if key not in self._locations:
+            if machine is None and self.load_config_path is None:
+                self._locations[key] = default_location()
+            elif machine is None:
+                self._locations[key] = default_location(self.load_config_path)
+            else:
+                self._locations[key] = machine_location(
+                    machine, shot_number, self.config_filepath
+                )
+        return self._locations[key]
+
+    def _pool(self, server_name):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Can't fetch with a closed dispatcher.")
+            if server_name not in self._pools:
+                limit = self.server_limits.get(server_name, self.default_limit)
+                logging.debug(
+                    f"Starting {limit} fetch workers for server '{server_name}'."
+                )
+                self._pools[server_name] = ProcessPoolExecutor(max_workers=limit)
+                self._stats[server_name] = {
+                    "limit": limit,
+                    "submitted": 0,
+                    "finished": 0,
+                    "failed": 0,
+                }
+            self._stats[server_name]["submitted"] += 1
+            return self._pools[server_name]
+
+    def _finished(self, server_name, future):
+        with self._lock:
+            stats = self._stats[server_name]
+            stats["finished"] += 1
+            if future.cancelled() or future.exception() is not None:
+                stats["failed"] += 1
+
+    def submit(  # noqa: PLR0913
+        self,
+        shot_number,
+        call_strings=(),
+        machine=None,
+        ignore_errors=False,
+        deadlines=None,
+        worker=None,
+        **worker_arguments,
+    ):
+        """
+        Queue the fetch of a shot with the workers of the server holding it.
+
+        Parameters
+        ----------
+        shot_number : int
+        call_strings : list of str, default=()
+            Calls to get with `fetch_calls`.
+        machine : str or None, default=None
+            See `location`.
+        ignore_errors : bool, default=False
+            See `fetch_calls`.
+        deadlines : dict or None, default=None
+            See `Data`. If None, use the deadlines of the dispatcher.
+        worker : function or None, default=None
+            Function to run in place of `fetch_calls`, called with the shot number and `worker_arguments`, such as `wipplpy.modules.export.export_shot`. It must be importable from its module so that worker processes can run it.
+        **worker_arguments
+            Arguments other than the shot number for `worker`.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Gives what the worker returns, which for `fetch_calls` is the data of each call keyed by its call string.
+        """
+        tree_name, server_name = self.location(shot_number, machine)
+        if worker is None:
+            worker = fetch_calls
+            worker_arguments = {
+                "call_strings": list(call_strings),
+                "tree_name": tree_name,
+                "server_name": server_name,
+                "ignore_errors": ignore_errors,
+                "deadlines": self.deadlines if deadlines is None else deadlines,
+            }
+        future = self._pool(server_name).submit(worker, shot_number, **worker_arguments)
+        future.add_done_callback(lambda f: self._finished(server_name, f))
+        return future
+
+    def fetch(self, shot_numbers, call_strings, machine=None, ignore_errors=False):
+        """
+        Get calls from many shots, giving each shot as soon as it is done.
+
+        Parameters
+        ----------
+        shot_numbers : list of int
+        call_strings : list of str
+        machine : str or None, default=None
+            See `location`.
+        ignore_errors : bool, default=False
+            See `fetch_calls`.
+
+        Yields
+        ------
+        shot_number : int
+        result : function
+            Function without arguments that gives the data of each call keyed by its call string or raises the error of the shot.
+        """
+        futures = {
+            self.submit(shot_number, call_strings, machine, ignore_errors): shot_number
+            for shot_number in shot_numbers
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result
+
+    def stats(self):
+        """
+        Get the number of fetches each server has been given and finished.
+
+        Returns
+        -------
+        dict
+            Worker limit and counts of submitted, finished, and failed fetches keyed by the server name. Fetches that are submitted and not finished are waiting in the queue of the server or running.
+        """
+        with self._lock:
+            return {server: dict(stats) for server, stats in self._stats.items()}
+
+    def close(self, wait=True, cancel_pending=False):
+        """
+        Stop the workers of every server.
+
+        Parameters
+        ----------
+        wait : bool, default=True
+            Whether to wait for running fetches to finish.
+        cancel_pending : bool, default=False
+            Whether to drop fetches that haven't started yet instead of running them.
+        """
+        with self._lock:
+            self._closed = True
+            pools = list(self._pools.values())
+        for pool in pools:
+            pool.shutdown(wait=wait, cancel_futures=cancel_pending)
@@ -0,0 +1,428 @@
+"""Reduce a signal over many shots to its mean, variance, and quantiles in one pass without holding every shot in memory."""
+
+import logging
+
+import numpy as np
+
+from wipplpy.modules.export import _CallsData, machine_location, run_exports
+from wipplpy.modules.generic_get_data import Get
+
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+# Number of markers the P² algorithm keeps for each point.
+_NUM_MARKERS = 5
+# Fewest points a time window can be resampled onto.
+_MIN_WINDOW_POINTS = 2
+
+
+class Welford:
+    def __init__(self):
+        """
+        Running mean and variance of arrays of the same shape that are given one at a time.
+
+        Notes
+        -----
+        Welford's update keeps the sum of squared differences from the
+        running mean instead of the sum of squares, so the variance doesn't
+        lose precision when the mean is large next to the spread.
+        """
+        self.count = 0
+        self.mean = None
+        self._m2 = None
+
+    def __repr__(self):
+        return f"Welford(count={self.count})"
+
+    def update(self, values):
+        """
+        Add an array to the statistics.
+
+        Parameters
+        ----------
+        values : np.array
+            Array with the same shape as every array before it.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if self.count == 0:
+            self.mean = np.zeros_like(values)
+            self._m2 = np.zeros_like(values)
+        elif values.shape != self.mean.shape:
+            raise ValueError(
+                f"Array of shape {values.shape} doesn't match the shape {self.mean.shape} of the arrays before it."
+            )
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (values - self.mean)
+
+    def variance(self, ddof=1):
+        """
+        Get the variance of each point.
+
+        Parameters
+        ----------
+        ddof : int, default=1
+            Delta degrees of freedom. The sum of squared differences is divided by `count - ddof`.
+
+        Returns
+        -------
+        np.array
+        """
+        if self.count <= ddof:
+            raise ValueError(
+                f"Need more than {ddof} arrays for a variance with ddof={ddof}."
+            )
+        return self._m2 / (self.count - ddof)
+
+    def std(self, ddof=1):
+        """Get the standard deviation of each point. See `variance`."""
+        return np.sqrt(self.variance(ddof))
+
+
+class P2Quantile:
+    def __init__(self, probability):
+        """
+        Running estimate of a quantile of each point of arrays that are given one at a time.
+
+        Parameters
+        ----------
+        probability : float
+            Quantile to estimate between 0 and 1, such as 0.5 for the median.
+
+        Notes
+        -----
+        Uses the P² algorithm of Jain and Chlamtac (1985), which keeps five
+        markers for each point whose heights follow the minimum, the
+        quantile, the maximum, and the quantiles halfway between them. Each
+        array moves the markers with a piecewise parabolic fit, so memory
+        doesn't grow with the number of arrays. Estimates are exact for the
+        first five arrays and approximate after.
+        """
+        if not 0 < probability < 1:
+            raise ValueError(f"Probability {probability} is not between 0 and 1.")
+        self.probability = probability
+        self.count = 0
+        self._shape = None
+        self._first = []
+        self._heights = None
+        self._positions = None
+        self._desired = None
+        p = probability
+        self._increments = np.array([0, p / 2, p, (1 + p) / 2, 1])[:, np.newaxis]
+
+    def __repr__(self):
+        return f"P2Quantile({self.probability}, count={self.count})"
+
+    def update(self, values):
+        """
+        Add an array to the estimate.
+
+        Parameters
+        ----------
+        values : np.array
+            Array with the same shape as every array before it.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if self.count == 0:
+            self._shape = values.shape
+        elif values.shape != self._shape:
+            raise ValueError(
+                f"Array of shape {values.shape} doesn't match the shape {self._shape} of the arrays before it."
+            )
+        self.count += 1
+        if self._heights is not None:
+            self._add(values.ravel())
+            return
+        self._first.append(values.ravel().copy())
+        if len(self._first) == _NUM_MARKERS:
+            # Markers start at the sorted first five values.
+            self._heights = np.sort(np.stack(self._first), axis=0)
+            self._first = None
+            num_points = self._heights.shape[1]
+            self._positions = np.tile(
+                np.arange(_NUM_MARKERS, dtype=np.float64)[:, np.newaxis], num_points
+            )
+            self._desired = (_NUM_MARKERS - 1) * self._increments + np.zeros(num_points)
+
+    def _add(self, x):
+        q = self._heights
+        n = self._positions
+        np.minimum(q[0], x, out=q[0])
+        np.maximum(q[4], x, out=q[4])
+        # Cell of each value between markers 0 to 3, after the end markers were moved to hold it.
+        cell = (x >= q[1:4]).sum(axis=0)
+        n += np.arange(_NUM_MARKERS)[:, np.newaxis] > cell
+        self._desired += self._increments
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for i in (1, 2, 3):
+                d = self._desired[i] - n[i]
+                step = np.where(
+                    ((d >= 1) & (n[i + 1] - n[i] > 1))
+                    | ((d <= -1) & (n[i - 1] - n[i] < -1)),
+                    np.sign(d),
+                    0.0,
+                )
+                if not step.any():
+                    continue
+                parabolic = q[i] + step / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                neighbor = np.where(step > 0, i + 1, i - 1)
+                columns = np.arange(q.shape[1])
+                linear = q[i] + step * (q[neighbor, columns] - q[i]) / (
+                    n[neighbor, columns] - n[i]
+                )
+                height = np.where(
+                    (q[i - 1] < parabolic) & (parabolic < q[i + 1]), parabolic, linear
+                )
+                moving = step != 0
+                q[i, moving] = height[moving]
+                n[i] += step
+
+    def value(self):
+        """
+        Get the estimate of the quantile of each point.
+
+        Returns
+        -------
+        np.array
+        """
+        if self.count == 0:
+            raise ValueError("No arrays have been added.")
+        if self._heights is None:
+            first = np.stack(self._first)
+            return np.quantile(first, self.probability, axis=0).reshape(self._shape)
+        return self._heights[2].reshape(self._shape)
+
+
+class Ensemble:
+    def __init__(self, quantiles=DEFAULT_QUANTILES):
+        """
+        Mean, variance, extremes, and quantiles of a signal over many shots that are added one at a time.
+
+        Parameters
+        ----------
+        quantiles : list of float, default=DEFAULT_QUANTILES
+            Probabilities of the quantiles to estimate. See `P2Quantile`.
+
+        Notes
+        -----
+        Memory doesn't depend on the number of shots. Each point of the
+        signal keeps the running mean and variance, the extremes, and five
+        markers for each quantile.
+        """
+        self.moments = Welford()
+        self.quantiles = {p: P2Quantile(p) for p in quantiles}
+        self.minimum = None
+        self.maximum = None
+        self.shots = []
+        self.failures = {}
+        self.times = None
+
+    def __repr__(self):
+        return f"Ensemble(shots={self.count}, quantiles={list(self.quantiles)})"
+
+    @property
+    def count(self):
+        return self.moments.count
+
+    @property
+    def mean(self):
+        return self.moments.mean
+
+    def variance(self, ddof=1):
+        return self.moments.variance(ddof)
+
+    def std(self, ddof=1):
+        return self.moments.std(ddof)
+
+    def quantile(self, probability):
+        """
+        Get the estimate of a quantile of each point.
+
+        Parameters
+        ----------
+        probability : float
+            One of the probabilities the ensemble was made with.
+
+        Returns
+        -------
+        np.array
+        """
+        if probability not in self.quantiles:
+            raise KeyError(
+                f"Quantile {probability} was not tracked. Tracked quantiles are {sorted(self.quantiles)}."
+            )
+        return self.quantiles[probability].value()
+
+    def update(self, values, shot_number=None):
+        """
+        Add the signal of a shot.
+
+        Parameters
+        ----------
+        values : np.array
+            Signal aligned to the same points as every signal before it.
+        shot_number : int or None, default=None
+            Shot the signal is from, kept in `shots`.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if not np.isfinite(values).all():
+            raise ValueError("Signal has values that aren't finite.")
+        self.moments.update(values)
+        for estimate in self.quantiles.values():
+            estimate.update(values)
+        if self.minimum is None:
+            self.minimum = values.copy()
+            self.maximum = values.copy()
+        else:
+            np.minimum(self.minimum, values, out=self.minimum)
+            np.maximum(self.maximum, values, out=self.maximum)
+        if shot_number is not None:
+            self.shots.append(shot_number)
+
+
+def aligned_signal(  # noqa: PLR0913
+    shot_number,
+    call_string,
+    index_range=None,
+    time_window=None,
+    machine=None,
+    deadlines=None,
+    config_filepath=None,
+    load_filepath_format=None,
+):
+    """
+    Get the signal of one shot on the points shared by every shot of an ensemble.
+
+    Parameters
+    ----------
+    shot_number : int
+    call_string : str
+        String to use when calling the signal from the database.
+    index_range : None or tuple of two int, default=None
+        Indices of the first and last sample to get, including both. Only the range is fetched.
+    time_window : None or tuple of (float, float, int), default=None
+        Start time, end time, and number of evenly spaced points to linearly interpolate the signal onto. Only the samples covering the window are fetched after the timebase.
+    machine, deadlines, config_filepath
+        See `wipplpy.modules.export.export_shot`.
+    load_filepath_format : str or None, default=None
+        See `wipplpy.modules.columnar.shot_row`.
+
+    Returns
+    -------
+    np.array
+
+    Notes
+    -----
+    This is run in worker processes so all arguments are plain values that can be pickled.
+    """
+    tree_name, server_name = machine_location(machine, shot_number, config_filepath)
+    data = _CallsData(shot_number, deadlines=deadlines)
+    data.tree_name = tree_name
+    data.server_name = server_name
+    if load_filepath_format is not None:
+        data._load_file(load_filepath_format.format(shot=shot_number))
+
+    get_call = Get(call_string)
+    if time_window is None:
+        return np.asarray(
+            data.get_range(get_call, index_range, save=False), dtype=np.float64
+        ).ravel()
+
+    start, end, num_points = time_window
+    times = np.asarray(data.get(Get(f"dim_of({call_string})")), dtype=np.float64)
+    if times.size == 0 or times[0] > start or times[-1] < end:
+        raise ValueError(
+            f"Shot {shot_number} has times from {times[0] if times.size else None} to {times[-1] if times.size else None} which don't cover the window from {start} to {end}."
+        )
+    first = max(int(np.searchsorted(times, start, side="right")) - 1, 0)
+    last = min(int(np.searchsorted(times, end, side="left")), times.size - 1)
+    signal = np.asarray(
+        data.get_range(get_call, (first, last), save=False), dtype=np.float64
+    ).ravel()
+    return np.interp(
+        np.linspace(start, end, num_points), times[first : last + 1], signal
+    )
+
+
+def ensemble_statistics(  # noqa: PLR0913
+    shot_numbers,
+    call_string,
+    index_range=None,
+    time_window=None,
+    quantiles=DEFAULT_QUANTILES,
+    machine=None,
+    jobs=1,
+    deadlines=None,
+    config_filepath=None,
+    load_filepath_format=None,
+):
+    """
+    Stream the signal of many shots into the statistics of the ensemble.
+
+    Parameters
+    ----------
+    shot_numbers : list of int
+    call_string : str
+        String to use when calling the signal from the database.
+    index_range, time_window
+        How each shot is aligned. See `aligned_signal`. Give at most one. If neither, the whole signal is used and every shot must have the same number of samples.
+    quantiles : list of float, default=DEFAULT_QUANTILES
+        See `Ensemble`.
+    machine, deadlines, config_filepath
+        See `wipplpy.modules.export.export_shot`.
+    jobs : int, default=1
+        Number of processes that get shots at the same time. If 1, get them in this process.
+    load_filepath_format : str or None, default=None
+        See `wipplpy.modules.columnar.shot_row`.
+
+    Returns
+    -------
+    Ensemble
+        Statistics of the shots that were added. Shots that couldn't be got or aligned are in `failures`. When a time window is given, `times` holds the points of the window.
+
+    Notes
+    -----
+    Each shot is added as soon as it arrives and then dropped, so only
+    the shots being fetched by the workers are in memory at once. Quantiles
+    from P² depend slightly on the order shots arrive in, which with more
+    than one job is the order they finish in.
+    """
+    if index_range is not None and time_window is not None:
+        raise ValueError("Give an index range or a time window, not both.")
+    ensemble = Ensemble(quantiles)
+    if time_window is not None:
+        start, end, num_points = time_window
+        if not end > start or num_points < _MIN_WINDOW_POINTS:
+            raise ValueError(
+                f"Time window {time_window} should be a start, a later end, and at least {_MIN_WINDOW_POINTS} points."
+            )
+        ensemble.times = np.linspace(start, end, num_points)
+        time_window = (float(start), float(end), int(num_points))
+
+    def finish(shot_number, get_signal):
+        try:
+            ensemble.update(get_signal(), shot_number)
+        except Exception as e:
+            logging.error(f"Failed to add shot {shot_number}. Exception was:\n{e}")
+            ensemble.failures[shot_number] = f"{type(e).__name__}: {e}"
+
+    run_exports(
+        shot_numbers,
+        finish,
+        jobs,
+        worker=aligned_signal,
+        call_string=call_string,
+        index_range=None if index_range is None else tuple(index_range),
+        time_window=time_window,
+        machine=machine,
+        deadlines=deadlines,
+        config_filepath=config_filepath,
+        load_filepath_format=load_filepath_format,
+    )
+    logging.info(
+        f"Added {ensemble.count} shots to the ensemble. {len(ensemble.failures)} shots failed."
+    )
+    return ensemble
@@ -0,0 +1,551 @@
+"""Export many shots to files in parallel and keep a manifest so that interrupted exports resume."""
+
+import hashlib
+import importlib
+import json
+import logging
+import os
+import shutil
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from wipplpy.modules.generic_get_data import NPY_CACHE_EXTENSION, Data, Get
+from wipplpy.modules.shot_loader import get_remote_shot_tree
+
+MANIFEST_NAME = "manifest.json"
+# File extension of each storage format that shots can be exported to. The 'npy' format writes a directory of `.npy` files for each file that loading memory maps.
+EXPORT_FORMATS = {
+    "mat": ".mat",
+    "mat_compressed": ".mat",
+    "npy": NPY_CACHE_EXTENSION,
+}
+# Arguments of `Data.save` for each storage format. Compressed files keep 16 bit digitizer signals as integer codes, which load back to within 1e-6 of a level of the original values. '.mat' files can only be compressed with zlib; the 'npy' format takes the codecs of `wipplpy.modules.compression.CODECS`.
+EXPORT_SAVE_OPTIONS = {
+    "mat_compressed": {"compress": True, "quantize_bits": 16},
+}
+# Name of the file that holds the data of the calls that aren't from a probe class.
+CALLS_FILE_NAME = "calls"
+
+
+def parse_shots(shot_ranges):
+    """
+    Get the shot numbers from text like '1000-1010,1020'.
+
+    Parameters
+    ----------
+    shot_ranges : str or list of str
+        Comma separated shot numbers and inclusive ranges of shot numbers.
+
+    Returns
+    -------
+    list of int
+        Shot numbers in the order they were given without repeats.
+    """
+    if isinstance(shot_ranges, str):
+        shot_ranges = [shot_ranges]
+    shot_numbers = {}
+    for text in shot_ranges:
+        for part in text.split(","):
+            shot_range = part.strip()
+            if shot_range == "":
+                continue
+            # Split on the last dash so that the range is found even if someone writes '1000 - 1010'.
+            first, dash, last = shot_range.rpartition("-")
+            if dash == "" or first.strip() == "":
+                shot_numbers[int(shot_range)] = None
+                continue
+            first = int(first)
+            last = int(last)
+            if last < first:
+                raise ValueError(
+                    f"Shot range '{shot_range}' ends before it starts. Ranges are written as 'first-last'."
+                )
+            for shot_number in range(first, last + 1):
+                shot_numbers[shot_number] = None
+    return list(shot_numbers)
+
+
+def _machine_connection(machine, config_filepath):
+    """Make the connection class object of a machine."""
+    # Import the machine connection classes here so that exporting without a machine doesn't need the INI file.
+    from wipplpy.modules.config_reader import MDSplusConfigReader
+
+    machine = machine.lower()
+    if machine == "brb":
+        from wipplpy.brb.connection import BRBConnection as MachineConnection
+    elif machine == "mst":
+        from wipplpy.mst.connection import MSTConnection as MachineConnection
+    else:
+        raise ValueError(
+            f"Unknown machine '{machine}'. Possible machines are 'brb' and 'mst'."
+        )
+    return MachineConnection(MDSplusConfigReader(config_filepath))
+
+
+def machine_location(machine, shot_number, config_filepath=None):
+    """
+    Get the tree and server holding a shot of a machine.
+
+    Parameters
+    ----------
+    machine : str or None
+        'brb' or 'mst'. If None, use the tree and server in the shot loading config.
+    shot_number : int
+    config_filepath : str or None, default=None
+        Path to the MDSplus INI file read by the connection classes. If None, use the standard INI file.
+
+    Returns
+    -------
+    tree_name, server_name : str or None
+    """
+    if machine is None:
+        return None, None
+    return _machine_connection(machine, config_filepath).location(shot_number)
+
+
+def latest_location(machine, config_filepath=None):
+    """
+    Get the tree and server holding the most recent shot of a machine.
+
+    Parameters
+    ----------
+    machine : str or None
+        See `machine_location`.
+    config_filepath : str or None, default=None
+        See `machine_location`.
+
+    Returns
+    -------
+    tree_name, server_name : str or None
+
+    Notes
+    -----
+    New MST shots are written to the run-day server, so it is the one asked
+    for the most recent shot and not the server of past shots.
+    """
+    if machine is None:
+        return None, None
+    connection = _machine_connection(machine, config_filepath)
+    if hasattr(connection, "run_day_location"):
+        return connection.run_day_location()
+    return connection.location(0)
+
+
+def import_probe_class(probe_path):
+    """
+    Import a probe class from a path like 'package.module:ClassName'.
+
+    Parameters
+    ----------
+    probe_path : str
+
+    Returns
+    -------
+    type
+        Subclass of `Data` that is made with a tree as its only argument.
+    """
+    module_name, colon, class_name = probe_path.partition(":")
+    if colon == "" or module_name == "" or class_name == "":
+        raise ValueError(
+            f"Probe class '{probe_path}' should be written as 'package.module:ClassName'."
+        )
+    probe_class = getattr(importlib.import_module(module_name), class_name)
+    if not (isinstance(probe_class, type) and issubclass(probe_class, Data)):
+        raise TypeError(f"Probe class '{probe_path}' is not a subclass of Data.")
+    return probe_class
+
+
+def file_checksum(filepath):
+    """
+    Get the SHA-256 checksum of a file.
+
+    Parameters
+    ----------
+    filepath : str
+
+    Returns
+    -------
+    str
+        Checksum as hexadecimal text.
+    """
+    checksum = hashlib.sha256()
+    with open(filepath, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+class _CallsData(Data):
+    def __init__(self, tree, ignore_errors=False, deadlines=None):
+        """
+        Data object without variables of its own that holds the calls given to an export.
+
+        Parameters
+        ----------
+        tree : Connection or int
+        ignore_errors : bool, default=False
+        deadlines : dict or None, default=None
+        """
+        super().__init__(tree, [], [], ignore_errors=ignore_errors, deadlines=deadlines)
+
+
+def _write_atomically(data, filepath, export_format):
+    """
+    Write the saved calls of a data object so that the file only exists once it is complete.
+
+    Parameters
+    ----------
+    data : Data
+    filepath : str
+        Final path of the file.
+    export_format : str
+        Key of `EXPORT_FORMATS`.
+    """
+    directory, name = os.path.split(filepath)
+    stem = os.path.splitext(name)[0]
+    partial_filepath = os.path.join(
+        directory, f".{stem}.partial{EXPORT_FORMATS[export_format]}"
+    )
+    try:
+        data.save(partial_filepath, **EXPORT_SAVE_OPTIONS.get(export_format, {}))
+        # A directory can only be renamed over an empty one, so remove what an earlier export left.
+        if os.path.isdir(filepath):
+            shutil.rmtree(filepath)
+        os.replace(partial_filepath, filepath)
+    finally:
+        _remove(partial_filepath)
+
+
+def _remove(path):
+    """Remove a file or directory if it exists."""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _written_files(filepath):
+    """
+    Get the files that were written for a saved file.
+
+    Parameters
+    ----------
+    filepath : str
+        Path of a file or of a directory of `.npy` files.
+
+    Returns
+    -------
+    list of str
+        Paths relative to the directory holding `filepath`.
+    """
+    if not os.path.isdir(filepath):
+        return [os.path.basename(filepath)]
+    parent = os.path.dirname(filepath)
+    return sorted(
+        os.path.relpath(os.path.join(root, name), parent).replace(os.sep, "/")
+        for root, _, names in os.walk(filepath)
+        for name in names
+    )
+
+
+def export_shot(  # noqa: PLR0913
+    shot_number,
+    output_directory,
+    call_strings=(),
+    probe_paths=(),
+    machine=None,
+    export_format="mat",
+    ignore_errors=False,
+    deadlines=None,
+    config_filepath=None,
+):
+    """
+    Export the calls and probe classes of one shot into its own directory.
+
+    Parameters
+    ----------
+    shot_number : int
+    output_directory : str
+        Directory of the export. The shot is written into a directory named after the shot number inside it.
+    call_strings : list of str, default=()
+        Calls to save into the calls file.
+    probe_paths : list of str, default=()
+        Probe classes, written like 'package.module:ClassName', to make and save all data of. Each is saved to a file named after the class.
+    machine : str or None, default=None
+        See `machine_location`.
+    export_format : str, default='mat'
+        Key of `EXPORT_FORMATS`.
+    ignore_errors : bool, default=False
+        Whether to skip calls that fail instead of failing the shot.
+    deadlines : dict or None, default=None
+        See `Data`.
+    config_filepath : str or None, default=None
+        See `machine_location`.
+
+    Returns
+    -------
+    dict
+        Checksum and size of each file written keyed by its path relative to the output directory.
+
+    Notes
+    -----
+    This is run in worker processes so all arguments are plain values that can be pickled.
+    """
+    tree_name, server_name = machine_location(machine, shot_number, config_filepath)
+    tree = get_remote_shot_tree(
+        shot_number,
+        tree_name=tree_name,
+        server_name=server_name,
+        deadlines=deadlines,
+    )
+    shot_directory = os.path.join(output_directory, str(shot_number))
+    os.makedirs(shot_directory, exist_ok=True)
+    extension = EXPORT_FORMATS[export_format]
+
+    to_write = []
+    if len(call_strings) != 0:
+        data = _CallsData(tree, ignore_errors, deadlines)
+        for call_string in call_strings:
+            data.get(Get(call_string))
+        to_write.append((CALLS_FILE_NAME + extension, data))
+    for probe_path in probe_paths:
+        probe_class = import_probe_class(probe_path)
+        probe = probe_class(tree)
+        # Unless ignoring errors, let them fail the shot so that it is tried again when the export resumes.
+        probe.load_all(ignore_errors=ignore_errors)
+        to_write.append((probe_class.__name__ + extension, probe))
+
+    files = {}
+    for name, data in to_write:
+        filepath = os.path.join(shot_directory, name)
+        _write_atomically(data, filepath, export_format)
+        for written in _written_files(filepath):
+            written_path = os.path.join(shot_directory, written)
+            files[f"{shot_number}/{written}"] = {
+                "sha256": file_checksum(written_path),
+                "size": os.path.getsize(written_path),
+            }
+    logging.info(f"Exported shot {shot_number} to '{shot_directory}'.")
+    return files
+
+
+def spec_hash(spec):
+    """
+    Get a hash of what an export holds so that different exports aren't mixed in one directory.
+
+    Parameters
+    ----------
+    spec : dict
+        Calls, probe classes, machine, and format of the export.
+
+    Returns
+    -------
+    str
+    """
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+def read_manifest(output_directory):
+    """
+    Read the manifest of an export.
+
+    Parameters
+    ----------
+    output_directory : str
+
+    Returns
+    -------
+    dict or None
+        Manifest or None if the export has no manifest yet.
+    """
+    manifest_path = os.path.join(output_directory, MANIFEST_NAME)
+    try:
+        with open(manifest_path) as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(output_directory, manifest):
+    manifest_path = os.path.join(output_directory, MANIFEST_NAME)
+    partial_path = os.path.join(output_directory, f".{MANIFEST_NAME}.partial")
+    with open(partial_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(partial_path, manifest_path)
+
+
+def is_exported(output_directory, files, verify=False):
+    """
+    Check whether the files of a shot recorded in a manifest are still intact.
+
+    Parameters
+    ----------
+    output_directory : str
+    files : dict
+        Files of the shot from the manifest.
+    verify : bool, default=False
+        Whether to compare checksums instead of only sizes.
+
+    Returns
+    -------
+    bool
+    """
+    for name, record in files.items():
+        filepath = os.path.join(output_directory, name)
+        try:
+            if os.path.getsize(filepath) != record["size"]:
+                return False
+        except OSError:
+            return False
+        if verify and file_checksum(filepath) != record["sha256"]:
+            logging.warning(f"Checksum of '{filepath}' does not match the manifest.")
+            return False
+    return True
+
+
+def run_exports(
+    shot_numbers, finish, jobs=1, throttle=None, worker=None, **export_arguments
+):
+    """
+    Run `export_shot` for many shots in worker processes.
+
+    Parameters
+    ----------
+    shot_numbers : list of int
+        Shots to export in order.
+    finish : function
+        Called in this process with the shot number and a function without arguments that gives the result of the worker or raises its error, as each shot finishes.
+    jobs : int, default=1
+        Number of processes that export shots at the same time. If 1, export in this process.
+    throttle : function or None, default=None
+        Called before each shot is started, such as to wait for a rate limit.
+    worker : function or None, default=None
+        Function to run in place of `export_shot` that takes the same arguments. It must be importable from its module so that worker processes can run it.
+    **export_arguments
+        Arguments other than the shot number for `export_shot`.
+    """
+    if worker is None:
+        worker = export_shot
+    if jobs == 1:
+        for shot_number in shot_numbers:
+            if throttle is not None:
+                throttle()
+            finish(
+                shot_number,
+                lambda s=shot_number: worker(s, **export_arguments),
+            )
+        return
+
+    remaining = list(shot_numbers)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        running = {}
+        while len(remaining) != 0 or len(running) != 0:
+            # Only start shots as workers free up so that a throttle spaces out their starts.
+            while len(remaining) != 0 and len(running) < jobs:
+                if throttle is not None:
+                    throttle()
+                shot_number = remaining.pop(0)
+                future = executor.submit(worker, shot_number, **export_arguments)
+                running[future] = shot_number
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                finish(running.pop(future), future.result)
+
+
+def export_shots(  # noqa: PLR0913
+    shot_numbers,
+    output_directory,
+    call_strings=(),
+    probe_paths=(),
+    machine=None,
+    export_format="mat",
+    jobs=1,
+    verify=False,
+    ignore_errors=False,
+    deadlines=None,
+    config_filepath=None,
+):
+    """
+    Export many shots in parallel, skipping shots that a previous run of the same export already finished.
+
+    Parameters
+    ----------
+    shot_numbers : list of int
+    output_directory : str
+    call_strings, probe_paths, machine, export_format, ignore_errors, deadlines, config_filepath
+        See `export_shot`.
+    jobs : int, default=1
+        Number of processes that export shots at the same time. If 1, export in this process.
+    verify : bool, default=False
+        Whether to check the checksums of already exported files before skipping their shots.
+
+    Returns
+    -------
+    dict
+        The manifest. Exported shots are under 'shots' and the errors of shots that failed are under 'failures'.
+
+    Notes
+    -----
+    The manifest is rewritten after every shot finishes so that an export
+    that is stopped part way, such as by a dropped connection, picks up
+    where it stopped when it is run again. Failed shots are tried again on
+    the next run.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(
+            f"Unknown export format '{export_format}'. Possible formats are {sorted(EXPORT_FORMATS)}."
+        )
+    if len(call_strings) == 0 and len(probe_paths) == 0:
+        raise ValueError("No calls or probe classes were given to export.")
+
+    spec = {
+        "calls": list(call_strings),
+        "probes": list(probe_paths),
+        "machine": machine,
+        "format": export_format,
+    }
+    os.makedirs(output_directory, exist_ok=True)
+    manifest = read_manifest(output_directory)
+    if manifest is None:
+        manifest = {"spec": spec, "spec_hash": spec_hash(spec), "shots": {}}
+    elif manifest["spec_hash"] != spec_hash(spec):
+        raise ValueError(
+            f"'{output_directory}' holds an export of {manifest['spec']} which is not {spec}. Use another output directory to export different data."
+        )
+    manifest["failures"] = {}
+
+    to_export = []
+    for shot_number in shot_numbers:
+        files = manifest["shots"].get(str(shot_number))
+        if files is not None and is_exported(output_directory, files, verify):
+            logging.debug(f"Skipping shot {shot_number} since it is already exported.")
+        else:
+            to_export.append(shot_number)
+    logging.info(
+        f"Exporting {len(to_export)} shots. {len(shot_numbers) - len(to_export)} shots were already exported."
+    )
+
+    def finish(shot_number, get_files):
+        try:
+            manifest["shots"][str(shot_number)] = get_files()
+        except Exception as e:
+            logging.error(f"Failed to export shot {shot_number}. Exception was:\n{e}")
+            manifest["shots"].pop(str(shot_number), None)
+            manifest["failures"][str(shot_number)] = f"{type(e).__name__}: {e}"
+        _write_manifest(output_directory, manifest)
+
+    run_exports(
+        to_export,
+        finish,
+        jobs,
+        output_directory=output_directory,
+        call_strings=tuple(call_strings),
+        probe_paths=tuple(probe_paths),
+        machine=machine,
+        export_format=export_format,
+        ignore_errors=ignore_errors,
+        deadlines=deadlines,
+        config_filepath=config_filepath,
+    )
+
+    _write_manifest(output_directory, manifest)
+    return manifest
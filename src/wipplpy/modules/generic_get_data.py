@@ -1,29 +1,339 @@
+import functools
+import hashlib
 import logging
+import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 from MDSplus.connection import Connection, MdsIpException
 from MDSplus.mdsExceptions import MDSplusException, SsSUCCESS
 from scipy.io import loadmat, savemat
 
-from wipplpy.modules.shot_loader import get_remote_shot_tree
+from wipplpy.modules.call_cache import CallCache
+from wipplpy.modules.compression import (
+    QUANTIZATION_NAME,
+    dequantize,
+    quantize,
+    read_quantization,
+    write_quantization,
+)
+from wipplpy.modules.deadlines import (
+    Budget,
+    DeadlineExceeded,
+    backoff_delay,
+    call_with_deadline,
+    get_deadlines,
+)
+from wipplpy.modules.negative_cache import (
+    DEFAULT_NEGATIVE_TTL,
+    NEGATIVE_CACHE_NAME,
+    known_failures,
+)
+from wipplpy.modules.npy_store import NpyStore
+from wipplpy.modules.prefetch import Prefetch, prefetch_queue
+from wipplpy.modules.query_planner import contained_slice
+from wipplpy.modules.shot_loader import (
+    connection_in_use,
+    get_remote_shot_tree,
+    is_stale,
+)
+from wipplpy.modules.single_flight import in_flight_fetches
+from wipplpy.modules.timebase_registry import (
+    TIMEBASE_LINK_PREFIX,
+    fingerprint_call,
+    fingerprint_from_call_result,
+    get_timebase_registry,
+)
+
+# Name of the entry in saved files that records which part of which signal each saved call holds.
+SIGNAL_INDEX_NAME = "wipplpy_signal_index"
+# What a Data object takes with it when it is pickled. See `Data.set_pickle_mode`.
+PICKLE_MODES = ("full", "keys", "none")
+# Extension of directories that hold saved calls as memory mapped `.npy` files. See `Data.save`.
+NPY_CACHE_EXTENSION = ".npycache"
+
+
+def is_npy_cache(filepath):
+    """
+    Check whether a path is for saved calls kept as `.npy` files instead of a '.mat' file.
+
+    Parameters
+    ----------
+    filepath : str
+
+    Returns
+    -------
+    bool
+        True for directories and paths ending in `NPY_CACHE_EXTENSION`.
+    """
+    return filepath.rstrip("/\\").endswith(NPY_CACHE_EXTENSION) or os.path.isdir(
+        filepath
+    )
+
+
+def _lazy_get_lock(instance, attribute_name):
+    """
+    Get the lock guarding the computation of a lazy get attribute of an instance.
+
+    Parameters
+    ----------
+    instance : object
+    attribute_name : str
+
+    Returns
+    -------
+    threading.RLock
+    """
+    # `dict.setdefault` is atomic so two threads can't create different locks for the same attribute.
+    locks = instance.__dict__.setdefault("_lazy_get_locks", {})
+    return locks.setdefault(attribute_name, threading.RLock())
+
+
+class _LazyGetProperty(property):
+    """Property made by `lazy_get` that knows which attributes it is computed from."""
+
+    name = None
+    depends_on = ()
+
+
+@functools.cache
+def _lazy_get_properties(cls):
+    """
+    Find the lazy get attributes of a class and the attributes computed directly from each attribute.
+
+    Parameters
+    ----------
+    cls : type
+
+    Returns
+    -------
+    properties : dict
+        Property of each lazy get attribute keyed by its name.
+    dependents : dict
+        Set of names of the lazy get attributes that depend directly on each attribute keyed by the attribute name.
+    """
+    properties = {}
+    for klass in reversed(cls.__mro__):
+        for name, value in vars(klass).items():
+            if isinstance(value, _LazyGetProperty):
+                properties[name] = value
+            else:
+                # An attribute of a subclass replaces the lazy get attribute of a parent class.
+                properties.pop(name, None)
+    dependents = {}
+    for name, value in properties.items():
+        for dependency in value.depends_on:
+            dependents.setdefault(dependency, set()).add(name)
+    return properties, dependents
+
+
+def invalidate(instance, *attribute_names):
+    """
+    Forget the values of attributes and of every lazy get attribute computed from them so that they are computed again when next used.
+
+    Parameters
+    ----------
+    instance : object
+    *attribute_names : str
+        Names of the attributes that changed. They don't have to be lazy get attributes themselves.
+
+    Returns
+    -------
+    set of str
+        Names of the lazy get attributes that were forgotten.
+    """
+    properties, dependents = _lazy_get_properties(type(instance))
+    forgotten = set()
+    to_visit = list(attribute_names)
+    while len(to_visit) != 0:
+        name = to_visit.pop()
+        if name in properties and name not in forgotten:
+            # Wait for any computation of the value in progress so that it can't be saved after it is forgotten.
+            with _lazy_get_lock(instance, "_" + name):
+                setattr(instance, "_" + name, None)
+            forgotten.add(name)
+        to_visit.extend(dependents.get(name, set()) - forgotten)
+    if len(forgotten) != 0:
+        logging.debug(
+            f"Forgot {sorted(forgotten)} of `{instance}` after {list(attribute_names)} changed."
+        )
+    return forgotten
+
+
+def _dependency_levels(properties, attribute_names):
+    """
+    Sort lazy get attributes and the lazy get attributes they depend on into levels that only depend on earlier levels.
+
+    Parameters
+    ----------
+    properties : dict
+        Property of each lazy get attribute keyed by its name.
+    attribute_names : iterable of str
+
+    Returns
+    -------
+    list of list of str
+
+    Raises
+    ------
+    ValueError
+        If the attributes depend on each other in a cycle.
+    """
+    levels = {}
+    visiting = set()
+
+    def level_of(name):
+        if name in levels:
+            return levels[name]
+        if name in visiting:
+            raise ValueError(
+                f"Lazy get attribute '{name}' depends on itself through {sorted(visiting)}."
+            )
+        visiting.add(name)
+        dependencies = [d for d in properties[name].depends_on if d in properties]
+        levels[name] = 1 + max((level_of(d) for d in dependencies), default=-1)
+        visiting.discard(name)
+        return levels[name]
+
+    for name in attribute_names:
+        level_of(name)
+    sorted_levels = [[] for _ in range(1 + max(levels.values(), default=-1))]
+    for name, level in levels.items():
+        sorted_levels[level].append(name)
+    return sorted_levels
+
+
+def compute_lazy_gets(
+    instance, attribute_names=None, max_workers=1, ignore_errors=False
+):
+    """
+    Compute lazy get attributes, computing those that don't depend on each other at the same time.
+
+    Parameters
+    ----------
+    instance : object
+    attribute_names : list of str or None, default=None
+        Names of the lazy get attributes to compute. The attributes they depend on are computed too. If None, compute all of them.
+    max_workers : int or None, default=1
+        Largest number of attributes to compute at the same time. If 1, compute them one at a time in this thread. If None, let `ThreadPoolExecutor` choose. Only raise it for attributes that are computed from other attributes, since attributes that get data from MDSplus wait for the one connection of the process.
+    ignore_errors : bool, default=False
+        Whether to log and skip attributes that raise an error instead of raising it. Attributes that depend on one that failed are skipped.
+
+    Returns
+    -------
+    dict
+        Error raised by each attribute that failed keyed by its name.
+
+    Notes
+    -----
+    Attributes are computed a level at a time where each level only depends
+    on the levels before it. Attributes that get data from MDSplus still
+    share the one connection of the process, so mostly attributes computed
+    from other attributes gain from running at the same time.
+    """
+    properties, _ = _lazy_get_properties(type(instance))
+    if attribute_names is None:
+        attribute_names = list(properties)
+    unknown_names = [n for n in attribute_names if n not in properties]
+    if len(unknown_names) != 0:
+        raise ValueError(
+            f"{unknown_names} are not lazy get attributes of `{type(instance).__name__}`."
+        )
+
+    errors = {}
+
+    def compute(name):
+        failed = [d for d in properties[name].depends_on if d in errors]
+        if len(failed) != 0:
+            return name, errors[failed[0]]
+        try:
+            getattr(instance, name)
+        except Exception as e:
+            return name, e
+        return name, None
+
+    executor = None
+    if max_workers != 1:
+        executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="wipplpy: lazy get"
+        )
+    try:
+        for level in _dependency_levels(properties, attribute_names):
+            logging.debug(f"Computing {level} of `{instance}`.")
+            results = (
+                map(compute, level)
+                if executor is None
+                else executor.map(compute, level)
+            )
+            for name, error in results:
+                if error is None:
+                    continue
+                if not ignore_errors:
+                    raise error
+                if not any(d in errors for d in properties[name].depends_on):
+                    logging.warning(
+                        f"An exception occurred while computing '{name}'. Exception was:\n{error}"
+                    )
+                errors[name] = error
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+    return errors
 
 
 # This lazy get property is taken from https://towardsdatascience.com/what-is-lazy-evaluation-in-python-9efb1d3bfed0
-def lazy_get(function):
+def lazy_get(function=None, *, depends_on=()):
     """
     Change a function to be used like an attribute and give it the ability to only load when called.
 
     Parameters
     ----------
     function : function
+    depends_on : str or iterable of str, default=()
+        Names of the attributes the value is computed from. Setting or
+        deleting one of them forgets this value so that it is computed again
+        when next used. Use as `@lazy_get(depends_on=["alpha_deg"])`.
+
+    Examples
+    --------
+    >>> class Angle:
+    ...     @lazy_get
+    ...     def deg(self):
+    ...         return 90.0
+    ...
+    ...     @lazy_get(depends_on="deg")
+    ...     def rad(self):
+    ...         return np.deg2rad(self.deg)
+    >>> angle = Angle()
+    >>> angle.deg = 180.0  # Forgets `rad`.
+    >>> float(angle.rad)
+    3.141592653589793
     """
+    if function is None:
+        return functools.partial(lazy_get, depends_on=depends_on)
+    if isinstance(depends_on, str):
+        depends_on = (depends_on,)
     attribute_name = "_" + function.__name__
 
-    @property
     def _lazy_get(self):
-        if not hasattr(self, attribute_name) or getattr(self, attribute_name) is None:
-            setattr(self, attribute_name, function(self))
+        value = getattr(self, attribute_name, None)
+        if value is None or isinstance(value, Prefetch):
+            # Only let one thread compute the value. Others wait for it and then use it.
+            with _lazy_get_lock(self, attribute_name):
+                value = getattr(self, attribute_name, None)
+                if value is None:
+                    setattr(self, attribute_name, function(self))
+                elif isinstance(value, Prefetch):
+                    # Values being got in the background are resolved the first time they are used.
+                    try:
+                        setattr(self, attribute_name, value.result())
+                    except Exception:
+                        # Get the value again through the function next time.
+                        setattr(self, attribute_name, None)
+                        raise
 
         # Attempt to return a copy of the result so that it is difficult to change the object.
         result = getattr(self, attribute_name)
@@ -32,22 +342,29 @@ def lazy_get(function):
         except (SyntaxError, AttributeError):
             return result
 
-    @_lazy_get.setter
-    def _lazy_get(self, value):
-        setattr(self, attribute_name, value)
+    def _set_lazy_get(self, value):
+        with _lazy_get_lock(self, attribute_name):
+            setattr(self, attribute_name, value)
+        # Values computed from the old value are out of date.
+        _, dependents = _lazy_get_properties(type(self))
+        invalidate(self, *dependents.get(function.__name__, ()))
 
-    @_lazy_get.deleter
-    def _lazy_get(self):
+    def _delete_lazy_get(self):
         logging.debug(
             f"Deleting `{function.__name__}` by setting `{attribute_name}` of `{self}` to `None`."
         )
-        setattr(self, attribute_name, None)
+        invalidate(self, function.__name__)
 
-    return _lazy_get
+    lazy_get_property = _LazyGetProperty(
+        _lazy_get, _set_lazy_get, _delete_lazy_get, function.__doc__
+    )
+    lazy_get_property.name = function.__name__
+    lazy_get_property.depends_on = tuple(depends_on)
+    return lazy_get_property
 
 
 class Get:
-    def __init__(self, call_string, name=None, signal=True):
+    def __init__(self, call_string, name=None, signal=True, timebase=None):
         """
         Class for holding get calls and certain info about the call.
 
@@ -59,6 +376,8 @@ class Get:
             Descriptive name of call to use when saving this call. Must be at most length 31. If None, use the call string.
         signal : bool, default=True
             Whether the get call will pull a signal from the tree.
+        timebase : None, bool, or str, default=None
+            Whether the call returns a timebase that may be shared with other signals. If None, the call is a timebase when it starts with `dim_of`. If a string, the call is a timebase and the string is the digitizer node that sets the clock. Timebases from the same digitizer node are only fetched once per shot.
         """
         self.call_string = call_string
         if name is None:
@@ -66,6 +385,21 @@ class Get:
         else:
             self.name = name
         self.signal = signal
+        if timebase is None:
+            timebase = call_string.strip().lower().startswith("dim_of")
+        self.timebase = timebase
+
+    @property
+    def is_timebase(self):
+        return self.timebase is not False
+
+    @property
+    def digitizer_node(self):
+        """Digitizer node setting the clock of this timebase or None if not known."""
+        if isinstance(self.timebase, str):
+            return self.timebase
+        else:
+            return None
 
     def __str__(self) -> str:
         if self.signal:
@@ -130,16 +464,152 @@ class Get:
 
         return cleaned_string[:31]
 
+    def to_array(self, data, np_data_type):
+        """
+        Change the data MDSplus returned for this call into a numpy array.
+
+        Parameters
+        ----------
+        data : np.array
+            Data of the result of the call.
+        np_data_type : data-type
+            The numpy data type to change the data to.
+
+        Returns
+        -------
+        np.array
+        """
+        return data.astype(np_data_type)
+
+
+class MultiGet(Get):
+    def __init__(self, call_strings, name=None):
+        """
+        Get call for many signals that share a timebase, fetched together as one array.
+
+        Parameters
+        ----------
+        call_strings : list of str
+            Strings to use when calling each signal from the database. The signals must have the same number of samples.
+        name : None or str, default=None
+            Descriptive name of call to use when saving this call. Must be at most length 31. If None, use the call strings.
+
+        Notes
+        -----
+        Every signal is got in one call to the server for the same index
+        range and sample period. The result is copied once into a
+        contiguous array of shape (channels, samples) that is saved as one
+        entry of the saved calls instead of being stacked from separate
+        arrays.
+
+        Examples
+        --------
+        >>> channels = MultiGet([f"\\bdot_{i:02}" for i in range(64)])
+        >>> signals = data.get(channels)  # Array of shape (64, samples).
+        """
+        self.call_strings = list(call_strings)
+        if len(self.call_strings) == 0:
+            raise ValueError("MultiGet needs at least one call string.")
+        super().__init__(
+            f"[ {', '.join(self.call_strings)} ]",
+            name=name,
+            signal=True,
+            timebase=False,
+        )
+
+    def __str__(self) -> str:
+        return (
+            f"MultiGet({len(self.call_strings)} signals, {self.call_strings[0]}, ...)"
+        )
+
+    def full_str(self, index_range=None, sample_period=1):
+        """
+        Get the full call string to send to MDSplus.
+
+        Parameters
+        ----------
+        index_range : tuple[int] or None, default=None
+        sample_period : int, default=1
+
+        Returns
+        -------
+        str
+            Call string building one array out of every signal.
+        """
+        parts = [
+            Get(call_string).full_str(index_range, sample_period)
+            for call_string in self.call_strings
+        ]
+        return f"[ {', '.join(parts)} ]"
+
+    def to_matlab_name(self, call_string):
+        """
+        Convert a call string into a name that can be used in .mat files.
+
+        Parameters
+        ----------
+        call_string : str
+            String used when calling MDSplus.
+
+        Returns
+        -------
+        str
+            Call string after cleaning, ending in a hash of the call string so that calls for different signals starting with the same channels get different names.
+        """
+        digest = hashlib.sha1(call_string.encode()).hexdigest()[:8]
+        return f"{Get.to_matlab_name(call_string)[:22]}_{digest}"
+
+    def to_array(self, data, np_data_type):
+        """
+        Change the data MDSplus returned for this call into an array of shape (channels, samples).
+
+        Parameters
+        ----------
+        data : np.array
+            Data of the result of the call.
+        np_data_type : data-type
+            The numpy data type to change the data to.
+
+        Returns
+        -------
+        np.array
+            C contiguous array with a row for each signal.
+        """
+        data = np.asarray(data)
+        num_channels = len(self.call_strings)
+        if data.size % num_channels != 0:
+            raise ValueError(
+                f"Got {data.size} values for {num_channels} signals from '{self.call_string}'. The signals must have the same number of samples."
+            )
+        shape = (num_channels, data.size // num_channels)
+        if data.dtype == np.dtype(np_data_type) and data.flags.c_contiguous:
+            return data.reshape(shape)
+        array = np.empty(shape, dtype=np_data_type)
+        np.copyto(array, data.reshape(shape), casting="unsafe")
+        return array
+
 
 class Data:
     @staticmethod
-    def _get_tree(tree_or_shot_number):
+    def _get_tree(
+        tree_or_shot_number,
+        deadlines=None,
+        tree_name=None,
+        server_name=None,
+        reconnect=False,
+    ):
         """
         Get the tree for the shot number passed or just return the passed tree.
 
         Parameters
         ----------
         tree_or_shot_number : Connection or int
+        deadlines : dict or None, default=None
+            Deadlines to use when connecting to the server and opening the tree.
+        tree_name, server_name : str or None, default=None
+            Tree and server to open the shot on. By default use the shot loading config.
+        reconnect : bool, default=False
+            Whether to force a reconnection to the server.
         """
         if isinstance(tree_or_shot_number, Connection):
             return tree_or_shot_number
@@ -148,7 +618,13 @@ class Data:
             logging.debug(
                 f"Shot number {tree_or_shot_number} (int {int_shot_number}) passed when creating data object. Getting tree connection."
             )
-            return get_remote_shot_tree(int_shot_number)
+            return get_remote_shot_tree(
+                int_shot_number,
+                tree_name=tree_name,
+                server_name=server_name,
+                reconnect=reconnect,
+                deadlines=deadlines,
+            )
 
     def __init__(  # noqa: PLR0913
         self,
@@ -161,14 +637,20 @@ class Data:
         time_range=None,
         sample_period=1,
         load_filepath=None,
+        deadlines=None,
+        memory_budget=None,
+        spill=True,
+        negative_ttl=DEFAULT_NEGATIVE_TTL,
+        background=False,
+        priorities=None,
     ):
         """
         Generic class for dealing with data from a remote MDSplus database.
 
         Parameters
         ----------
-        tree : Connection or int
-            MDSplus tree to take data from or shot number to use.
+        tree : Connection or LocalTree or int
+            MDSplus tree to take data from or shot number to use. Trees of a shot number are opened locally when this host stores them. See `wipplpy.modules.shot_loader.get_remote_shot_tree`.
         variable_booleans : list of bool
             Which variables to get data for.
         get_calls : list of Get
@@ -182,7 +664,19 @@ class Data:
         sample_period : int, default=1
             Downsampling rate of signal to use when doing call. The default is 1 which means no downsampling.
         load_filepath : None or str, default=None
-            Filepath to try to load data from instead of doing MDSplus calls. If None, don't try to load data from a file.
+            Filepath to try to load data from instead of doing MDSplus calls. If None, don't try to load data from a file. Directories saved by `save` as `.npy` files are memory mapped so only the parts of calls that are used are read.
+        deadlines : None or dict, default=None
+            Seconds to wait when connecting, opening the tree, and doing each call, the total seconds this object may wait on the server, and how failed calls are retried. Keys that are given change the defaults in `wipplpy.modules.deadlines.DEFAULT_DEADLINES`. Calls that time out are treated like other errors when getting data.
+        memory_budget : None or int, default=None
+            Largest number of bytes of saved calls to hold in memory. The least recently used calls are moved out of memory when over the budget. If None, only the process budget set by `wipplpy.modules.call_cache.set_process_memory_budget` applies.
+        spill : bool, default=True
+            Whether calls moved out of memory are written to a temporary memory mapped file and restored on the next `get`. If False, they are dropped and called again when needed.
+        negative_ttl : None or float, default=DEFAULT_NEGATIVE_TTL
+            Seconds that calls which failed with an MDSplus error, such as for a missing node, are remembered for. Remembered failures are raised again, or give an empty array if ignoring errors, without calling the server. If None or 0, always call the server.
+        background : bool, default=False
+            Whether to return right away and get the variables in a background thread. Each variable value is then a `Prefetch` that `@lazy_get` attributes resolve the first time they are used, raising any error from getting it at that point.
+        priorities : None or list of float, default=None
+            Priority of each variable when getting them in the background. Lower numbers are got first. If None, get them in the order of `get_calls`.
 
         Returns
         -------
@@ -193,6 +687,8 @@ class Data:
         ----------
         shot_number : int
             The shot number this Data is from.
+        stats : dict
+            Number of calls made to the server, calls loaded from saved data, retries, timeouts, errors, and remembered failures used instead of calling.
 
 
         Methods
@@ -204,13 +700,30 @@ class Data:
         # If the tree is really a shot number then delay getting the tree until it's needed.
         try:
             self.shot_number = int(tree)
-        except ValueError:
+            self._tree = None
+        except (TypeError, ValueError):
             self.shot_number = tree.shot_number
+            self._tree = tree
+        # Remember where a passed tree came from so that it is opened again on the same server if the connection dies.
+        self.tree_name = getattr(tree, "tree_name", None)
+        self.server_name = getattr(tree, "hostspec", None)
 
         self.ignore_errors = ignore_errors
         self.silence_error_logging = silence_error_logging
 
-        self._tree = None
+        self.deadlines = get_deadlines(deadlines)
+        self._budget = Budget(self.deadlines["budget"])
+        # Variables got in the background count their calls from other threads.
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "calls": 0,
+            "cache_hits": 0,
+            "retries": 0,
+            "timeouts": 0,
+            "errors": 0,
+            "known_failures": 0,
+        }
+        self.negative_ttl = negative_ttl
 
         # Initialize the time index range as empty and then try to get something for it. We do this because some code in _to_time_index_range requires it.
         self.time_index_range = None
@@ -230,37 +743,269 @@ class Data:
 
         # Hold all the calls and call data gotten from MDSplus.
         # TODO: Change how calls are saved so that we can change loaded attributes and save the update.
-        self.saved_calls = {}
+        self.saved_calls = CallCache(memory_budget, spill)
+        # Get call, full call string, data type, whether the data type was changed, index range, and sample period of each saved call so that dropped calls can be called again under the same save name.
+        self._saved_call_args = {}
+        # First index, last index, and sample period of each saved part of each signal so that parts inside them can be sliced locally.
+        self._signal_index = {}
+        # How this object is pickled for sending to other processes.
+        self.pickle_mode = "full"
+        self.shared_store = None
         # Hold the loaded mat file.
         self.load_filepath = load_filepath
+        self.loaded_mat_dict = None
         if load_filepath is not None:
-            logging.debug(
-                f"Loading .mat file at path '{load_filepath}' to be used when loading data."
-            )
-            # Load the matrix and reduce matrix dimension as much as possible.
-            try:
+            self._load_file(load_filepath)
+
+        # Variables being got in the background.
+        self._prefetches = []
+        variable_vals = self._get_individuals(
+            variable_booleans, get_calls, background, priorities
+        )
+
+        return variable_vals  # noqa: PLE0101
+
+    def _load_file(self, load_filepath):
+        """
+        Load a '.mat' file or `.npy` cache directory to take data from instead of calling the tree.
+
+        Parameters
+        ----------
+        load_filepath : str
+        """
+        logging.debug(
+            f"Loading file at path '{load_filepath}' to be used when loading data."
+        )
+        try:
+            if is_npy_cache(load_filepath):
+                self.loaded_mat_dict = self._load_npy_cache(load_filepath)
+            else:
+                # Load the matrix and reduce matrix dimension as much as possible.
                 self.loaded_mat_dict = loadmat(load_filepath, squeeze_me=True)
-                logging.info(
-                    f"Loaded file '{load_filepath}' has the following keys:\n{self.loaded_mat_dict.keys()}"
-                )
-            except FileNotFoundError:
-                logging.warning(
-                    f"Could not load file '{load_filepath}' as it does not yet exist. Will call data from database instead."
-                )
-                self.loaded_mat_dict = None
-        else:
+            logging.info(
+                f"Loaded file '{load_filepath}' has the following keys:\n{self.loaded_mat_dict.keys()}"
+            )
+            self._read_signal_index(self.loaded_mat_dict.pop(SIGNAL_INDEX_NAME, None))
+            quantization = read_quantization(
+                self.loaded_mat_dict.pop(QUANTIZATION_NAME, None)
+            )
+            for name, (scale, offset, np_data_type) in quantization.items():
+                if name in self.loaded_mat_dict:
+                    self.loaded_mat_dict[name] = dequantize(
+                        self.loaded_mat_dict[name], scale, offset, np_data_type
+                    )
+            known_failures.update_from_text(
+                self.shot_number,
+                self.loaded_mat_dict.pop(NEGATIVE_CACHE_NAME, None),
+            )
+            self._share_loaded_timebases()
+            # Hold the loaded data under the same memory budget as the saved calls.
+            loaded_calls = CallCache(
+                self.saved_calls.memory_budget, self.saved_calls.spill
+            )
+            loaded_calls.update(self.loaded_mat_dict)
+            self.loaded_mat_dict = loaded_calls
+        except FileNotFoundError:
+            logging.warning(
+                f"Could not load file '{load_filepath}' as it does not yet exist. Will call data from database instead."
+            )
             self.loaded_mat_dict = None
 
-        variable_vals = self._get_individuals(variable_booleans, get_calls)
+    @staticmethod
+    def _load_npy_cache(directory):
+        """
+        Open the calls saved as `.npy` files in a directory.
 
-        return variable_vals  # noqa: PLE0101
+        Parameters
+        ----------
+        directory : str
+
+        Returns
+        -------
+        dict
+            Saved calls, with uncompressed arrays memory mapped read-only, and the text entries saved with them.
+
+        Raises
+        ------
+        FileNotFoundError
+            If the directory doesn't exist.
+        """
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(directory)
+        store = NpyStore(directory)
+        # Only the headers are read here. Pages of the arrays are read when they are used.
+        loaded = {key: store.get(key, mmap=True) for key in store}
+        loaded.update(store.read_metadata())
+        return loaded
+
+    def set_pickle_mode(self, mode, store=None):
+        """
+        Set what this object takes with it when it is pickled, such as when it is sent to a process pool.
+
+        Parameters
+        ----------
+        mode : {'full', 'keys', 'none'}
+            'full' pickles all saved and loaded data. 'keys' saves arrays into a shared store, if the store doesn't have them yet, and only pickles their keys so that the unpickled object memory maps them from the store. 'none' pickles no data so the unpickled object calls it again or reloads it from the load file.
+        store : NpyStore or str or None, default=None
+            Store, or directory of a store, that processes share. Needed for the 'keys' mode. If None, keep any store set before.
+
+        Notes
+        -----
+        The connection to the tree is never pickled. The unpickled object
+        opens the tree on the same tree and server the first time it needs it.
+        """
+        if mode not in PICKLE_MODES:
+            raise ValueError(
+                f"Unknown pickle mode '{mode}'. Possible modes are {PICKLE_MODES}."
+            )
+        if isinstance(store, str):
+            store = NpyStore(store)
+        if store is not None:
+            self.shared_store = store
+        if mode == "keys" and self.shared_store is None:
+            raise ValueError("A shared store is needed to pickle only keys.")
+        self.pickle_mode = mode
+
+    def __getstate__(self):
+        self.wait_for_prefetch()
+        state = self.__dict__.copy()
+        # Connections and locks can't be sent to other processes.
+        state["_tree"] = None
+        state.pop("_lazy_get_locks", None)
+        state.pop("_stats_lock", None)
+        state["_prefetches"] = []
+        for key, value in state.items():
+            if isinstance(value, Prefetch):
+                # Failed variables are got again by the unpickled object.
+                state[key] = None if value._error is not None else value.result()
+        mode = state.get("pickle_mode", "full")
+        if mode == "keys":
+            state["saved_calls"] = self._to_store(self.saved_calls)
+            if self.loaded_mat_dict is not None:
+                state["loaded_mat_dict"] = self._to_store(self.loaded_mat_dict)
+        elif mode == "none":
+            state["saved_calls"] = (
+                self.saved_calls.memory_budget,
+                self.saved_calls.spill,
+            )
+            state["loaded_mat_dict"] = None
+            state["_saved_call_args"] = {}
+            state["_signal_index"] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._stats_lock = threading.Lock()
+        mode = state.get("pickle_mode", "full")
+        if mode == "keys":
+            self.saved_calls = self._from_store(state["saved_calls"])
+            if state["loaded_mat_dict"] is not None:
+                self.loaded_mat_dict = self._from_store(state["loaded_mat_dict"])
+        elif mode == "none":
+            self.saved_calls = CallCache(*state["saved_calls"])
+            if self.load_filepath is not None:
+                self._load_file(self.load_filepath)
+
+    def _count(self, stat):
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+    def _store_key(self, name, value):
+        # Arrays of the same call differ with the time index range and sample period, so the key holds a hash of the array for a changed array not to be hidden by an old one.
+        digest = hashlib.sha1(f"{value.dtype.str}{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).data)
+        return f"{self.tree_name or ''}:{self.shot_number}:{name}:{digest.hexdigest()[:16]}"
+
+    def _to_store(self, calls):
+        """
+        Save the arrays of calls into the shared store.
+
+        Parameters
+        ----------
+        calls : CallCache
+
+        Returns
+        -------
+        tuple
+            Settings of the cache, the store key of each array, and the other calls by value.
+        """
+        keys = {}
+        values = {}
+        for name in calls:
+            value = calls.peek(name)
+            if isinstance(value, np.ndarray) and value.dtype != object:
+                key = self._store_key(name, value)
+                if key not in self.shared_store:
+                    self.shared_store.put(key, value)
+                keys[name] = key
+            else:
+                values[name] = value
+        return (calls.memory_budget, calls.spill, keys, values)
+
+    def _from_store(self, stored):
+        """
+        Make a cache of calls by memory mapping their arrays from the shared store.
+
+        Parameters
+        ----------
+        stored : tuple
+            Result of `_to_store`.
+
+        Returns
+        -------
+        CallCache
+        """
+        memory_budget, spill, keys, values = stored
+        calls = CallCache(memory_budget, spill)
+        for name, key in keys.items():
+            calls[name] = self.shared_store.get(key)
+        calls.update(values)
+        return calls
+
+    def wait_for_prefetch(self, timeout=None):
+        """
+        Wait for every variable being got in the background to finish. Errors are left to be raised when the variables are used.
+
+        Parameters
+        ----------
+        timeout : float or None, default=None
+            Seconds to wait for each variable. If None, wait forever.
+        """
+        for prefetch in self.__dict__.get("_prefetches", []):
+            try:
+                prefetch.result(timeout)
+            except Exception:
+                # Only raise if waiting timed out and not if getting the variable failed.
+                if not prefetch.done():
+                    raise
 
     def _get_my_tree(self):
         if self._tree is None or self._tree.shot_number != self.shot_number:
-            self._tree = self._get_tree(self.shot_number)
+            self._tree = self._open_tree()
             self.shot_number = self._tree.shot_number
         return self._tree
 
+    def _open_tree(self, reconnect=False):
+        """
+        Open the tree for the shot of this object on the same tree and server it was made with.
+
+        Parameters
+        ----------
+        reconnect : bool, default=False
+            Whether to force a reconnection to the server.
+
+        Returns
+        -------
+        Connection
+        """
+        return self._get_tree(
+            self.shot_number,
+            self.deadlines,
+            tree_name=self.tree_name,
+            server_name=self.server_name,
+            reconnect=reconnect,
+        )
+
     def _set_my_tree(self, new_tree):
         self._tree = new_tree
         self.shot_number = new_tree.shot_number
@@ -327,7 +1072,35 @@ class Data:
 
         return index
 
-    def _get_individuals(self, variable_booleans, get_calls):
+    def _share_loaded_timebases(self):
+        """
+        Replace timebase links in the loaded file with the arrays they point to and share loaded timebases with other objects for this shot.
+        """
+        registry = get_timebase_registry(
+            self.shot_number, self.tree_name, self.server_name
+        )
+        links = {}
+        for key, value in list(self.loaded_mat_dict.items()):
+            if isinstance(value, str) and value.startswith(TIMEBASE_LINK_PREFIX):
+                links[key] = value[len(TIMEBASE_LINK_PREFIX) :]
+            elif "dim_of" in key.lower() and isinstance(value, np.ndarray):
+                self.loaded_mat_dict[key] = registry.register(value)
+
+        for key, target in links.items():
+            try:
+                self.loaded_mat_dict[key] = registry.register(
+                    self.loaded_mat_dict[target]
+                )
+                self.loaded_mat_dict[target] = self.loaded_mat_dict[key]
+            except KeyError:
+                logging.warning(
+                    f"Saved timebase '{key}' links to '{target}' which is not in the loaded file. Ignoring it."
+                )
+                del self.loaded_mat_dict[key]
+
+    def _get_individuals(
+        self, variable_booleans, get_calls, background=False, priorities=None
+    ):
         """
         Get all data that has a True boolean associated with it.
 
@@ -335,15 +1108,26 @@ class Data:
         ----------
         variable_booleans : list of bool
         get_calls : list of Get
+        background : bool, default=False
+            Whether to queue the gets to run in the background instead of running them now.
+        priorities : None or list of float, default=None
+            Priority of each get in the background queue. If None, use the order of the get calls.
 
         Returns
         -------
         list
-            List of all data gotten from MDSplus using get calls.
+            List of all data gotten from MDSplus using get calls, or of `Prefetch` objects for them if getting in the background.
         """
+        if priorities is None:
+            priorities = range(len(get_calls))
         variable_values = []
         for i in range(len(variable_booleans)):
-            if variable_booleans[i]:
+            if variable_booleans[i] and background:
+                prefetch = Prefetch(self.get, get_calls[i])
+                prefetch_queue.put(prefetch, priorities[i])
+                self._prefetches.append(prefetch)
+                variable_values.append(prefetch)
+            elif variable_booleans[i]:
                 value = self.get(get_calls[i])
                 variable_values.append(value)
             else:
@@ -404,7 +1188,7 @@ class Data:
                 variable_vals.append(None)
         return variable_vals
 
-    def get(  # noqa: PLR0912, PLR0915
+    def get(
         self, get_call, np_data_type=np.float64, change_data=True, load_from_saved=True
     ):
         """
@@ -435,82 +1219,480 @@ class Data:
             call_string = get_call
             save_name = Get.to_matlab_name(call_string)
 
+        return self._get(
+            get_call,
+            call_string,
+            save_name,
+            np_data_type,
+            change_data,
+            load_from_saved,
+            index_range=self.time_index_range,
+            sample_period=self.sample_period,
+        )
+
+    def get_range(  # noqa: PLR0913
+        self,
+        get_call,
+        index_range,
+        sample_period=1,
+        np_data_type=np.float64,
+        change_data=True,
+        load_from_saved=True,
+        save=True,
+    ):
+        """
+        Get data in an index range from the mdsplus tree instead of using the time index range of this object.
+
+        Parameters
+        ----------
+        get_call : Get
+            A Get object that defines the call to use on the tree.
+        index_range : None or tuple of two int
+            Indices from the start of the digitizer recording to get data for. The range includes both ends like MDSplus ranges. If None, get all data.
+        sample_period : int, default=1
+            Downsampling rate of the signal to use when doing the call.
+        np_data_type : data-type, default=np.float64
+            The numpy data type to change the data to.
+        change_data : bool, default=True
+            Whether to change the data type of what MDSplus returns.
+        load_from_saved : bool, default=True
+            Whether to try to load the data from the saved calls.
+        save : bool, default=True
+            Whether to keep the data in the saved calls. Use False when streaming pieces of a signal that shouldn't be held in memory.
+
+        Returns
+        -------
+        data : `np_data_type` or MDSplus data-type
+            The data from the tree.
+        """
+        call_string = get_call.full_str(index_range, sample_period)
+        save_name = get_call.to_matlab_name(call_string)
+        return self._get(
+            get_call,
+            call_string,
+            save_name,
+            np_data_type,
+            change_data,
+            load_from_saved,
+            save=save,
+            index_range=index_range,
+            sample_period=sample_period,
+        )
+
+    def _get(  # noqa: PLR0911, PLR0912, PLR0913, PLR0915
+        self,
+        get_call,
+        call_string,
+        save_name,
+        np_data_type,
+        change_data,
+        load_from_saved,
+        save=True,
+        index_range=None,
+        sample_period=1,
+    ):
+        """
+        Get data for a full call string from the saved calls, a loaded file, or the tree.
+
+        Parameters
+        ----------
+        get_call : str or Get
+            The get call the call string was made from.
+        call_string : str
+            Full call string to send to MDSplus.
+        save_name : str
+            Name to save the data under.
+        np_data_type : data-type
+            The numpy data type to change the data to.
+        change_data : bool
+            Whether to change the data type of what MDSplus returns.
+        load_from_saved : bool
+            Whether to try to load the data from the saved calls.
+        save : bool, default=True
+            Whether to keep the data in the saved calls.
+        index_range : None or tuple of two int, default=None
+            Index range the call string was made with.
+        sample_period : int, default=1
+            Sample period the call string was made with.
+
+        Returns
+        -------
+        data : `np_data_type` or MDSplus data-type
+        """
         if load_from_saved and hasattr(self, "saved_calls"):
             if save_name in self.saved_calls:
                 logging.debug(
                     f"Loading '{save_name}' from saved calls instead of making new call."
                 )
+                self._count("cache_hits")
                 return self.saved_calls[save_name]
 
             if self.loaded_mat_dict is not None and save_name in self.loaded_mat_dict:
                 logging.debug(
                     f"Loading '{save_name}' from loaded mat file instead of making new call."
                 )
-                self.saved_calls[save_name] = self.loaded_mat_dict[save_name]
-                return self.loaded_mat_dict[save_name]
+                self._count("cache_hits")
+                if not save:
+                    return self.loaded_mat_dict[save_name]
+                # Move the data so that it is only held once.
+                data = self.loaded_mat_dict.pop(save_name)
+                self.saved_calls[save_name] = data
+                return data
+
+            if isinstance(get_call, Get) and get_call.signal and change_data:
+                data = self._get_from_containing(
+                    get_call, index_range, sample_period, np_data_type
+                )
+                if data is not None:
+                    self._count("cache_hits")
+                    return data
 
-        # Check that the shot number of the tree associated with this object is still connected to the same shot.
-        # This may not occur as the tree is a global tree. TODO: Check if this ever happens.
-        if self.shot_number != self.tree.shot_number:
-            logging.info("Tree has changed shot number. Getting new tree.")
-            self.tree = get_remote_shot_tree(self.shot_number)
+        if self.negative_ttl:
+            failure = known_failures.lookup(self.shot_number, call_string)
+            if failure is not None:
+                logging.debug(
+                    f"Shot #{self.shot_number}: '{call_string}' is known to fail with '{failure.error_class_name}'. Not calling it again."
+                )
+                self._count("known_failures")
+                if not self.ignore_errors:
+                    raise failure.error()
+                return np.array([])
+
+        timebase_key = None
+        if isinstance(get_call, Get) and get_call.is_timebase and change_data:
+            timebase_key = self._timebase_key(get_call, call_string, np_data_type)
+            registry = get_timebase_registry(
+                self.shot_number, self.tree_name, self.server_name
+            )
+            shared = None if timebase_key is None else registry.lookup(timebase_key)
+            if shared is not None:
+                logging.debug(
+                    f"Using timebase already fetched for this shot instead of calling '{call_string}'."
+                )
+                registry.link(call_string, timebase_key)
+                data = shared
+                if save and hasattr(self, "saved_calls"):
+                    self.saved_calls[save_name] = data
+                return data
+
+        # Share the fetch with any other object in this process that is getting the same call for this shot on the same server and tree right now.
+        flight_key = (
+            self.server_name,
+            self.tree_name,
+            self.shot_number,
+            call_string,
+            np.dtype(np_data_type).str if change_data else None,
+        )
+        try:
+            data = in_flight_fetches.do(
+                flight_key,
+                self._fetch_data,
+                call_string,
+                np_data_type,
+                change_data,
+                get_call if isinstance(get_call, Get) else None,
+            )
+        except SsSUCCESS:
+            self._count("errors")
+            raise
+        except (MdsIpException, DeadlineExceeded) as e:
+            self._count("errors")
+            known_failures.record(self.shot_number, call_string, e, self.negative_ttl)
+            if not self.silence_error_logging:
+                logging.exception(
+                    f"Shot #{self.shot_number}: Error getting data from node using get call '{call_string}'. No data available."
+                )
+            if not self.ignore_errors:
+                raise
+            return np.array([])
+        except Exception as e:
+            self._count("errors")
+            known_failures.record(self.shot_number, call_string, e, self.negative_ttl)
+            if not self.ignore_errors:
+                raise
+            if not self.silence_error_logging:
+                logging.exception(
+                    f"Shot #{self.shot_number}: Error getting data from node using get call '{call_string}'. No data available."
+                )
+            return np.array([])
+
+        if timebase_key is not None:
+            data = get_timebase_registry(
+                self.shot_number, self.tree_name, self.server_name
+            ).register(data, timebase_key, call_string)
+
+        # Only save calls if the dictionary exists. The dictionary doesn't exist during some stages of initialization so that we don't save incorrect data.
+        if save and hasattr(self, "saved_calls"):
+            # logging.debug("Adding data from get call with `save_name='{}'` into `saved_calls`.".format(save_name))
+            if save_name in self.saved_calls:
+                logging.warning(
+                    "Save name ({}) is the same as a save name already in the data to save dictionary. Overwriting old data."
+                )
+            self.saved_calls[save_name] = data
+            self._saved_call_args[save_name] = (
+                get_call,
+                call_string,
+                np_data_type,
+                change_data,
+                index_range,
+                sample_period,
+            )
+            if isinstance(get_call, Get) and get_call.signal and change_data:
+                self._index_signal(get_call, index_range, sample_period, save_name)
+
+        return data
 
-        try_loading = True
-        max_tries = 2
+    def _index_signal(self, get_call, index_range, sample_period, save_name):
+        """
+        Record which part of a signal a saved call holds.
+
+        Parameters
+        ----------
+        get_call : Get
+        index_range : None or tuple of two int
+        sample_period : int
+        save_name : str
+        """
+        if index_range is None:
+            entry = (0, None, sample_period)
+        else:
+            entry = (int(index_range[0]), int(index_range[1]), sample_period)
+        self._signal_index.setdefault(get_call.call_string, {})[save_name] = entry
+
+    def _get_from_containing(self, get_call, index_range, sample_period, np_data_type):
+        """
+        Slice a part of a signal out of a saved call that contains it.
+
+        Parameters
+        ----------
+        get_call : Get
+        index_range : None or tuple of two int
+        sample_period : int
+        np_data_type : data-type
+
+        Returns
+        -------
+        np.array or None
+            View of the saved call or None if no saved call contains the part.
+        """
+        if index_range is None:
+            request = (0, None, sample_period)
+        else:
+            request = (int(index_range[0]), int(index_range[1]), sample_period)
+
+        entries = dict(self._signal_index.get(get_call.call_string, {}))
+        # The whole signal may be in a file that was saved without a signal index.
+        entries.setdefault(get_call.to_matlab_name(get_call.full_str()), (0, None, 1))
+        for name, entry in entries.items():
+            local_slice = contained_slice(entry, request)
+            if local_slice is None:
+                continue
+            if name in self.saved_calls:
+                data = self.saved_calls[name]
+            elif self.loaded_mat_dict is not None and name in self.loaded_mat_dict:
+                data = self.loaded_mat_dict.pop(name)
+                self.saved_calls[name] = data
+            else:
+                continue
+            # Signals of a multi get are saved with a row for each signal.
+            num_dimensions = 2 if isinstance(get_call, MultiGet) else 1
+            if (
+                not isinstance(data, np.ndarray)
+                or data.ndim != num_dimensions
+                or data.dtype != np.dtype(np_data_type)
+            ):
+                continue
+            logging.debug(
+                f"Slicing '{get_call.full_str(index_range, sample_period)}' out of saved call '{name}' instead of making new call."
+            )
+            return data[..., local_slice]
+        return None
+
+    def _read_signal_index(self, index_text):
+        """
+        Read the signal index saved in a file.
+
+        Parameters
+        ----------
+        index_text : str or None
+            Saved signal index. Each line holds the save name, call string, first index, last index, and sample period separated by tabs.
+        """
+        if not isinstance(index_text, str):
+            return
+        for line in index_text.splitlines():
+            try:
+                save_name, call_string, start, stop, sample_period = line.split("\t")
+                entry = (
+                    int(start),
+                    None if stop == "" else int(stop),
+                    int(sample_period),
+                )
+            except ValueError:
+                logging.warning(f"Could not read signal index line '{line}'. Skipping.")
+                continue
+            self._signal_index.setdefault(call_string, {})[save_name] = entry
+
+    def _write_signal_index(self):
+        """
+        Write the signal index of the saved calls to save in a file.
+
+        Returns
+        -------
+        str
+        """
+        lines = []
+        for call_string, entries in self._signal_index.items():
+            for save_name, (start, stop, sample_period) in entries.items():
+                if save_name in self.saved_calls:
+                    stop_text = "" if stop is None else stop
+                    lines.append(
+                        f"{save_name}\t{call_string}\t{start}\t{stop_text}\t{sample_period}"
+                    )
+        return "\n".join(lines)
+
+    def _fetch_data(self, call_string, np_data_type, change_data, get_call=None):
+        """
+        Get data from the tree and change it to the correct type.
+
+        Parameters
+        ----------
+        call_string : str
+            Full call string to send to MDSplus.
+        np_data_type : data-type
+            The numpy data type to change the data to.
+        change_data : bool
+            Whether to change the data type of what MDSplus returns.
+        get_call : Get or None, default=None
+            Get call the call string was made from. It changes the data into an array.
+
+        Returns
+        -------
+        data : `np_data_type` or MDSplus data-type
+        """
+        data = self._fetch(call_string).data()
+        logging.debug("Got data from tree.")
+        if change_data:
+            if get_call is None:
+                data = data.astype(np_data_type)
+            else:
+                data = get_call.to_array(data, np_data_type)
+            logging.debug(f"Changed data to type '{np_data_type}'.")
+        return data
+
+    def _fetch(self, call_string):
+        """
+        Get data from the tree using a full call string, reconnecting and retrying if the call times out or MDSplus raises `SsSUCCESS`.
+
+        Parameters
+        ----------
+        call_string : str
+            Full call string to send to MDSplus.
+
+        Returns
+        -------
+        node : MDSplus data-type
+            The result of the call.
+        """
+        max_tries = self.deadlines["max_tries"]
         num_tries = 0
-        while try_loading:
-            try_loading = False
+        while True:
             num_tries += 1
             logging.debug(f"Getting data from database using '{call_string}'.")
             try:
-                node = self.tree.get(call_string)
-            except MdsIpException:
-                if not self.silence_error_logging:
-                    logging.exception(
-                        f"Shot #{self.shot_number}: Error getting data from node using get call '{call_string}'. No data available."
-                    )
-                if not self.ignore_errors:
-                    logging.exception(
-                        f"Shot #{self.shot_number}: Error getting data from node using get call '{call_string}'. No data available."
+                timeout = self._budget.timeout_for(self.deadlines["call"])
+            except DeadlineExceeded:
+                self._count("timeouts")
+                raise
+            self._count("calls")
+            start_time = time.monotonic()
+            try:
+                # Hold the connection from checking the tree until the call is done so that another thread can't open another shot in between.
+                with connection_in_use():
+                    # Check that the shot number of the tree associated with this object is still connected to the same shot.
+                    # The tree is a global tree so another data object may have opened another shot on it.
+                    if self.shot_number != self.tree.shot_number:
+                        logging.info("Tree has changed shot number. Getting new tree.")
+                        self.tree = self._open_tree()
+                    elif is_stale(self.tree):
+                        logging.info(
+                            "Connection was replaced by the keepalive. Getting new tree."
+                        )
+                        self.tree = self._open_tree()
+                    return call_with_deadline(
+                        self.tree.get,
+                        timeout,
+                        f"getting '{call_string}' for shot #{self.shot_number}",
+                        call_string,
                     )
-                    raise
-            except SsSUCCESS:
+            except (SsSUCCESS, DeadlineExceeded) as e:
                 # Sometimes mdsplus raises a 'SsSUCCESS' exception. This may be because the connection object is bad. Thus we need to create a new connection object.
-                if num_tries > max_tries:
+                # A call that timed out may have left the connection stuck so it is also replaced.
+                if isinstance(e, DeadlineExceeded):
+                    self._count("timeouts")
+                if num_tries >= max_tries:
                     logging.exception(
-                        f"Shot #{self.shot_number}: Error getting data from node using get call '{call_string}'. Exceeded number of attempts ({max_tries}). Error was due to 'SsSUCCESS'."
+                        f"Shot #{self.shot_number}: Error getting data from node using get call '{call_string}'. Exceeded number of attempts ({max_tries}). Error was due to '{type(e).__name__}'."
                     )
                     raise
-                else:
-                    logging.info(
-                        "Silencing 'SsSUCCESS' error that MDSplus raised. Reconnecting to server."
-                    )
-                    try_loading = True
-                    self.tree = get_remote_shot_tree(self.shot_number, reconnect=True)
+                delay = backoff_delay(
+                    num_tries - 1,
+                    self.deadlines["backoff_base"],
+                    self.deadlines["backoff_cap"],
+                )
+                remaining = self._budget.remaining()
+                if remaining is not None:
+                    delay = max(min(delay, remaining), 0)
+                logging.info(
+                    f"Silencing '{type(e).__name__}' error that MDSplus raised. Reconnecting to server in {delay:.2f} s."
+                )
+                self._count("retries")
+                time.sleep(delay)
+                self.tree = self._open_tree(reconnect=True)
+            finally:
+                self._budget.spend(time.monotonic() - start_time)
 
-        if self.ignore_errors:
-            try:
-                data = node.data()
-            except Exception:
-                return np.array()
-        else:
-            data = node.data()
+    def _timebase_key(self, get_call, call_string, np_data_type):
+        """
+        Get the key identifying the timebase returned by a get call.
 
-        logging.debug("Got data from tree.")
-        if change_data:
-            data = data.astype(np_data_type)
-            logging.debug(f"Changed data to type '{np_data_type}'.")
+        Parameters
+        ----------
+        get_call : Get
+            Get call for a timebase.
+        call_string : str
+            Full call string of the get call.
+        np_data_type : data-type
+            Data type the timebase is changed to.
 
-        # Only save calls if the dictionary exists. The dictionary doesn't exist during some stages of initialization so that we don't save incorrect data.
-        if hasattr(self, "saved_calls"):
-            # logging.debug("Adding data from get call with `save_name='{}'` into `saved_calls`.".format(save_name))
-            if save_name in self.saved_calls:
-                logging.warning(
-                    "Save name ({}) is the same as a save name already in the data to save dictionary. Overwriting old data."
-                )
-            self.saved_calls[save_name] = data
+        Returns
+        -------
+        tuple or None
+            Key for the timebase registry of this shot or None if the timebase could not be identified.
+        """
+        registry = get_timebase_registry(
+            self.shot_number, self.tree_name, self.server_name
+        )
+        key = registry.key_for_call(call_string)
+        if key is not None:
+            return key
+
+        if get_call.digitizer_node is not None:
+            # Only share timebases from a digitizer node when they cover the same samples.
+            identity = call_string.replace(
+                get_call.call_string, get_call.digitizer_node
+            )
+            return ("digitizer", identity, np.dtype(np_data_type).str)
 
-        return data
+        # Have the server compute a small fingerprint so we only download the full timebase if it's new.
+        try:
+            result = self._fetch(fingerprint_call(call_string)).data()
+            fingerprint = fingerprint_from_call_result(result, np_data_type)
+        except Exception as e:
+            logging.debug(
+                f"Could not get fingerprint of timebase '{call_string}'. Fetching it without sharing. Exception was:\n{e}"
+            )
+            return None
+        return fingerprint
 
     def to_raw_index(self, time_index):
         """
@@ -534,33 +1716,251 @@ class Data:
         else:
             return time_index
 
-    def save(self, filepath):
+    def save(  # noqa: PLR0913
+        self,
+        filepath,
+        compress=False,
+        quantize_bits=None,
+        lossy=False,
+        link_timebases=False,
+    ):
         """
         Save data currently called from MDSplus as a '.mat' file that this object got.
 
         Parameters
         ----------
         filepath : str
-            Path to file where the data should be saved.
+            Path to file where the data should be saved. If it is a directory or ends in `NPY_CACHE_EXTENSION`, each call is saved as its own `.npy` file in that directory so that loading it memory maps the calls instead of reading them.
+        compress : bool or str, default=False
+            Whether to compress the calls in the file with zlib. Loading the file is the same either way. '.mat' files can only be compressed with zlib, so codecs can only be given for `.npy` directories. For those, give a codec of `wipplpy.modules.compression.CODECS` to compress each call with, or True for zstd. Compressed calls are read into memory when loaded instead of being memory mapped.
+        quantize_bits : int or None, default=None
+            Bit depth of the digitizers that recorded the signals. If given, floating point calls that are on a grid of at most `2**quantize_bits` levels are saved as integer codes with the scale and offset that change them back when the file is loaded. If None, save calls as they are.
+        lossy : bool, default=False
+            Whether to also round signals that aren't on such a grid to `2**quantize_bits` levels. Timebases are never quantized so that loading them gives the exact values that are shared with other objects for the shot.
+        link_timebases : bool, default=False
+            Whether to save timebases shared by several calls only once, with the other calls holding a string starting with `TIMEBASE_LINK_PREFIX` that names the saved entry. Only wipplpy follows these links when loading, so leave this off for files read by other programs.
 
         Notes
         -----
         This also saves all data from a previously loaded `.mat` file if one was associated with this object.
+        Calls that are known to fail for the shot are saved so that loading the file remembers them.
+        Digitizer signals of 12 bits take an eighth of the space as 16 bit codes as they do as float64 and compress better still.
+        """
+        # Save variables that are being got in the background once they are done.
+        self.wait_for_prefetch()
+        npy_cache = is_npy_cache(filepath)
+        if not npy_cache:
+            self._check_mat_file(filepath, compress)
+
+        if self.loaded_mat_dict is not None:
+            for key in list(self.loaded_mat_dict):
+                if key not in self.saved_calls:
+                    self.saved_calls[key] = self.loaded_mat_dict.pop(key)
+
+        # Entries called again to replace dropped ones must not drop others before they are written.
+        with self.saved_calls.hold_in_memory():
+            self._restore_dropped_calls()
+
+            logging.debug(
+                f"Saving data with names '{list(self.saved_calls)}' to file '{filepath}'."
+            )
+            if link_timebases:
+                calls = self._link_shared_timebases(self.saved_calls)
+            else:
+                calls = {key: self.saved_calls.peek(key) for key in self.saved_calls}
+            signal_index = self._write_signal_index()
+            if signal_index != "":
+                calls[SIGNAL_INDEX_NAME] = signal_index
+            failures = known_failures.to_text(self.shot_number)
+            if failures != "":
+                calls[NEGATIVE_CACHE_NAME] = failures
+            if quantize_bits is not None:
+                quantization = self._quantize_calls(calls, quantize_bits, lossy)
+                if quantization != "":
+                    calls[QUANTIZATION_NAME] = quantization
+            if npy_cache:
+                self._save_npy_cache(filepath, calls, compress)
+            else:
+                savemat(filepath, calls, do_compression=compress)
+
+    @staticmethod
+    def _check_mat_file(filepath, compress):
+        """
+        Check the arguments of saving calls to a '.mat' file.
+
+        Parameters
+        ----------
+        filepath : str
+        compress : bool or str
+
+        Raises
+        ------
+        ValueError
+            If a codec is given, since '.mat' files can only be compressed with zlib.
         """
+        if isinstance(compress, str):
+            raise ValueError(
+                f"'.mat' files can only be compressed with zlib, not '{compress}'. Use compress=True or save to a `.npy` directory."
+            )
         if filepath.strip()[-4:] != ".mat":
             logging.warning(
                 f"Saving calls to file {filepath} but this file has no '.mat' extension."
             )
 
-        if self.loaded_mat_dict is not None:
-            for key in self.loaded_mat_dict:
-                if key not in self.saved_calls:
-                    self.saved_calls[key] = self.loaded_mat_dict[key]
+    def _restore_dropped_calls(self):
+        """
+        Call again any data that was dropped from memory so that everything is saved.
+        """
+        for save_name in list(self.saved_calls.dropped):
+            if save_name in self._saved_call_args:
+                (
+                    get_call,
+                    call_string,
+                    np_data_type,
+                    change_data,
+                    index_range,
+                    sample_period,
+                ) = self._saved_call_args[save_name]
+                logging.debug(
+                    f"Calling '{call_string}' again before saving since it was dropped from memory."
+                )
+                # Call the same get call so that the data is changed and saved the same way, such as for `MultiGet`.
+                self._get(
+                    get_call,
+                    call_string,
+                    save_name,
+                    np_data_type,
+                    change_data,
+                    load_from_saved=False,
+                    index_range=index_range,
+                    sample_period=sample_period,
+                )
+            else:
+                logging.warning(
+                    f"Can't save '{save_name}' since it was dropped from memory and was not from a call."
+                )
+        if not self.saved_calls.dropped.isdisjoint(self._saved_call_args):
+            raise RuntimeError(
+                f"Calls {sorted(self.saved_calls.dropped & set(self._saved_call_args))} were dropped from memory again before they could be saved."
+            )
 
-        logging.debug(
-            f"Saving data with names '{self.saved_calls.keys()}' to file '{filepath}'."
-        )
-        savemat(filepath, self.saved_calls)
+    @staticmethod
+    def _save_npy_cache(directory, calls, compress):
+        """
+        Save calls as `.npy` files in a directory, replacing what it held.
+
+        Parameters
+        ----------
+        directory : str
+        calls : dict
+            Calls to save. Text entries, such as timebase links and the signal index, are kept in the metadata of the directory.
+        compress : bool or str
+            See `save`.
+        """
+        if compress is True:
+            compress = "zstd"
+        arrays = {}
+        metadata = {}
+        for name, value in calls.items():
+            if isinstance(value, str):
+                metadata[name] = value
+                continue
+            array = np.asarray(value)
+            if array.dtype.hasobject:
+                logging.warning(
+                    f"Can't save '{name}' as a `.npy` file since it holds Python objects. Skipping it."
+                )
+                continue
+            arrays[name] = array
+        NpyStore(directory, compress or None).replace_all(arrays, metadata)
+
+    def _quantize_calls(self, calls, bits, lossy):
+        """
+        Replace floating point calls with integer codes.
+
+        Parameters
+        ----------
+        calls : dict
+            Calls to save. Quantized calls are replaced in place.
+        bits : int
+        lossy : bool
+
+        Returns
+        -------
+        str
+            Scale and offset of each quantized call to save with them.
+        """
+        # Only signals that aren't timebases may be rounded.
+        roundable_names = set()
+        if lossy:
+            for call_string, entries in self._signal_index.items():
+                if not Get(call_string).is_timebase:
+                    roundable_names.update(entries)
+        records = {}
+        for name, value in calls.items():
+            if not isinstance(value, np.ndarray) or name in (
+                SIGNAL_INDEX_NAME,
+                NEGATIVE_CACHE_NAME,
+            ):
+                continue
+            # Codes give back values within 1e-6 of a level, which are no longer equal to the timebases of other objects.
+            if self._is_timebase_entry(name, value):
+                continue
+            result = quantize(value, bits, lossy=name in roundable_names)
+            if result is None:
+                continue
+            codes, scale, offset = result
+            calls[name] = codes
+            records[name] = (scale, offset, value.dtype.str)
+        logging.debug(f"Saving {sorted(records)} as {bits} bit codes.")
+        return write_quantization(records)
+
+    def _is_timebase_entry(self, name, value):
+        """
+        Check whether a saved call is a timebase.
+
+        Parameters
+        ----------
+        name : str
+        value : np.array
+
+        Returns
+        -------
+        bool
+            True for calls of timebases, loaded entries named like timebases, and read-only arrays shared through the timebase registry.
+        """
+        args = self._saved_call_args.get(name)
+        if args is not None and isinstance(args[0], Get) and args[0].is_timebase:
+            return True
+        return "dim_of" in name.lower() or not value.flags.writeable
+
+    @staticmethod
+    def _link_shared_timebases(calls):
+        """
+        Replace repeats of a shared read-only timebase with a link to its first entry so that it is only saved once.
+
+        Parameters
+        ----------
+        calls : dict or CallCache
+            Saved calls to write to file.
+
+        Returns
+        -------
+        dict
+            Calls where repeated timebases are strings starting with `TIMEBASE_LINK_PREFIX`.
+        """
+        linked_calls = {}
+        first_names = {}
+        for key in sorted(calls):
+            # Read spilled calls from their files instead of restoring them into memory.
+            value = calls.peek(key) if isinstance(calls, CallCache) else calls[key]
+            if isinstance(value, np.ndarray) and not value.flags.writeable:
+                if id(value) in first_names:
+                    linked_calls[key] = TIMEBASE_LINK_PREFIX + first_names[id(value)]
+                    continue
+                first_names[id(value)] = key
+            linked_calls[key] = value
+        return linked_calls
 
     def save_all(self, filepath):
         """
@@ -571,6 +1971,18 @@ class Data:
         filepath : str
             Path to file where the data should be saved.
         """
+        self.load_all()
+        self.save(filepath)
+
+    def load_all(self, ignore_errors=True):
+        """
+        Call all `@lazy_get` functions so that their data is in the saved calls.
+
+        Parameters
+        ----------
+        ignore_errors : bool, default=True
+            Whether to log and skip errors raised by the functions instead of raising them.
+        """
         # Get all the items in the class. If any are of type `property` then that is a call to MDSplus most likely.
         class_items = self.__class__.__dict__.items()
         call_functions = [k for k, v in class_items if isinstance(v, property)]
@@ -580,16 +1992,18 @@ class Data:
                 logging.debug(f"Calling function '{f}'.")
                 getattr(self, f)
             except MDSplusException as e:
+                if not ignore_errors:
+                    raise
                 logging.warning(
                     f"An MDSplus exception occurred while executing '{f}'. Exception was:\n{e}"
                 )
             except Exception as e:
+                if not ignore_errors:
+                    raise
                 logging.warning(
                     f"A non-MDSplus exception occurred while executing '{f}'. Exception was:\n{e}"
                 )
 
-        self.save(filepath)
-
 
 class Port:
     def __init__(self, parent_probe: Data, port_tag_prefix: str) -> None:
@@ -637,7 +2051,7 @@ class Port:
             Get(f"\\{self.port_tag_prefix}alpha", signal=False)
         )
 
-    @lazy_get
+    @lazy_get(depends_on="alpha_deg")
     def alpha_rad(self):
         return np.deg2rad(self.alpha_deg)
 
@@ -645,7 +2059,7 @@ class Port:
     def beta_deg(self):
         return self.parent_probe.get(Get(f"\\{self.port_tag_prefix}beta", signal=False))
 
-    @lazy_get
+    @lazy_get(depends_on="beta_deg")
     def beta_rad(self):
         return np.deg2rad(self.beta_deg)
 
@@ -655,7 +2069,7 @@ class Port:
             Get(f"\\{self.port_tag_prefix}gamma", signal=False)
         )
 
-    @lazy_get
+    @lazy_get(depends_on="gamma_deg")
     def gamma_rad(self):
         return np.deg2rad(self.gamma_deg)
 
@@ -669,7 +2083,7 @@ class Port:
     def lat_deg(self):
         return self.parent_probe.get(Get(f"\\{self.port_tag_prefix}lat", signal=False))
 
-    @lazy_get
+    @lazy_get(depends_on="lat_deg")
     def lat_rad(self):
         return np.deg2rad(self.lat_deg)
 
@@ -677,7 +2091,7 @@ class Port:
     def long_deg(self):
         return self.parent_probe.get(Get(f"\\{self.port_tag_prefix}long", signal=False))
 
-    @lazy_get
+    @lazy_get(depends_on="long_deg")
     def long_rad(self):
         return np.deg2rad(self.long_deg)
 
@@ -698,7 +2112,7 @@ class Port:
             logging.warning("Could not get clocking value. Returning clocking of 0.")
             return 0
 
-    @lazy_get
+    @lazy_get(depends_on="clocking_deg")
     def clocking_rad(self):
         try:
             return np.deg2rad(self.clocking_deg)
@@ -0,0 +1,686 @@
+"""Keep a local archive of shots in step with the server, only getting what changed since the last sync."""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+
+from wipplpy.modules.deadlines import call_with_deadline, get_deadlines
+from wipplpy.modules.export import (
+    EXPORT_FORMATS,
+    export_shot,
+    is_exported,
+    latest_location,
+    machine_location,
+    run_exports,
+    spec_hash,
+)
+from wipplpy.modules.shot_loader import (
+    get_remote_shot_tree,
+    is_run_day_shot,
+    most_recent_shot,
+)
+
+STATE_NAME = "mirror_state.sqlite"
+# Seconds after a shot is first mirrored that its calls are checked for changes. This is longer than a day so that a nightly sync checks the shots of the previous run day.
+DEFAULT_REVALIDATE_SECONDS = 36 * 3600.0
+# Shot numbers are the date followed by three digits for the shot of the day. See `wipplpy.modules.shot_loader.is_run_day_shot`.
+SHOTS_PER_DAY = 1000
+# Number of missing shots in a row after which a day is taken to have no more shots. Shots of a day are numbered from 001 and gaps are rare.
+MAX_MISSING_IN_A_ROW = 3
+# Codes of the MDSplus errors for opening the tree of a shot that doesn't exist. Messages look like '%TREE-E-FOPENR, Error opening file read-only'.
+MISSING_SHOT_ERRORS = ("FOPENR", "FILE_NOT_FOUND")
+
+
+class RateLimiter:
+    def __init__(self, rate=None, burst=1):
+        """
+        Space out events so that no more than a rate of them happen on average.
+
+        Parameters
+        ----------
+        rate : float or None, default=None
+            Events per second. If None, there is no limit.
+        burst : int, default=1
+            Number of events that can happen back to back after a pause.
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Wait until the next event is allowed."""
+        if self.rate is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._last) * self.rate
+            )
+            self._last = now
+            delay = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+            self._tokens -= 1
+        if delay > 0:
+            logging.debug(f"Waiting {delay:.2f} s for rate limit.")
+            time.sleep(delay)
+
+
+class MirrorState:
+    def __init__(self, archive_directory):
+        """
+        Database of what a local archive holds.
+
+        Parameters
+        ----------
+        archive_directory : str
+
+        Notes
+        -----
+        Each mirrored shot has its files with their checksums and sizes,
+        the fingerprint of its calls, when it was first and last synced,
+        whether it was newer than every shot of the sync before, and the
+        error of its last sync if it failed. Shots that don't exist on the
+        server are kept apart so that they are never tried again.
+        """
+        os.makedirs(archive_directory, exist_ok=True)
+        self.path = os.path.join(archive_directory, STATE_NAME)
+        self._connection = sqlite3.connect(self.path)
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS shots (
+                shot INTEGER PRIMARY KEY,
+                files TEXT,
+                fingerprint TEXT,
+                first_synced REAL,
+                synced REAL,
+                fresh INTEGER,
+                error TEXT
+            );
+            CREATE TABLE IF NOT EXISTS missing_shots (shot INTEGER PRIMARY KEY);
+            """
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def get_meta(self, key, default=None):
+        row = self._connection.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set_meta(self, key, value):
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, json.dumps(value))
+            )
+
+    def shots(self):
+        """
+        Get every shot in the state.
+
+        Returns
+        -------
+        dict
+            Record of each shot keyed by shot number.
+        """
+        rows = self._connection.execute(
+            "SELECT shot, files, fingerprint, first_synced, synced, fresh, error FROM shots"
+        )
+        return {
+            row[0]: {
+                "files": None if row[1] is None else json.loads(row[1]),
+                "fingerprint": row[2],
+                "first_synced": row[3],
+                "synced": row[4],
+                "fresh": bool(row[5]),
+                "error": row[6],
+            }
+            for row in rows
+        }
+
+    def record_success(self, shot_number, files, fingerprint, fresh):
+        now = time.time()
+        with self._connection:
+            self._connection.execute(
+                """
+                INSERT INTO shots VALUES (?, ?, ?, ?, ?, ?, NULL)
+                ON CONFLICT(shot) DO UPDATE SET
+                    files = excluded.files,
+                    fingerprint = excluded.fingerprint,
+                    first_synced = COALESCE(shots.first_synced, excluded.first_synced),
+                    synced = excluded.synced,
+                    error = NULL
+                """,
+                (shot_number, json.dumps(files), fingerprint, now, now, int(fresh)),
+            )
+
+    def missing_shots(self):
+        """
+        Get the shots that don't exist on the server.
+
+        Returns
+        -------
+        set of int
+        """
+        rows = self._connection.execute("SELECT shot FROM missing_shots")
+        return {row[0] for row in rows}
+
+    def record_missing(self, shot_number):
+        with self._connection:
+            self._connection.execute("DELETE FROM shots WHERE shot = ?", (shot_number,))
+            self._connection.execute(
+                "INSERT OR IGNORE INTO missing_shots VALUES (?)", (shot_number,)
+            )
+
+    def record_failure(self, shot_number, error, fresh):
+        with self._connection:
+            self._connection.execute(
+                """
+                INSERT INTO shots (shot, fresh, error) VALUES (?, ?, ?)
+                ON CONFLICT(shot) DO UPDATE SET error = excluded.error
+                """,
+                (shot_number, int(fresh), error),
+            )
+
+
+def is_missing_shot_error(error):
+    """
+    Check whether an error from opening a tree means that the shot doesn't exist.
+
+    Parameters
+    ----------
+    error : Exception or str
+        Error or its text as recorded by `sync_mirror`.
+
+    Returns
+    -------
+    bool
+    """
+    text = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+    return any(
+        re.search(rf"(Tree{code}\b|%TREE-\w-{code}\b)", text)
+        for code in MISSING_SHOT_ERRORS
+    )
+
+
+def _shot_date(shot_number):
+    """Get the date of a shot from its number."""
+    day = str(shot_number)[: -len(str(SHOTS_PER_DAY - 1))]
+    millenium_index = int(day[:-6])
+    return date(
+        (millenium_index + 1) * 1000 + int(day[-6:-4]), int(day[-4:-2]), int(day[-2:])
+    )
+
+
+def _day_shot(day, index):
+    """Get the number of a shot of a day."""
+    millenium_index = math.floor(day.year / 1000) - 1
+    return int(f"{millenium_index}{day:%y%m%d}") * SHOTS_PER_DAY + index
+
+
+def list_shots(first_shot, last_shot, shot_exists):
+    """
+    List the shots from one shot to another that exist, going day by day.
+
+    Parameters
+    ----------
+    first_shot, last_shot : int
+        First and last shot to list, including both.
+    shot_exists : function
+        Called with a shot number to check whether the shot exists.
+
+    Returns
+    -------
+    list of int
+
+    Notes
+    -----
+    Most numbers between two shots aren't shots, since the numbers of each
+    day start with its date. Each day is checked from its first shot until
+    `MAX_MISSING_IN_A_ROW` shots in a row don't exist, so days without
+    shots take that many checks.
+    """
+    shots = []
+    day = _shot_date(first_shot)
+    last_day = _shot_date(last_shot)
+    while day <= last_day:
+        index = first_shot % SHOTS_PER_DAY if day == _shot_date(first_shot) else 1
+        missing_in_a_row = 0
+        while index < SHOTS_PER_DAY and missing_in_a_row < MAX_MISSING_IN_A_ROW:
+            shot_number = _day_shot(day, index)
+            if shot_number > last_shot:
+                break
+            if shot_exists(shot_number):
+                shots.append(shot_number)
+                missing_in_a_row = 0
+            else:
+                missing_in_a_row += 1
+            index += 1
+        day += timedelta(days=1)
+    return shots
+
+
+def list_tree_files(tree_directory, tree_name, first_shot, last_shot):
+    """
+    List the shots from one shot to another that have tree files in a directory.
+
+    Parameters
+    ----------
+    tree_directory : str
+        Directory holding the tree files, which are named like 'mst_1230419031.tree'.
+    tree_name : str
+    first_shot, last_shot : int
+        First and last shot to list, including both.
+
+    Returns
+    -------
+    list of int
+    """
+    pattern = re.compile(rf"{re.escape(tree_name.lower())}_(\d+)\.tree")
+    shots = []
+    for name in os.listdir(tree_directory):
+        match = pattern.fullmatch(name.lower())
+        if match is not None and first_shot <= int(match.group(1)) <= last_shot:
+            shots.append(int(match.group(1)))
+    return sorted(shots)
+
+
+def _shot_exists_on_server(shot_number, machine, config_filepath, deadlines):
+    tree_name, server_name = machine_location(machine, shot_number, config_filepath)
+    try:
+        get_remote_shot_tree(
+            shot_number,
+            tree_name=tree_name,
+            server_name=server_name,
+            deadlines=deadlines,
+        )
+    except Exception as e:
+        if is_missing_shot_error(e):
+            return False
+        raise
+    return True
+
+
+def call_fingerprint(
+    shot_number, call_strings, tree_name=None, server_name=None, deadlines=None
+):
+    """
+    Get a fingerprint of the data of calls that changes when the data does, without downloading the data.
+
+    Parameters
+    ----------
+    shot_number : int
+    call_strings : list of str
+    tree_name, server_name : str or None, default=None
+        Tree and server of the shot. By default load from config file.
+    deadlines : dict or None, default=None
+
+    Returns
+    -------
+    str
+        Hash of the size and sum of each call, computed by the server, and the class of any error raised instead.
+    """
+    deadlines = get_deadlines(deadlines)
+    tree = get_remote_shot_tree(
+        shot_number, tree_name=tree_name, server_name=server_name, deadlines=deadlines
+    )
+    checksum = hashlib.sha256()
+    for call_string in call_strings:
+        try:
+            result = call_with_deadline(
+                tree.get,
+                deadlines["call"],
+                f"getting fingerprint of '{call_string}' for shot #{shot_number}",
+                f"[DBLE(SIZE( DATA({call_string}) )), SUM(DBLE( DATA({call_string}) ))]",
+            ).data()
+            summary = repr([float(value) for value in result])
+        except Exception as e:
+            summary = type(e).__name__
+        checksum.update(f"{call_string}\t{summary}\n".encode())
+    return checksum.hexdigest()
+
+
+def mirror_shot(shot_number, **export_arguments):
+    """
+    Fingerprint the calls of a shot and then export it.
+
+    Parameters
+    ----------
+    shot_number : int
+    **export_arguments
+        Arguments of `export_shot`.
+
+    Returns
+    -------
+    dict
+        The files written by `export_shot` and the fingerprint of the calls.
+
+    Notes
+    -----
+    The fingerprint is taken before exporting so that data that changes
+    during the export is seen as changed on the next sync.
+    """
+    fingerprint = None
+    if len(export_arguments.get("call_strings", ())) != 0:
+        tree_name, server_name = machine_location(
+            export_arguments.get("machine"),
+            shot_number,
+            export_arguments.get("config_filepath"),
+        )
+        fingerprint = call_fingerprint(
+            shot_number,
+            export_arguments["call_strings"],
+            tree_name,
+            server_name,
+            export_arguments.get("deadlines"),
+        )
+    return {
+        "files": export_shot(shot_number, **export_arguments),
+        "fingerprint": fingerprint,
+    }
+
+
+def _needs_revalidation(record, now, revalidate_seconds):
+    return (
+        record["error"] is None
+        and record["fresh"]
+        and record["first_synced"] is not None
+        and now - record["first_synced"] < revalidate_seconds
+    )
+
+
+def sync_mirror(  # noqa: PLR0912, PLR0913, PLR0915
+    archive_directory,
+    call_strings=(),
+    probe_paths=(),
+    machine=None,
+    first_shot=None,
+    last_shot=None,
+    jobs=1,
+    rate=None,
+    max_shots=None,
+    revalidate_seconds=DEFAULT_REVALIDATE_SECONDS,
+    export_format="mat",
+    ignore_errors=False,
+    deadlines=None,
+    config_filepath=None,
+    tree_directory=None,
+):
+    """
+    Bring a local archive in step with the server.
+
+    Parameters
+    ----------
+    archive_directory : str
+        Directory of the archive. Shots are written as by `export_shot` and the state of the mirror is kept in `STATE_NAME`.
+    call_strings, probe_paths, machine, export_format, ignore_errors, deadlines, config_filepath
+        See `wipplpy.modules.export.export_shot`.
+    first_shot : int or None, default=None
+        First shot of the archive. Only needed the first time an archive is synced.
+    last_shot : int or None, default=None
+        Last shot to mirror. If None, use the most recent shot on the server new shots of the machine are written to. See `wipplpy.modules.export.latest_location`.
+    jobs : int, default=1
+        Number of shots to download at the same time.
+    rate : float or None, default=None
+        Largest number of shots to start downloading per second. If None, there is no limit.
+    max_shots : int or None, default=None
+        Largest number of shots to download in this sync. The rest are downloaded by later syncs.
+    revalidate_seconds : float, default=DEFAULT_REVALIDATE_SECONDS
+        Seconds after a new shot is first mirrored that its calls are checked for changes on every sync.
+    tree_directory : str or None, default=None
+        Directory of the tree files of the machine if this host can read it. Shots are then listed from the names of the files instead of by opening their trees on the server. See `list_shots`.
+
+    Returns
+    -------
+    dict
+        Most recent shot, the new, revalidated, changed, and missing shots, and the errors of shots that failed.
+
+    Notes
+    -----
+    A shot is new if it is not in the archive or its last sync failed. Run
+    day shots may still be changing when they are first mirrored, so shots
+    that were newer than every shot of the sync before are revalidated by
+    comparing a fingerprint of their calls computed on the server, and are
+    downloaded again if it changed. Shots with only probe classes have no
+    calls to fingerprint so they are downloaded again instead. Shots whose
+    files are missing or have the wrong size are downloaded again. When
+    everything is current a sync makes no downloads.
+
+    Only shots that exist are synced. Days up to the day before the sync
+    are only listed once. Shots whose tree doesn't exist on the server are
+    recorded as missing and are never tried again.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(
+            f"Unknown export format '{export_format}'. Possible formats are {sorted(EXPORT_FORMATS)}."
+        )
+    if len(call_strings) == 0 and len(probe_paths) == 0:
+        raise ValueError("No calls or probe classes were given to mirror.")
+
+    spec = {
+        "calls": list(call_strings),
+        "probes": list(probe_paths),
+        "machine": machine,
+        "format": export_format,
+    }
+    summary = {
+        "most_recent_shot": None,
+        "new": [],
+        "revalidated": [],
+        "changed": [],
+        "missing": [],
+        "failures": {},
+    }
+    with MirrorState(archive_directory) as state:
+        stored_hash = state.get_meta("spec_hash")
+        if stored_hash is None:
+            state.set_meta("spec", spec)
+            state.set_meta("spec_hash", spec_hash(spec))
+        elif stored_hash != spec_hash(spec):
+            raise ValueError(
+                f"'{archive_directory}' mirrors {state.get_meta('spec')} which is not {spec}. Use another archive directory to mirror different data."
+            )
+
+        if first_shot is None:
+            first_shot = state.get_meta("first_shot")
+            if first_shot is None:
+                raise ValueError(
+                    "The first shot is needed the first time an archive is synced."
+                )
+        else:
+            state.set_meta("first_shot", first_shot)
+
+        if last_shot is None:
+            tree_name, server_name = latest_location(machine, config_filepath)
+            last_shot = most_recent_shot(tree_name, server_name, deadlines)
+        summary["most_recent_shot"] = last_shot
+        # Shots newer than every shot of the last sync may be from a run day that is still going.
+        previous_latest = state.get_meta("latest_shot")
+
+        def is_fresh(shot_number):
+            if previous_latest is None:
+                # Without a sync before, only shots of a run day that is still going may change.
+                return is_run_day_shot(shot_number)
+            return shot_number > previous_latest
+
+        records = state.shots()
+        missing = state.missing_shots()
+        now = time.time()
+        to_sync = []
+        tree_files = None
+        if tree_directory is not None:
+            tree_name = machine_location(machine, last_shot, config_filepath)[0]
+
+            def tree_files(first, last):
+                return list_tree_files(tree_directory, tree_name, first, last)
+
+        for shot_number in _shots_to_check(
+            state,
+            records,
+            first_shot,
+            last_shot,
+            tree_files,
+            lambda s: _shot_exists_on_server(s, machine, config_filepath, deadlines),
+        ):
+            if shot_number in missing:
+                continue
+            record = records.get(shot_number)
+            if record is None or record["error"] is not None:
+                summary["new"].append(shot_number)
+                to_sync.append(shot_number)
+            elif not is_exported(archive_directory, record["files"]):
+                logging.info(f"Files of shot {shot_number} are missing or changed.")
+                summary["changed"].append(shot_number)
+                to_sync.append(shot_number)
+            elif _needs_revalidation(record, now, revalidate_seconds):
+                summary["revalidated"].append(shot_number)
+                if len(call_strings) == 0:
+                    summary["changed"].append(shot_number)
+                    to_sync.append(shot_number)
+                    continue
+                tree_name, server_name = machine_location(
+                    machine, shot_number, config_filepath
+                )
+                try:
+                    fingerprint = call_fingerprint(
+                        shot_number, call_strings, tree_name, server_name, deadlines
+                    )
+                except Exception as e:
+                    # The shot is still revalidated on the next sync since its record is left as it was.
+                    logging.error(
+                        f"Failed to fingerprint shot {shot_number}. Exception was:\n{e}"
+                    )
+                    summary["failures"][shot_number] = f"{type(e).__name__}: {e}"
+                    continue
+                if fingerprint != record["fingerprint"]:
+                    logging.info(f"Data of shot {shot_number} changed on the server.")
+                    summary["changed"].append(shot_number)
+                    to_sync.append(shot_number)
+
+        if max_shots is not None and len(to_sync) > max_shots:
+            logging.info(
+                f"Only syncing {max_shots} of {len(to_sync)} shots. Sync again for the rest."
+            )
+            to_sync = to_sync[:max_shots]
+        logging.info(
+            f"Syncing {len(to_sync)} shots up to shot {last_shot}: {len(summary['new'])} new and {len(summary['changed'])} changed."
+        )
+
+        def finish(shot_number, get_result):
+            fresh = is_fresh(shot_number) or (
+                shot_number in records and records[shot_number]["fresh"]
+            )
+            try:
+                result = get_result()
+            except Exception as e:
+                if is_missing_shot_error(e):
+                    logging.info(f"Shot {shot_number} doesn't exist on the server.")
+                    summary["missing"].append(shot_number)
+                    state.record_missing(shot_number)
+                    return
+                logging.error(f"Failed to sync shot {shot_number}. Exception was:\n{e}")
+                summary["failures"][shot_number] = f"{type(e).__name__}: {e}"
+                state.record_failure(
+                    shot_number, summary["failures"][shot_number], fresh
+                )
+                return
+            state.record_success(
+                shot_number, result["files"], result["fingerprint"], fresh
+            )
+
+        run_exports(
+            to_sync,
+            finish,
+            jobs,
+            throttle=RateLimiter(rate).wait,
+            worker=mirror_shot,
+            output_directory=archive_directory,
+            call_strings=tuple(call_strings),
+            probe_paths=tuple(probe_paths),
+            machine=machine,
+            export_format=export_format,
+            ignore_errors=ignore_errors,
+            deadlines=deadlines,
+            config_filepath=config_filepath,
+        )
+        # Only move the latest shot up to shots that are in the archive so that newer shots that failed or were left for a later sync are still fresh when they are synced.
+        synced = [
+            shot_number
+            for shot_number, record in state.shots().items()
+            if record["error"] is None
+        ]
+        if previous_latest is not None:
+            synced.append(previous_latest)
+        if len(synced) != 0:
+            state.set_meta("latest_shot", max(synced))
+        state.set_meta("last_sync", now)
+    return summary
+
+
+def _shots_to_check(  # noqa: PLR0913
+    state, records, first_shot, last_shot, tree_files, shot_exists
+):
+    """
+    Get the shots that exist from the first to the last shot of a sync.
+
+    Parameters
+    ----------
+    state : MirrorState
+    records : dict
+        Records of the shots in the state.
+    first_shot, last_shot : int
+    tree_files : function or None
+        Called with the first and last shot to list the shots from tree files instead of checking each shot.
+    shot_exists : function
+        See `list_shots`.
+
+    Returns
+    -------
+    list of int
+
+    Notes
+    -----
+    Days before the day of the last shot and before today don't get new
+    shots, so the last of them that was listed is kept in the state and
+    later syncs only list the days after it. Shots in the state are known to
+    exist and aren't checked again.
+    """
+    if tree_files is not None:
+        return tree_files(first_shot, last_shot)
+
+    shots = {s for s in records if first_shot <= s <= last_shot}
+    listed = state.get_meta("listed")
+    start = first_shot
+    if listed is not None and listed["first_shot"] <= first_shot:
+        next_day = date.fromisoformat(listed["through"]) + timedelta(days=1)
+        start = max(first_shot, _day_shot(next_day, 1))
+    else:
+        listed = {"first_shot": first_shot, "through": None}
+    if start <= last_shot:
+        shots.update(
+            list_shots(start, last_shot, lambda s: s in shots or shot_exists(s))
+        )
+
+    through = min(_shot_date(last_shot), date.today()) - timedelta(days=1)
+    if listed["through"] is not None:
+        through = max(through, date.fromisoformat(listed["through"]))
+    if through >= _shot_date(first_shot):
+        listed["through"] = through.isoformat()
+        state.set_meta("listed", listed)
+    return sorted(shots)
@@ -0,0 +1,266 @@
+"""Remember calls that failed for a shot so that they aren't sent to the server again for a while."""
+
+import copy
+import logging
+import re
+import threading
+import time
+
+from MDSplus import mdsExceptions
+from MDSplus.connection import MdsIpException
+from MDSplus.mdsExceptions import MDSplusException, TreeNNF, TreeNODATA
+
+from wipplpy.modules.shot_loader import is_run_day_shot
+
+# Seconds a failed call is remembered for by default. Nodes missing from old shots don't appear later but those of shots being taken might.
+DEFAULT_NEGATIVE_TTL = 3600.0
+# Name of the entry in saved files that holds the failed calls of the shot.
+NEGATIVE_CACHE_NAME = "wipplpy_negative_cache"
+# Errors that mean the node or its data is missing from the shot. Other errors, such as those of the connection, may go away when retried.
+CACHEABLE_ERRORS = (TreeNNF, TreeNODATA)
+
+
+def is_cacheable(error, shot_number=None):
+    """
+    Check whether an error from a call means that the call will keep failing for the shot.
+
+    Parameters
+    ----------
+    error : Exception
+    shot_number : int or None, default=None
+        Shot the call failed for. Failures of run-day shots are never cached since their nodes and data are still being written.
+
+    Returns
+    -------
+    bool
+        True for errors of `CACHEABLE_ERRORS` such as missing nodes, including an `MdsIpException` whose status or message is one of them. False for errors that may go away when retried such as other `MdsIpException` and timeouts.
+    """
+    if _cacheable_class(error) is None:
+        return False
+    return shot_number is None or not is_run_day_shot(shot_number)
+
+
+def _cacheable_class(error):
+    """
+    Find which of `CACHEABLE_ERRORS` an error stands for.
+
+    Parameters
+    ----------
+    error : Exception
+
+    Returns
+    -------
+    type or None
+        Class of `CACHEABLE_ERRORS` or None if the error isn't one of them.
+
+    Notes
+    -----
+    Remote calls raise `MdsIpException` for errors on the server, such as a
+    missing node, so its status and message are compared to those of each
+    cacheable class. Messages look like '%TREE-W-NNF, Node Not Found'.
+    """
+    if not isinstance(error, MdsIpException):
+        for error_class in CACHEABLE_ERRORS:
+            if isinstance(error, error_class):
+                return error_class
+        return None
+    status = getattr(error, "status", None)
+    message = str(getattr(error, "message", None) or error)
+    for error_class in CACHEABLE_ERRORS:
+        class_status = getattr(error_class, "status", None)
+        if status is not None and class_status is not None and status == class_status:
+            return error_class
+        code = error_class.__name__.removeprefix("Tree").upper()
+        if re.search(rf"%TREE-\w-{code}\b", message):
+            return error_class
+    return None
+
+
+def _error_class(class_name):
+    """Find an MDSplus exception class by name so that loaded failures raise the same class they did when they happened."""
+    if class_name == MdsIpException.__name__:
+        return MdsIpException
+    error_class = getattr(mdsExceptions, class_name, None)
+    if isinstance(error_class, type) and issubclass(error_class, MDSplusException):
+        return error_class
+    return MDSplusException
+
+
+class KnownFailure:
+    def __init__(self, error_class_name, message, expires, error=None):
+        """
+        Failed call that is remembered.
+
+        Parameters
+        ----------
+        error_class_name : str
+            Name of the class of the error the call raised.
+        message : str
+            Message of the error.
+        expires : float
+            Time, in seconds since the epoch, after which the call should be tried again.
+        error : Exception or None, default=None
+            The error itself if it happened in this process.
+        """
+        self.error_class_name = error_class_name
+        self.message = message
+        self.expires = expires
+        self._error = error
+
+    def __repr__(self):
+        return f"KnownFailure({self.error_class_name}, {self.message!r})"
+
+    def error(self):
+        """
+        Get an error to raise in place of calling again.
+
+        Returns
+        -------
+        Exception
+            A copy of the original error or, for failures loaded from a file, a new error of the same class. A new error is made each time so that raising it doesn't add to the traceback of the last one.
+        """
+        if self._error is not None:
+            try:
+                return copy.copy(self._error).with_traceback(None)
+            except Exception:
+                logging.debug(
+                    f"Could not copy '{type(self._error).__name__}'. Making a new error."
+                )
+        error_class = _error_class(self.error_class_name)
+        try:
+            return error_class(message=self.message)
+        except TypeError:
+            return error_class()
+
+
+class NegativeCache:
+    def __init__(self):
+        """
+        Calls that failed for each shot and when they should be tried again.
+        """
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._failures)
+
+    def record(self, shot_number, call_string, error, ttl=DEFAULT_NEGATIVE_TTL):
+        """
+        Remember that a call failed.
+
+        Parameters
+        ----------
+        shot_number : int
+        call_string : str
+        error : Exception
+            Error the call raised. Errors that aren't cacheable are ignored.
+        ttl : float, default=DEFAULT_NEGATIVE_TTL
+            Seconds to remember the failure for.
+        """
+        if ttl is None or ttl <= 0 or not is_cacheable(error, shot_number):
+            return
+        logging.debug(
+            f"Remembering that '{call_string}' failed for shot {shot_number} with '{type(error).__name__}' for {ttl} s."
+        )
+        failure = KnownFailure(
+            type(error).__name__, str(error), time.time() + ttl, error
+        )
+        with self._lock:
+            self._failures[(shot_number, call_string)] = failure
+
+    def lookup(self, shot_number, call_string):
+        """
+        Get the failure of a call if it is remembered and hasn't expired.
+
+        Parameters
+        ----------
+        shot_number : int
+        call_string : str
+
+        Returns
+        -------
+        KnownFailure or None
+        """
+        key = (shot_number, call_string)
+        with self._lock:
+            failure = self._failures.get(key)
+            if failure is not None and failure.expires <= time.time():
+                del self._failures[key]
+                return None
+            return failure
+
+    def forget(self, shot_number=None, call_string=None):
+        """
+        Forget failures so that the calls are tried again.
+
+        Parameters
+        ----------
+        shot_number : int or None, default=None
+            Shot to forget the failures of. If None, forget them for every shot.
+        call_string : str or None, default=None
+            Call to forget the failures of. If None, forget every call.
+        """
+        with self._lock:
+            for key in list(self._failures):
+                if (shot_number is None or key[0] == shot_number) and (
+                    call_string is None or key[1] == call_string
+                ):
+                    del self._failures[key]
+
+    def to_text(self, shot_number):
+        """
+        Write the failures of a shot that haven't expired to save in a file.
+
+        Parameters
+        ----------
+        shot_number : int
+
+        Returns
+        -------
+        str
+            Each line holds the call string, error class name, expiry time, and error message separated by tabs.
+        """
+        now = time.time()
+        lines = []
+        with self._lock:
+            for (shot, call_string), failure in self._failures.items():
+                if shot == shot_number and failure.expires > now:
+                    message = " ".join(failure.message.split())
+                    lines.append(
+                        f"{call_string}\t{failure.error_class_name}\t{failure.expires!r}\t{message}"
+                    )
+        return "\n".join(lines)
+
+    def update_from_text(self, shot_number, text):
+        """
+        Read failures of a shot saved in a file. Failures that have expired are skipped.
+
+        Parameters
+        ----------
+        shot_number : int
+        text : str or None
+            Text written by `to_text`.
+        """
+        if not isinstance(text, str):
+            return
+        now = time.time()
+        with self._lock:
+            for line in text.splitlines():
+                try:
+                    call_string, class_name, expires, message = line.split("\t", 3)
+                    expires = float(expires)
+                except ValueError:
+                    logging.warning(
+                        f"Could not read negative cache line '{line}'. Skipping."
+                    )
+                    continue
+                key = (shot_number, call_string)
+                if expires <= now or (
+                    key in self._failures and self._failures[key].expires >= expires
+                ):
+                    continue
+                self._failures[key] = KnownFailure(class_name, message, expires)
+
+
+# Failed calls of every Data object in this process.
+known_failures = NegativeCache()
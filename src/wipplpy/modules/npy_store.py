@@ -0,0 +1,236 @@
+"""Store arrays as `.npy` files in a directory that many processes can read from and add to."""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from wipplpy.modules.compression import CODECS, compress_array, decompress_array
+
+INDEX_NAME = "index.json"
+METADATA_NAME = "metadata.json"
+
+
+class NpyStore:
+    def __init__(self, directory, codec=None, level=None):
+        """
+        Directory of arrays saved as `.npy` files under string keys.
+
+        Parameters
+        ----------
+        directory : str
+            Directory holding the arrays. It is made if it doesn't exist.
+        codec : str or None, default=None
+            Codec of `wipplpy.modules.compression.CODECS` to compress arrays that are put in the store with. If None, save them as `.npy` files that can be memory mapped. Arrays are read back whatever codec they were saved with.
+        level : int or None, default=None
+            Compression level of the codec.
+
+        Notes
+        -----
+        Each array is written to a file named after a hash of its key so
+        that any process can find it without reading the index. Files are
+        written to a temporary name and renamed once complete so readers
+        never see part of an array. The index lists the key, file, data
+        type, and shape of each array for looking through the store.
+        """
+        if codec is not None and codec not in CODECS:
+            raise ValueError(
+                f"Unknown codec '{codec}'. Possible codecs are {sorted(CODECS)}."
+            )
+        self.directory = os.path.abspath(directory)
+        self.codec = codec
+        self.level = level
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"NpyStore('{self.directory}', codec={self.codec!r})"
+
+    def __getstate__(self):
+        return {"directory": self.directory, "codec": self.codec, "level": self.level}
+
+    def __setstate__(self, state):
+        self.__init__(state["directory"], state.get("codec"), state.get("level"))
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def path(self, key, codec=None):
+        """
+        Get the path of the file that holds the array of a key.
+
+        Parameters
+        ----------
+        key : str
+        codec : str or None, default=None
+            Codec the array is compressed with or None for an uncompressed `.npy` file.
+
+        Returns
+        -------
+        str
+        """
+        name = hashlib.sha256(key.encode()).hexdigest()[:32]
+        extension = ".npy" if codec is None else f".npy{CODECS[codec]}"
+        return os.path.join(self.directory, name + extension)
+
+    def _find(self, key):
+        """Get the path and codec of the file holding the array of a key or None if there is none."""
+        for codec in (self.codec, None, *CODECS):
+            path = self.path(key, codec)
+            if os.path.exists(path):
+                return path, codec
+        return None
+
+    def put(self, key, array):
+        """
+        Save an array under a key, replacing any array already saved under it.
+
+        Parameters
+        ----------
+        key : str
+        array : np.array
+        """
+        record = self._write_array(key, array)
+        with self._lock:
+            # Other processes may add to the index at the same time. The arrays are found by their file names so an entry lost to a race only hides the key from `keys`.
+            index = self.read_index()
+            index[key] = record
+            self._write_json(INDEX_NAME, index)
+
+    def replace_all(self, arrays, metadata=None):
+        """
+        Make the store hold only the given arrays, writing the index once.
+
+        Parameters
+        ----------
+        arrays : dict
+            Array of each key.
+        metadata : dict or None, default=None
+            Values that can be written as JSON to keep with the arrays. See `read_metadata`.
+        """
+        old_index = self.read_index()
+        index = {key: self._write_array(key, array) for key, array in arrays.items()}
+        with self._lock:
+            self._write_json(METADATA_NAME, {} if metadata is None else metadata)
+            self._write_json(INDEX_NAME, index)
+        for key in old_index.keys() - index.keys():
+            for codec in (None, *CODECS):
+                path = self.path(key, codec)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _write_array(self, key, array):
+        """
+        Write the file of an array.
+
+        Returns
+        -------
+        dict
+            Record of the array for the index.
+        """
+        array = np.asarray(array)
+        path = self.path(key, self.codec)
+        partial_path = f"{path}.{os.getpid()}.{threading.get_ident()}.partial"
+        logging.debug(f"Saving '{key}' to '{path}'.")
+        if self.codec is None:
+            with open(partial_path, "wb") as partial_file:
+                np.save(partial_file, array)
+        else:
+            with open(partial_path, "wb") as partial_file:
+                partial_file.write(compress_array(array, self.codec, self.level))
+        os.replace(partial_path, path)
+        # Remove a copy saved with another codec so that it can't be read in place of this one.
+        for codec in (None, *CODECS):
+            other_path = self.path(key, codec)
+            if codec != self.codec and os.path.exists(other_path):
+                os.remove(other_path)
+        return {
+            "file": os.path.basename(path),
+            "codec": self.codec,
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+        }
+
+    def get(self, key, mmap=True):
+        """
+        Get the array saved under a key.
+
+        Parameters
+        ----------
+        key : str
+        mmap : bool, default=True
+            Whether to memory map the file read-only instead of reading it into memory. Compressed arrays are always read into memory.
+
+        Returns
+        -------
+        np.array or np.memmap
+
+        Raises
+        ------
+        KeyError
+            If nothing is saved under the key.
+        """
+        found = self._find(key)
+        if found is None:
+            raise KeyError(key)
+        path, codec = found
+        try:
+            if codec is None:
+                return np.load(path, mmap_mode="r" if mmap else None)
+            with open(path, "rb") as compressed_file:
+                return decompress_array(compressed_file.read())
+        except FileNotFoundError:
+            # The array was replaced by one saved with another codec since it was found.
+            return self.get(key, mmap)
+
+    def keys(self):
+        """
+        Get the keys listed in the index.
+
+        Returns
+        -------
+        list of str
+        """
+        return list(self.read_index())
+
+    def read_index(self):
+        """
+        Read the index of the store.
+
+        Returns
+        -------
+        dict
+            File, data type, and shape of each array keyed by its key.
+        """
+        try:
+            with open(os.path.join(self.directory, INDEX_NAME)) as index_file:
+                return json.load(index_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def read_metadata(self):
+        """
+        Read the values written with the arrays by `replace_all`.
+
+        Returns
+        -------
+        dict
+        """
+        try:
+            with open(os.path.join(self.directory, METADATA_NAME)) as metadata_file:
+                return json.load(metadata_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_json(self, name, value):
+        path = os.path.join(self.directory, name)
+        partial_path = f"{path}.{os.getpid()}.partial"
+        with open(partial_path, "w") as json_file:
+            json.dump(value, json_file, indent=1, sort_keys=True)
+        os.replace(partial_path, path)
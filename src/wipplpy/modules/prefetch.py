@@ -0,0 +1,150 @@
+"""Get data in the background in priority order so that it is ready by the time it is used."""
+
+import heapq
+import itertools
+import logging
+import threading
+
+_PENDING = "pending"
+_RUNNING = "running"
+_DONE = "done"
+
+
+class Prefetch:
+    def __init__(self, function, *args, **kwargs):
+        """
+        Value that is being got in the background and is resolved the first time it is needed.
+
+        Parameters
+        ----------
+        function : function
+            Function that gets the value.
+        *args, **kwargs
+            Arguments to call the function with.
+
+        Notes
+        -----
+        If the value is needed before the background thread has started
+        getting it, it is got right away in the thread that needs it instead
+        of waiting for everything queued before it.
+        """
+        self._function = function
+        self._args = args
+        self._kwargs = kwargs
+        self._state = _PENDING
+        self._condition = threading.Condition()
+        self._value = None
+        self._error = None
+
+    def __repr__(self):
+        return f"Prefetch({self._state})"
+
+    def _claim(self):
+        with self._condition:
+            if self._state != _PENDING:
+                return False
+            self._state = _RUNNING
+            return True
+
+    def _run(self):
+        try:
+            self._value = self._function(*self._args, **self._kwargs)
+        except BaseException as e:
+            self._error = e
+        finally:
+            # Let go of the function so that it doesn't keep its data object alive.
+            self._function = self._args = self._kwargs = None
+            with self._condition:
+                self._state = _DONE
+                self._condition.notify_all()
+
+    def done(self):
+        return self._state == _DONE
+
+    def result(self, timeout=None):
+        """
+        Get the value, getting it now if the background thread hasn't started on it.
+
+        Parameters
+        ----------
+        timeout : float or None, default=None
+            Seconds to wait for the background thread. If None, wait forever.
+
+        Returns
+        -------
+        The value.
+
+        Raises
+        ------
+        Exception
+            Any exception raised while getting the value.
+        TimeoutError
+            If the value wasn't got in time.
+        """
+        if self._claim():
+            self._run()
+        with self._condition:
+            if not self._condition.wait_for(self.done, timeout):
+                raise TimeoutError("Timed out waiting for prefetched value.")
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+class PrefetchQueue:
+    def __init__(self):
+        """
+        Queue of prefetches run one at a time in a background thread, lowest priority number first.
+
+        Notes
+        -----
+        Only one thread is used since every data object in a process shares
+        one open tree, so more threads would only wait on each other.
+        Prefetches with the same priority run in the order they were added.
+        """
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def __len__(self):
+        with self._condition:
+            return len(self._heap)
+
+    def put(self, prefetch, priority=0):
+        """
+        Queue a prefetch.
+
+        Parameters
+        ----------
+        prefetch : Prefetch
+        priority : float, default=0
+            Prefetches with lower numbers run first.
+        """
+        with self._condition:
+            heapq.heappush(self._heap, (priority, next(self._counter), prefetch))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._work, name="wipplpy: prefetch", daemon=True
+                )
+                self._thread.start()
+            self._condition.notify()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                # Stop the thread once there is nothing to do. A new one is started by the next `put`.
+                if not self._condition.wait_for(lambda: len(self._heap) != 0, 5.0):
+                    self._thread = None
+                    return
+                _, _, prefetch = heapq.heappop(self._heap)
+            if prefetch._claim():
+                prefetch._run()
+                if prefetch._error is not None:
+                    logging.debug(
+                        f"Prefetch failed. The error is raised when the value is used. Exception was:\n{prefetch._error}"
+                    )
+
+
+# Prefetches of every data object in this process.
+prefetch_queue = PrefetchQueue()
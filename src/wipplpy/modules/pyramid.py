@@ -0,0 +1,346 @@
+"""Hold min/max summaries of a signal at many resolutions so that any view of it can be plotted quickly."""
+
+import logging
+
+import numpy as np
+
+# Smallest number of blocks that can be grouped into a block of the next level.
+MIN_PYRAMID_FACTOR = 2
+
+
+class SignalPyramid:
+    def __init__(self, factor=4):
+        """
+        Min/max summaries of a signal where each level groups `factor` blocks of the level below.
+
+        Parameters
+        ----------
+        factor : int, default=4
+            Number of samples or blocks grouped into each block of the next level.
+
+        Attributes
+        ----------
+        length : int
+            Number of full resolution samples that have been added.
+
+        Notes
+        -----
+        Level `k` holds the minimum and maximum of blocks of `factor**(k + 1)`
+        full resolution samples. Samples are added with `extend` so that the
+        pyramid can be built from a single array or from chunks of a signal
+        as they are fetched. Samples that don't fill a block yet are kept
+        aside and are still used by `view`.
+        """
+        if factor < MIN_PYRAMID_FACTOR:
+            raise ValueError(
+                f"Pyramid factor must be at least {MIN_PYRAMID_FACTOR}, not {factor}."
+            )
+        self.factor = factor
+        self.length = 0
+        self._level_mins = []
+        self._level_maxs = []
+        # Values that don't make a full block of each level yet. Index 0 holds full resolution samples.
+        self._pending_mins = [np.empty(0)]
+        self._pending_maxs = [np.empty(0)]
+
+    @classmethod
+    def from_array(cls, signal, factor=4):
+        """
+        Build a pyramid from a full signal.
+
+        Parameters
+        ----------
+        signal : np.array
+        factor : int, default=4
+
+        Returns
+        -------
+        SignalPyramid
+        """
+        pyramid = cls(factor)
+        pyramid.extend(signal)
+        return pyramid
+
+    @property
+    def num_levels(self):
+        return len(self._level_mins)
+
+    def block_size(self, level):
+        """
+        Number of full resolution samples in each block of a level.
+
+        Parameters
+        ----------
+        level : int
+
+        Returns
+        -------
+        int
+        """
+        return self.factor ** (level + 1)
+
+    def level(self, level):
+        """
+        Get the full blocks of a level.
+
+        Parameters
+        ----------
+        level : int
+
+        Returns
+        -------
+        mins, maxs : np.array
+        """
+        # Join the pieces that were added by each call of `extend` so later views don't need to.
+        if len(self._level_mins[level]) > 1:
+            self._level_mins[level] = [np.concatenate(self._level_mins[level])]
+            self._level_maxs[level] = [np.concatenate(self._level_maxs[level])]
+        return self._level_mins[level][0], self._level_maxs[level][0]
+
+    def extend(self, chunk):
+        """
+        Add the next samples of the signal.
+
+        Parameters
+        ----------
+        chunk : np.array
+            Samples following the ones already added.
+        """
+        chunk = np.asarray(chunk).ravel()
+        self.length += chunk.size
+        mins = maxs = chunk
+        level = 0
+        while True:
+            mins = np.concatenate((self._pending_mins[level], mins))
+            maxs = np.concatenate((self._pending_maxs[level], maxs))
+            num_full = mins.size // self.factor * self.factor
+            # Copy so the pending values don't keep the whole chunk in memory.
+            self._pending_mins[level] = mins[num_full:].copy()
+            self._pending_maxs[level] = maxs[num_full:].copy()
+            if num_full == 0:
+                break
+
+            mins = mins[:num_full].reshape(-1, self.factor).min(axis=1)
+            maxs = maxs[:num_full].reshape(-1, self.factor).max(axis=1)
+            if level == self.num_levels:
+                self._level_mins.append([])
+                self._level_maxs.append([])
+                self._pending_mins.append(np.empty(0, dtype=mins.dtype))
+                self._pending_maxs.append(np.empty(0, dtype=maxs.dtype))
+            self._level_mins[level].append(mins)
+            self._level_maxs[level].append(maxs)
+            level += 1
+
+    def choose_level(self, num_samples, num_pixels):
+        """
+        Get the coarsest level that still has at least one block per pixel.
+
+        Parameters
+        ----------
+        num_samples : int
+            Number of full resolution samples in view.
+        num_pixels : int
+            Number of pixels the view is drawn on.
+
+        Returns
+        -------
+        int or None
+            Level to use or None if full resolution samples are needed.
+        """
+        chosen = None
+        for level in range(self.num_levels):
+            if num_samples // self.block_size(level) >= num_pixels:
+                chosen = level
+            else:
+                break
+        return chosen
+
+    def view(self, index_range=None, num_pixels=1000):
+        """
+        Get the min/max envelope of part of the signal at a resolution that fits a number of pixels.
+
+        Parameters
+        ----------
+        index_range : None or tuple of two int, default=None
+            Indices of the first and last sample in view. If None, view the whole signal.
+        num_pixels : int, default=1000
+            Number of pixels the view is drawn on.
+
+        Returns
+        -------
+        indices : np.array
+            Index of the first sample in each block.
+        mins, maxs : np.array
+            Minimum and maximum of each block.
+        None
+            Returned instead if the view needs full resolution samples.
+        """
+        if index_range is None:
+            index_range = (0, self.length - 1)
+        start = max(int(index_range[0]), 0)
+        stop = min(int(index_range[1]), self.length - 1)
+        level = self.choose_level(stop - start + 1, num_pixels)
+        if level is None:
+            return None
+
+        block_size = self.block_size(level)
+        level_mins, level_maxs = self.level(level)
+        first_block = start // block_size
+        last_block = min(stop // block_size, level_mins.size - 1)
+        mins = level_mins[first_block : last_block + 1]
+        maxs = level_maxs[first_block : last_block + 1]
+        indices = np.arange(first_block, last_block + 1) * block_size
+
+        # Samples past the last full block of this level are summarized by one more block.
+        tail_start = level_mins.size * block_size
+        if stop >= tail_start:
+            pending_mins = [p for p in self._pending_mins[: level + 1] if p.size != 0]
+            pending_maxs = [p for p in self._pending_maxs[: level + 1] if p.size != 0]
+            if len(pending_mins) != 0:
+                mins = np.append(mins, min(p.min() for p in pending_mins))
+                maxs = np.append(maxs, max(p.max() for p in pending_maxs))
+                indices = np.append(indices, tail_start)
+        return indices, mins, maxs
+
+
+def get_pyramid(data, get_call, chunk_size=None, factor=4):
+    """
+    Get the pyramid of a signal of a data object, building it the first time.
+
+    Parameters
+    ----------
+    data : Data
+        Data object to get the signal with.
+    get_call : Get
+        Call for the signal.
+    chunk_size : None or int, default=None
+        If None, build the pyramid from one fetch of the full signal. Otherwise fetch the signal in chunks of this many samples so that the full signal is never held in memory.
+    factor : int, default=4
+        Number of blocks grouped into each block of the next level.
+
+    Returns
+    -------
+    SignalPyramid
+        Pyramid of the signal in the time index range of the data object.
+    """
+    pyramids = data.__dict__.setdefault("_pyramids", {})
+    key = get_call.full_str(data.time_index_range)
+    if key in pyramids:
+        return pyramids[key]
+
+    if chunk_size is None:
+        logging.debug(f"Building pyramid of '{key}' from the full signal.")
+        signal = data.get_range(get_call, data.time_index_range, save=False)
+        pyramid = SignalPyramid.from_array(signal, factor)
+    else:
+        logging.debug(f"Building pyramid of '{key}' in chunks of {chunk_size}.")
+        pyramid = SignalPyramid(factor)
+        for chunk in iter_chunks(data, get_call, chunk_size):
+            pyramid.extend(chunk)
+
+    pyramids[key] = pyramid
+    return pyramid
+
+
+def signal_index_range(data, get_call):
+    """
+    Get the index range of a signal that a data object uses.
+
+    Parameters
+    ----------
+    data : Data
+    get_call : Get
+
+    Returns
+    -------
+    tuple of two int
+        Indices of the first and last sample, including both ends.
+    """
+    if data.time_index_range is not None:
+        start = data.time_index_range[0]
+        stop = data.time_index_range[1]
+    else:
+        start = 0
+        stop = None
+    length = int(data.get(f"SIZE( {get_call.full_str()} )", change_data=False))
+    if stop is None or stop > length - 1:
+        stop = length - 1
+    return (start, stop)
+
+
+def iter_chunks(data, get_call, chunk_size, index_range=None):
+    """
+    Fetch a signal in chunks without keeping them in the saved calls.
+
+    Parameters
+    ----------
+    data : Data
+    get_call : Get
+    chunk_size : int
+        Number of samples in each chunk.
+    index_range : None or tuple of two int, default=None
+        Indices of the first and last sample to fetch. If None, use the index range of the data object.
+
+    Yields
+    ------
+    np.array
+        Next chunk of the signal.
+    """
+    if index_range is None:
+        index_range = signal_index_range(data, get_call)
+    start, stop = index_range
+    while start <= stop:
+        chunk_stop = min(start + chunk_size - 1, stop)
+        yield data.get_range(get_call, (start, chunk_stop), save=False)
+        start = chunk_stop + 1
+
+
+def plot_view(data, get_call, index_range=None, num_pixels=1000, chunk_size=None):
+    """
+    Get what to draw for a signal in a view without fetching more than the view needs.
+
+    Parameters
+    ----------
+    data : Data
+        Data object to get the signal with.
+    get_call : Get
+        Call for the signal.
+    index_range : None or tuple of two int, default=None
+        Indices from the start of the digitizer recording of the first and last sample in view. If None, view the whole signal.
+    num_pixels : int, default=1000
+        Number of pixels the view is drawn on.
+    chunk_size : None or int, default=None
+        Chunk size to build the pyramid with. See `get_pyramid`.
+
+    Returns
+    -------
+    indices : np.array
+        Indices from the start of the digitizer recording of the first sample in each point.
+    mins, maxs : np.array
+        Minimum and maximum of each point. These are the same if the view is at full resolution.
+
+    Notes
+    -----
+    Zoomed out views are served from the pyramid of the signal. When the
+    view has fewer samples than pixels, only the samples in view are fetched
+    at full resolution.
+    """
+    pyramid = get_pyramid(data, get_call, chunk_size)
+    if index_range is None:
+        raw_range = None
+    else:
+        raw_range = (
+            data.to_raw_index(index_range[0]),
+            data.to_raw_index(index_range[1]),
+        )
+    envelope = pyramid.view(raw_range, num_pixels)
+    offset = data.to_raw_index(0)
+    if envelope is not None:
+        indices, mins, maxs = envelope
+        return indices - offset, mins, maxs
+
+    if index_range is None:
+        index_range = (-offset, -offset + pyramid.length - 1)
+    signal = data.get_range(get_call, index_range, save=False)
+    indices = np.arange(index_range[0], index_range[0] + signal.size)
+    return indices, signal, signal
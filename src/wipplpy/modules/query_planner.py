@@ -0,0 +1,237 @@
+"""Merge requests for overlapping slices of the same signal into as few fetches as possible."""
+
+import logging
+from math import gcd
+
+import numpy as np
+
+
+class SliceRequest:
+    def __init__(self, get_call, index_range=None, sample_period=1):
+        """
+        Request for a slice of a signal.
+
+        Parameters
+        ----------
+        get_call : Get
+            Call for the signal.
+        index_range : None or tuple of two int, default=None
+            Indices of the first and last sample, including both ends like MDSplus ranges. If None, request the whole signal.
+        sample_period : int, default=1
+            Downsampling rate of the slice.
+        """
+        self.get_call = get_call
+        self.index_range = None if index_range is None else tuple(index_range)
+        self.sample_period = sample_period
+
+    def __repr__(self):
+        return (
+            f"SliceRequest({self.get_call}, {self.index_range}, {self.sample_period})"
+        )
+
+    @property
+    def start(self):
+        return 0 if self.index_range is None else self.index_range[0]
+
+    @property
+    def stop(self):
+        """Last index of the slice or None if the slice goes to the end of the signal."""
+        return None if self.index_range is None else self.index_range[1]
+
+
+class PlannedFetch:
+    def __init__(self, get_call, start, stop, sample_period):
+        """
+        Single fetch from the server that covers one or more slice requests.
+
+        Parameters
+        ----------
+        get_call : Get
+            Call for the signal.
+        start : int
+            Index of the first sample to fetch.
+        stop : int or None
+            Index of the last sample to fetch or None to fetch the whole signal. The start must be 0 if this is None.
+        sample_period : int
+            Downsampling rate of the fetch.
+
+        Attributes
+        ----------
+        requests : list of tuple
+            Pairs of the position of each request this fetch covers and the slice of the fetched array that serves it.
+        """
+        self.get_call = get_call
+        self.start = start
+        self.stop = stop
+        self.sample_period = sample_period
+        self.requests = []
+
+    def __repr__(self):
+        return f"PlannedFetch({self.get_call}, {self.index_range}, {self.sample_period}, {len(self.requests)} requests)"
+
+    @property
+    def index_range(self):
+        if self.stop is None:
+            return None
+        return (self.start, self.stop)
+
+    def local_slice(self, request):
+        """
+        Get the slice of the fetched array that gives a request.
+
+        Parameters
+        ----------
+        request : SliceRequest
+            Request covered by this fetch.
+
+        Returns
+        -------
+        slice
+            Basic slice so that indexing the fetched array gives a view instead of a copy.
+        """
+        return contained_slice(
+            (self.start, self.stop, self.sample_period),
+            (request.start, request.stop, request.sample_period),
+        )
+
+
+def contained_slice(entry, request):
+    """
+    Get the slice of a fetched part of a signal that gives a requested part of the signal.
+
+    Parameters
+    ----------
+    entry : tuple
+        Index of the first sample, index of the last sample or None for the end of the signal, and sample period of the fetched part.
+    request : tuple
+        Index of the first sample, index of the last sample or None for the end of the signal, and sample period of the requested part.
+
+    Returns
+    -------
+    slice or None
+        Basic slice so that indexing the fetched array gives a view instead of a copy. None if the fetched part doesn't contain the requested part.
+    """
+    entry_start, entry_stop, entry_period = entry
+    start, stop, period = request
+    if start < entry_start:
+        return None
+    if entry_stop is not None and (stop is None or stop > entry_stop):
+        return None
+    if period % entry_period != 0 or (start - entry_start) % entry_period != 0:
+        return None
+
+    step = period // entry_period
+    first = (start - entry_start) // entry_period
+    if stop is None:
+        return slice(first, None, step)
+    last = (stop - entry_start) // entry_period
+    return slice(first, last + 1, step)
+
+
+def _ends_before(stop, start, max_gap):
+    return stop is not None and stop + max_gap + 1 < start
+
+
+def plan_fetches(requests, max_gap=0):
+    """
+    Merge slice requests of each signal into the fewest fetches.
+
+    Parameters
+    ----------
+    requests : list of SliceRequest
+        Slices to get.
+    max_gap : int, default=0
+        Largest number of unrequested samples between two slices that are still merged into one fetch.
+
+    Returns
+    -------
+    list of PlannedFetch
+        Fetches that together cover every request.
+
+    Notes
+    -----
+    Slices of the same signal that overlap, are contained in one another, or
+    are separated by at most `max_gap` samples are merged. The merged fetch
+    uses the largest sample period that every merged slice is a multiple of
+    and lines up with, so each slice is a strided view of the fetch.
+    """
+    by_signal = {}
+    for position, request in enumerate(requests):
+        if not request.get_call.signal:
+            raise ValueError(
+                f"Can only plan fetches for signals but {request.get_call} is not a signal."
+            )
+        by_signal.setdefault(request.get_call.call_string, []).append(
+            (position, request)
+        )
+
+    fetches = []
+    for signal_requests in by_signal.values():
+        signal_requests.sort(key=lambda item: item[1].start)
+        groups = []
+        group_stop = None
+        for position, request in signal_requests:
+            if len(groups) == 0 or _ends_before(group_stop, request.start, max_gap):
+                groups.append([])
+                group_stop = request.stop
+            elif group_stop is not None:
+                group_stop = (
+                    None if request.stop is None else max(group_stop, request.stop)
+                )
+            groups[-1].append((position, request))
+
+        for group in groups:
+            start = group[0][1].start
+            stop = None
+            if all(request.stop is not None for _, request in group):
+                stop = max(request.stop for _, request in group)
+            else:
+                # Slices that go to the end of the signal are served from a fetch of the whole signal.
+                start = 0
+            sample_period = 0
+            for _, request in group:
+                sample_period = gcd(sample_period, request.sample_period)
+                sample_period = gcd(sample_period, request.start - start)
+
+            fetch = PlannedFetch(group[0][1].get_call, start, stop, sample_period)
+            for position, request in group:
+                fetch.requests.append((position, fetch.local_slice(request)))
+            fetches.append(fetch)
+
+    logging.debug(
+        f"Planned {len(fetches)} fetches to serve {len(requests)} slice requests."
+    )
+    return fetches
+
+
+def fetch_slices(data, requests, max_gap=0, np_data_type=np.float64):
+    """
+    Get many slices of signals using the fewest fetches from the server.
+
+    Parameters
+    ----------
+    data : Data
+        Data object to fetch with.
+    requests : list of SliceRequest
+        Slices to get.
+    max_gap : int, default=0
+        See `plan_fetches`.
+    np_data_type : data-type, default=np.float64
+        The numpy data type to change the data to.
+
+    Returns
+    -------
+    list of np.array
+        Data of each request in the same order as the requests. Each array is a view of a merged fetch.
+    """
+    results = [None] * len(requests)
+    for fetch in plan_fetches(requests, max_gap):
+        fetched = data.get_range(
+            fetch.get_call,
+            fetch.index_range,
+            fetch.sample_period,
+            np_data_type=np_data_type,
+        )
+        for position, local_slice in fetch.requests:
+            results[position] = fetched[local_slice]
+    return results
@@ -0,0 +1,294 @@
+"""Resample many signals from different digitizer timebases onto a common timebase with weights that are computed once per pair of timebases."""
+
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from wipplpy.modules.generic_get_data import Get
+from wipplpy.modules.timebase_registry import timebase_fingerprint
+
+RESAMPLE_METHODS = ("auto", "linear", "boxcar")
+# Number of sets of weights kept for reuse. The least recently used are forgotten first.
+RESAMPLE_CACHE_SIZE = 128
+# Source samples per target point above which the 'auto' method averages instead of interpolating.
+_BOXCAR_RATIO = 2
+# Fewest source times that can be interpolated between.
+_MIN_SOURCE_TIMES = 2
+
+_weights_cache = OrderedDict()
+_weights_cache_lock = threading.Lock()
+
+
+class ResampleWeights:
+    def __init__(self, source_times, target_times, method="auto"):
+        """
+        Weights that take signals on a source timebase onto a target timebase.
+
+        Parameters
+        ----------
+        source_times, target_times : np.array
+            Increasing times.
+        method : {"auto", "linear", "boxcar"}, default="auto"
+            'linear' interpolates between the two nearest source samples.
+            'boxcar' averages the source samples within half a target
+            spacing of each target point, which filters out what the target
+            spacing is too coarse to hold before downsampling. Target points
+            with no source samples in their bin, and those whose bin runs
+            past either end of the source timebase, are interpolated so that
+            the average isn't weighted to one side of the point. 'auto' uses
+            'boxcar' when there are at least two source samples for each
+            target point and 'linear' otherwise.
+
+        Notes
+        -----
+        Target points outside the source timebase are NaN.
+        """
+        if method not in RESAMPLE_METHODS:
+            raise ValueError(
+                f"Unknown method '{method}'. Possible methods are {RESAMPLE_METHODS}."
+            )
+        source_times = np.asarray(source_times, dtype=np.float64).ravel()
+        target_times = np.asarray(target_times, dtype=np.float64).ravel()
+        if source_times.size < _MIN_SOURCE_TIMES:
+            raise ValueError("Need at least two source times to resample.")
+        # Kept so that weights found by the fingerprints of timebases can be checked against the timebases themselves.
+        self.source_times = source_times
+        self.target_times = target_times
+        self.num_source = source_times.size
+        self.num_target = target_times.size
+        if method == "auto":
+            method = (
+                "boxcar"
+                if self.num_target > 1
+                and np.median(np.diff(target_times))
+                >= _BOXCAR_RATIO * np.median(np.diff(source_times))
+                else "linear"
+            )
+        self.method = method
+
+        last = source_times.size - 2
+        self._lower = np.clip(
+            np.searchsorted(source_times, target_times, side="right") - 1, 0, last
+        )
+        self._fraction = (target_times - source_times[self._lower]) / (
+            source_times[self._lower + 1] - source_times[self._lower]
+        )
+        self._outside = (target_times < source_times[0]) | (
+            target_times > source_times[-1]
+        )
+
+        self._starts = self._stops = None
+        if method == "boxcar" and self.num_target > 1:
+            midpoints = (target_times[1:] + target_times[:-1]) / 2
+            edges = np.concatenate(
+                (
+                    [2 * target_times[0] - midpoints[0]],
+                    midpoints,
+                    [2 * target_times[-1] - midpoints[-1]],
+                )
+            )
+            self._starts = np.searchsorted(source_times, edges[:-1], side="left")
+            self._stops = np.searchsorted(source_times, edges[1:], side="left")
+            # Bins cut off by an end of the source timebase would only average samples on one side of their point.
+            cut_off = (edges[:-1] < source_times[0]) | (edges[1:] > source_times[-1])
+            self._stops[cut_off] = self._starts[cut_off]
+
+    def __repr__(self):
+        return (
+            f"ResampleWeights({self.num_source} -> {self.num_target}, '{self.method}')"
+        )
+
+    def matches(self, source_times, target_times):
+        """
+        Check whether these weights are for the given timebases.
+
+        Parameters
+        ----------
+        source_times, target_times : np.array
+
+        Returns
+        -------
+        bool
+        """
+        return np.array_equal(
+            self.source_times, np.asarray(source_times).ravel()
+        ) and np.array_equal(self.target_times, np.asarray(target_times).ravel())
+
+    def apply(self, signals):
+        """
+        Resample signals that are on the source timebase.
+
+        Parameters
+        ----------
+        signals : np.array
+            Array whose last axis is on the source timebase, such as one signal or channels stacked into a 2D array.
+
+        Returns
+        -------
+        np.array
+            Float64 array with the last axis on the target timebase.
+        """
+        signals = np.asarray(signals)
+        if signals.shape[-1] != self.num_source:
+            raise ValueError(
+                f"Signals have {signals.shape[-1]} samples but the source timebase has {self.num_source}."
+            )
+        resampled = signals[..., self._lower] * (1 - self._fraction)
+        resampled += signals[..., self._lower + 1] * self._fraction
+        if self._starts is not None:
+            counts = self._stops - self._starts
+            filled = counts != 0
+            sums = np.zeros((*signals.shape[:-1], self.num_source + 1))
+            np.cumsum(signals, axis=-1, out=sums[..., 1:])
+            resampled[..., filled] = (
+                sums[..., self._stops[filled]] - sums[..., self._starts[filled]]
+            ) / counts[filled]
+        resampled[..., self._outside] = np.nan
+        return resampled
+
+
+def resample_weights(source_times, target_times, method="auto"):
+    """
+    Get the weights between two timebases, reusing them if they were already computed.
+
+    Parameters
+    ----------
+    source_times, target_times : np.array
+    method : str, default="auto"
+        See `ResampleWeights`.
+
+    Returns
+    -------
+    ResampleWeights
+
+    Notes
+    -----
+    Weights are keyed by the fingerprints of both timebases (see
+    `wipplpy.modules.timebase_registry.timebase_fingerprint`), so every
+    channel of a digitizer, and every shot recorded on the same clock,
+    shares one set of weights. Timebases with the same fingerprint but
+    different times, such as clocks with gaps, are told apart by comparing
+    them with the timebases of the cached weights.
+    """
+    key = (
+        timebase_fingerprint(source_times),
+        timebase_fingerprint(target_times),
+        method,
+    )
+    with _weights_cache_lock:
+        weights = _weights_cache.get(key)
+        if weights is not None:
+            _weights_cache.move_to_end(key)
+    if weights is not None and weights.matches(source_times, target_times):
+        return weights
+    weights = ResampleWeights(source_times, target_times, method)
+    with _weights_cache_lock:
+        _weights_cache[key] = weights
+        while len(_weights_cache) > RESAMPLE_CACHE_SIZE:
+            _weights_cache.popitem(last=False)
+    return weights
+
+
+def clear_resample_cache():
+    """Forget every set of cached weights."""
+    with _weights_cache_lock:
+        _weights_cache.clear()
+
+
+def resample(signals, source_times, target_times, method="auto"):
+    """
+    Resample signals from a source timebase onto a target timebase.
+
+    Parameters
+    ----------
+    signals : np.array
+        Array whose last axis is on the source timebase.
+    source_times, target_times : np.array
+    method : str, default="auto"
+        See `ResampleWeights`.
+
+    Returns
+    -------
+    np.array
+    """
+    return resample_weights(source_times, target_times, method).apply(signals)
+
+
+def _source_timebase(data, get_call, num_samples, timebases):
+    """
+    Get the timebase of a signal of a data object.
+
+    Timebases given for the whole digitizer record are cut down to the samples of the signal with `to_raw_index`.
+    """
+    if timebases is not None and get_call.call_string in timebases:
+        full_times = np.asarray(timebases[get_call.call_string])
+        raw_indices = data.to_raw_index(np.arange(full_times.size))
+        times = full_times[raw_indices >= 0][:: data.sample_period]
+        return times[:num_samples]
+    return np.asarray(
+        data.get(Get(f"dim_of({get_call.call_string})")), dtype=np.float64
+    )
+
+
+def resample_data(data, get_calls, target_times, method="auto", timebases=None):
+    """
+    Get signals of a data object and put them all on a common timebase.
+
+    Parameters
+    ----------
+    data : Data
+        Object to get the signals with. Signals are got in its `time_index_range` and `sample_period`.
+    get_calls : list of Get or str
+        Signals to resample.
+    target_times : np.array
+        Increasing times to resample onto.
+    method : str, default="auto"
+        See `ResampleWeights`.
+    timebases : dict or None, default=None
+        Timebases over the whole digitizer record keyed by call string, such as ones already loaded. Signals without one get their timebase with `dim_of`, which is shared between signals on the same digitizer clock.
+
+    Returns
+    -------
+    np.array
+        Array of shape `(len(get_calls), len(target_times))`.
+
+    Notes
+    -----
+    Signals on the same timebase are stacked and resampled together, so
+    each distinct timebase costs one vectorized pass and one set of
+    weights no matter how many channels share it.
+    """
+    get_calls = [
+        get_call if isinstance(get_call, Get) else Get(get_call)
+        for get_call in get_calls
+    ]
+    target_times = np.asarray(target_times, dtype=np.float64)
+    groups = {}
+    for i, get_call in enumerate(get_calls):
+        signal = np.asarray(data.get(get_call), dtype=np.float64).ravel()
+        times = _source_timebase(data, get_call, signal.size, timebases)
+        if times.size != signal.size:
+            raise ValueError(
+                f"Signal '{get_call.call_string}' has {signal.size} samples but its timebase has {times.size}."
+            )
+        # Timebases with the same fingerprint are only grouped if they are the same.
+        same_fingerprint = groups.setdefault(timebase_fingerprint(times), [])
+        for group in same_fingerprint:
+            if np.array_equal(group[0], times):
+                break
+        else:
+            group = (times, [], [])
+            same_fingerprint.append(group)
+        group[1].append(i)
+        group[2].append(signal)
+    groups = [group for same in groups.values() for group in same]
+
+    resampled = np.empty((len(get_calls), target_times.size))
+    for times, indices, signals in groups:
+        resampled[indices] = resample(np.stack(signals), times, target_times, method)
+    logging.debug(
+        f"Resampled {len(get_calls)} signals from {len(groups)} timebases onto {target_times.size} points."
+    )
+    return resampled
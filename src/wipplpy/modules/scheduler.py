@@ -0,0 +1,241 @@
+"""Queue gets on many data objects and run them grouped by shot so that each tree is opened once."""
+
+import logging
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+from wipplpy.modules.shot_loader import default_location, open_tree_location
+
+
+class _Request:
+    def __init__(self, data, method, args, kwargs):
+        self.data = data
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+
+def tree_location(data):
+    """
+    Get the server, tree, and shot that a data object gets its data from.
+
+    Parameters
+    ----------
+    data : Data
+
+    Returns
+    -------
+    tuple
+        Server name, tree name, and shot number.
+    """
+    tree_name = data.tree_name
+    server_name = data.server_name
+    if tree_name is None or server_name is None:
+        default_tree_name, default_server_name = default_location()
+        tree_name = default_tree_name if tree_name is None else tree_name
+        server_name = default_server_name if server_name is None else server_name
+    return (server_name, tree_name, data.shot_number)
+
+
+class GetScheduler:
+    def __init__(self):
+        """
+        Queue gets on many data objects and run them so that the tree of each shot is opened as few times as possible.
+
+        Attributes
+        ----------
+        stats : dict
+            Number of requests that were run and number of groups they were run in. Each group needs at most one tree to be opened.
+
+        Notes
+        -----
+        There is only one open tree in a process so gets that alternate
+        between shots reopen the tree every time. Queued requests are
+        grouped by server, tree, and shot and each group is run together.
+        The group for the tree that is already open is run first and groups
+        on the same server are run one after the other. Each request gets
+        its own future so callers see their own results in any order.
+
+        Examples
+        --------
+        >>> from wipplpy.modules.generic_get_data import Data, Get
+        >>> class Shot(Data):
+        ...     def __init__(self, shot_number):
+        ...         super().__init__(shot_number, [], [], time_index_range=(0, 999))
+        >>> with GetScheduler() as scheduler:
+        ...     first = scheduler.submit(Shot(1160927001), Get(r"\\ip"))
+        ...     second = scheduler.submit(Shot(1160927002), Get(r"\\ip"))
+        >>> difference = first.result() - second.result()  # Both are 1000 samples.
+        """
+        self._queue = []
+        self._queue_lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self.stats = {"requests": 0, "groups": 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.run()
+        else:
+            self.cancel()
+
+    def submit(self, data, get_call, np_data_type=np.float64, change_data=True):
+        """
+        Queue a `Data.get`.
+
+        Parameters
+        ----------
+        data : Data
+            Data object to get with.
+        get_call : Get or str
+        np_data_type : data-type, default=np.float64
+        change_data : bool, default=True
+
+        Returns
+        -------
+        Future
+            Holds the data once the scheduler is run.
+        """
+        return self._submit(
+            data,
+            data.get,
+            (get_call,),
+            {"np_data_type": np_data_type, "change_data": change_data},
+        )
+
+    def submit_range(  # noqa: PLR0913
+        self,
+        data,
+        get_call,
+        index_range,
+        sample_period=1,
+        np_data_type=np.float64,
+        change_data=True,
+    ):
+        """
+        Queue a `Data.get_range`.
+
+        Parameters
+        ----------
+        data : Data
+            Data object to get with.
+        get_call : Get
+        index_range : None or tuple of two int
+        sample_period : int, default=1
+        np_data_type : data-type, default=np.float64
+        change_data : bool, default=True
+
+        Returns
+        -------
+        Future
+            Holds the data once the scheduler is run.
+        """
+        return self._submit(
+            data,
+            data.get_range,
+            (get_call, index_range, sample_period),
+            {"np_data_type": np_data_type, "change_data": change_data},
+        )
+
+    def _submit(self, data, method, args, kwargs):
+        request = _Request(data, method, args, kwargs)
+        with self._queue_lock:
+            self._queue.append(request)
+        return request.future
+
+    def get_many(self, requests):
+        """
+        Get many calls across data objects and return their data in order.
+
+        Parameters
+        ----------
+        requests : list of tuple
+            Pairs of a data object and a get call.
+
+        Returns
+        -------
+        list
+            Data of each request.
+        """
+        futures = [self.submit(data, get_call) for data, get_call in requests]
+        self.run()
+        return [future.result() for future in futures]
+
+    def cancel(self):
+        """Cancel every queued request that hasn't run."""
+        with self._queue_lock:
+            queue = self._queue
+            self._queue = []
+        for request in queue:
+            request.future.cancel()
+
+    def _order_groups(self, queue):
+        """
+        Group requests by the tree they need and order the groups to open the fewest trees.
+
+        Parameters
+        ----------
+        queue : list of _Request
+
+        Returns
+        -------
+        list of tuple
+            Pairs of the location of each group and its requests.
+        """
+        groups = {}
+        for request in queue:
+            groups.setdefault(tree_location(request.data), []).append(request)
+
+        # Keep groups on the same server together in the order their servers were first asked for.
+        servers = list(dict.fromkeys(location[0] for location in groups))
+        open_location = open_tree_location()
+        if open_location is not None and open_location[0] in servers:
+            servers.remove(open_location[0])
+            servers.insert(0, open_location[0])
+
+        def sort_key(location):
+            return (servers.index(location[0]), location != open_location)
+
+        return [
+            (location, groups[location]) for location in sorted(groups, key=sort_key)
+        ]
+
+    def run(self):
+        """
+        Run every queued request, one group of requests for the same server, tree, and shot at a time.
+
+        Notes
+        -----
+        Errors are set on the future of the request that raised them and don't stop other requests.
+        """
+        with self._run_lock:
+            with self._queue_lock:
+                queue = self._queue
+                self._queue = []
+            if len(queue) == 0:
+                return
+
+            ordered_groups = self._order_groups(queue)
+            logging.debug(
+                f"Running {len(queue)} queued gets in {len(ordered_groups)} groups."
+            )
+            for location, requests in ordered_groups:
+                logging.debug(
+                    f"Running {len(requests)} gets for shot {location[2]} on tree '{location[1]}' on server {location[0]}."
+                )
+                self.stats["groups"] += 1
+                for request in requests:
+                    if not request.future.set_running_or_notify_cancel():
+                        continue
+                    self.stats["requests"] += 1
+                    try:
+                        result = request.method(*request.args, **request.kwargs)
+                    except Exception as e:
+                        request.future.set_exception(e)
+                    else:
+                        request.future.set_result(result)
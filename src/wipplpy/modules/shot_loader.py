@@ -1,18 +1,161 @@
 """Load a shot from an MDSplus tree using a local or remote connection."""
 
+import contextlib
 import json
 import logging
+import math
 import os
+import socket
+import threading
+import time
+from datetime import date
 
 import MDSplus as mds
 from MDSplus.mdsExceptions import MDSplusException, SsSUCCESS
 
+from wipplpy.modules.connection import route_is_local
+from wipplpy.modules.deadlines import (
+    DeadlineExceeded,
+    call_with_deadline,
+    get_deadlines,
+)
+
 # TODO: Add MySQL Connection object.
 _mds_connection = None
 _global_tree = None
+# Whether trees of servers that are this host are opened directly instead of through an mdsip connection. Off by default so that trees are only opened locally when asked for.
+prefer_local_trees = False
+# Whether each server is this host.
+_local_servers = {}
+# Seconds that a server whose trees could not be opened locally is only reached through a connection.
+LOCAL_FAILURE_TTL = 600.0
+# When opening a tree of each server locally last failed so that it isn't tried locally again for a while.
+_local_failures = {}
+# Seconds between keepalive probes of an idle connection when none is given to `start_keepalive`.
+DEFAULT_KEEPALIVE_INTERVAL = 30.0
+# Held while a thread opens a tree on the global connection and makes calls on it so that another thread can't switch the open tree in between.
+_connection_lock = threading.RLock()
+# Number of calls running on the global connection and when the last one finished, so that keepalive probes only go to idle connections.
+_activity = threading.Condition()
+_calls_in_flight = 0
+_probing = False
+_last_used = time.monotonic()
+_keepalive_thread = None
+_keepalive_stop = None
+
+
+class LocalTree:
+    def __init__(self, tree_name, shot_number, server_name):
+        """
+        Tree opened directly from the tree files on this host that is used like a tree opened on an `mds.Connection`.
+
+        Parameters
+        ----------
+        tree_name : str
+        shot_number : int
+        server_name : str
+            Server the tree belongs to. It is kept so that the tree can be opened again the same way.
+
+        Notes
+        -----
+        Calls are evaluated by TDI in this process so there is no socket
+        round trip or serialization. Results are the same MDSplus data
+        objects that a connection returns so `.data()` gives numpy arrays.
+        """
+        self.hostspec = server_name
+        self.openTree(tree_name, shot_number)
+
+    def __repr__(self):
+        return f"LocalTree('{self.tree_name}', {self.shot_number}, '{self.hostspec}')"
+
+    def openTree(self, tree_name, shot_number):
+        self._tree = mds.Tree(tree_name, shot_number, "READONLY")
+        self.tree_name = tree_name
+        self.shot_number = shot_number
+
+    def closeAllTrees(self):
+        self._tree = None
+
+    def get(self, expression, *args):
+        """
+        Evaluate a TDI expression in the context of the tree.
+
+        Parameters
+        ----------
+        expression : str
+        *args
+            Arguments substituted into the expression.
+
+        Returns
+        -------
+        MDSplus data-type
+        """
+        return self._tree.tdiExecute(expression, *args)
+
+
+def is_local_server(server_name):
+    """
+    Check whether a server is this host.
+
+    Parameters
+    ----------
+    server_name : str
+        Server name or address, optionally with a port.
+
+    Returns
+    -------
+    bool
+    """
+    if server_name in _local_servers:
+        return _local_servers[server_name]
+
+    host = server_name.rsplit(":", 1)[0] if server_name.count(":") == 1 else server_name
+    host = host.strip("[]").lower()
+    local_names = {"localhost", socket.gethostname().lower(), socket.getfqdn().lower()}
+    is_local = host in local_names
+    if not is_local:
+        try:
+            server_addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+            local_addresses = {
+                info[4][0] for info in socket.getaddrinfo(socket.gethostname(), None)
+            }
+        except OSError:
+            server_addresses = set()
+            local_addresses = set()
+        is_local = any(
+            address.startswith("127.") or address == "::1"
+            for address in server_addresses
+        ) or not server_addresses.isdisjoint(local_addresses)
+    logging.debug(f"Server {server_name} is {'' if is_local else 'not '}this host.")
+    _local_servers[server_name] = is_local
+    return is_local
+
+
+def _use_local_tree(server_name, local):
+    if local is not None:
+        return local
+    if not prefer_local_trees or _local_failed_recently(server_name):
+        return False
+    # Use what the machine connection classes found last time they connected to this server.
+    remembered = route_is_local(server_name)
+    if remembered is not None:
+        return remembered
+    return is_local_server(server_name)
+
+
+def _local_failed_recently(server_name):
+    """Check whether opening a tree of a server locally failed less than `LOCAL_FAILURE_TTL` seconds ago."""
+    failed_at = _local_failures.get(server_name)
+    if failed_at is None:
+        return False
+    if time.monotonic() - failed_at > LOCAL_FAILURE_TTL:
+        logging.debug(f"Trying trees of {server_name} locally again.")
+        _local_failures.pop(server_name, None)
+        return False
+    return True
 
 
-def get_connector(server_name, reconnect=False):
+def get_connector(server_name, reconnect=False, timeout=None):
     """
     Get the MDSplus connector for a remote connection.
 
@@ -22,6 +165,8 @@ def get_connector(server_name, reconnect=False):
         Server ip address.
     reconnect : bool, default=False
         Whether to force a reconnection to the server.
+    timeout : float or None, default=None
+        Seconds to wait for a new connection to be made. If None, wait forever.
 
     Returns
     -------
@@ -32,7 +177,9 @@ def get_connector(server_name, reconnect=False):
     if reconnect:
         logging.debug("Forcing reconnection to server.")
         try:
-            _mds_connection.closeAllTrees()
+            call_with_deadline(
+                _mds_connection.closeAllTrees, timeout, "closing old trees"
+            )
         except Exception as e:
             logging.debug(
                 f"Tried to close all trees from old connection. Exception occurred but ignoring. Exception was:\n{e}"
@@ -52,12 +199,64 @@ def get_connector(server_name, reconnect=False):
     logging.debug(
         f"Trying to make connection to {server_name}. If this takes a while you may have forgotten to use the UW VPN."
     )
-    _mds_connection = mds.Connection(server_name)
+    try:
+        _mds_connection = call_with_deadline(
+            mds.Connection, timeout, f"connecting to {server_name}", server_name
+        )
+    except DeadlineExceeded:
+        _mds_connection = None
+        logging.error(f"Timed out after {timeout} s connecting to {server_name}.")
+        raise
     logging.info(f"Connected to {server_name}.")
     return _mds_connection
 
 
-def get_remote_shot_tree(  # noqa: PLR0912
+def default_location(
+    load_config_path=os.path.join(
+        os.path.realpath(os.path.dirname(__file__)), "shot_loading_config.json"
+    ),
+):
+    """
+    Get the tree and server name to use when none are given from the shot_loading_config.json.
+
+    Parameters
+    ----------
+    load_config_path : str, default='brb_operations/analysis/modules/shot_loading_config.json'
+        Path to file for loading the config.
+
+    Returns
+    -------
+    tree_name, server_name : str
+    """
+    try:
+        with open(load_config_path) as config_file:
+            logging.debug(f"Successfully opened '{load_config_path}'.")
+            config = json.load(config_file)
+    except (
+        OSError
+    ):  # TODO: Change this to FileNotFoundError once code moved to python3.
+        logging.error(
+            f"Could not find shot_loading config file at '{load_config_path}'."
+        )
+        raise
+    return config["tree_name"], config["server_name"]
+
+
+def open_tree_location():
+    """
+    Get where the global tree is open.
+
+    Returns
+    -------
+    tuple or None
+        Server name, tree name, and shot number of the global tree or None if no tree is open.
+    """
+    if not isinstance(_global_tree, (mds.Connection, LocalTree)):
+        return None
+    return (_global_tree.hostspec, _global_tree.tree_name, _global_tree.shot_number)
+
+
+def get_remote_shot_tree(  # noqa: PLR0912, PLR0913
     shot_number,
     tree_name=None,
     server_name=None,
@@ -65,6 +264,8 @@ def get_remote_shot_tree(  # noqa: PLR0912
         os.path.realpath(os.path.dirname(__file__)), "shot_loading_config.json"
     ),
     reconnect=False,
+    deadlines=None,
+    local=None,
 ):
     """
     Get the MDSplus tree from a remote server for a specific shot number. By default load the tree and server name from the shot_loading_config.json.
@@ -81,32 +282,24 @@ def get_remote_shot_tree(  # noqa: PLR0912
         Path to file for loading the config.
     reconnect : bool, default=False
         Whether to force a reconnection to the server. This is used if the connection dies.
+    deadlines : dict or None, default=None
+        Deadlines for connecting and opening the tree that change the defaults in `wipplpy.modules.deadlines.DEFAULT_DEADLINES`.
+    local : bool or None, default=None
+        Whether to open the tree directly from the tree files on this host instead of through a connection. If None, do so when `prefer_local_trees` is True and the server is this host or the connection classes last reached it locally.
 
     Returns
     -------
-    mds.Connection
+    mds.Connection or LocalTree
     """
     if server_name is None or tree_name is None:
-        try:
-            with open(load_config_path) as config_file:
-                logging.debug(f"Successfully opened '{load_config_path}'.")
-                config = json.load(config_file)
-        except (
-            OSError
-        ):  # TODO: Change this to FileNotFoundError once code moved to python3.
-            logging.error(
-                f"Could not find shot_loading config file at '{load_config_path}'."
-            )
-            raise
-
-    if server_name is None:
-        server_name = config["server_name"]
-
-    if tree_name is None:
-        tree_name = config["tree_name"]
+        default_tree_name, default_server_name = default_location(load_config_path)
+        if server_name is None:
+            server_name = default_server_name
+        if tree_name is None:
+            tree_name = default_tree_name
 
     global _global_tree  # noqa: PLW0603
-    if isinstance(_global_tree, mds.Connection) and not reconnect:
+    if isinstance(_global_tree, (mds.Connection, LocalTree)) and not reconnect:
         if (
             _global_tree.hostspec == server_name
             and _global_tree.tree_name == tree_name
@@ -121,17 +314,28 @@ def get_remote_shot_tree(  # noqa: PLR0912
                 "Found pre-existing tree with different server and/or tree and/or shot number. Getting new tree."
             )
 
-    connection = get_connector(server_name, reconnect)
+    deadlines = get_deadlines(deadlines)
+    if _use_local_tree(server_name, local):
+        tree = _open_local_shot_tree(
+            tree_name, shot_number, server_name, local, deadlines["open_tree"]
+        )
+        if tree is not None:
+            _global_tree = tree
+            return _global_tree
+
+    connection = get_connector(server_name, reconnect, timeout=deadlines["connect"])
 
     logging.debug(
         f"Getting shot {shot_number} on tree {tree_name} on server {server_name}."
     )
     try:
-        connection.openTree(tree_name, shot_number)
+        _open_tree(connection, tree_name, shot_number, deadlines["open_tree"])
     except SsSUCCESS:
         try:
-            connection = get_connector(server_name, reconnect=True)
-            connection.openTree(tree_name, shot_number)
+            connection = get_connector(
+                server_name, reconnect=True, timeout=deadlines["connect"]
+            )
+            _open_tree(connection, tree_name, shot_number, deadlines["open_tree"])
         except MDSplusException:
             logging.exception(
                 f"Error opening shot #{shot_number} on tree '{tree_name}' after retrying connection."
@@ -153,18 +357,385 @@ def get_remote_shot_tree(  # noqa: PLR0912
     return _global_tree
 
 
-def most_recent_shot():
+def _open_local_shot_tree(tree_name, shot_number, server_name, local, timeout):
+    """
+    Open a tree from the tree files on this host.
+
+    Parameters
+    ----------
+    tree_name : str
+    shot_number : int
+    server_name : str
+    local : bool or None
+        If True, raise errors opening the tree. Otherwise stop trying to open trees of the server locally after an error.
+    timeout : float or None
+        Seconds to wait for the tree to open. If None, wait forever.
+
+    Returns
+    -------
+    LocalTree or None
+        The tree or None if it could not be opened.
+    """
+    try:
+        tree = call_with_deadline(
+            LocalTree,
+            timeout,
+            f"opening shot #{shot_number} on local tree '{tree_name}'",
+            tree_name,
+            shot_number,
+            server_name,
+        )
+    except Exception as e:
+        if local:
+            raise
+        logging.warning(
+            f"Could not open shot #{shot_number} on tree '{tree_name}' locally. Using a connection to {server_name} for the next {LOCAL_FAILURE_TTL:.0f} s. Exception was:\n{e}"
+        )
+        _local_failures[server_name] = time.monotonic()
+        return None
+
+    if shot_number == 0:
+        tree.shot_number = int(tree.get("$shot"))
+    logging.info(f"Opened shot {shot_number} tree locally.")
+    return tree
+
+
+def _open_tree(connection, tree_name, shot_number, timeout):
+    """
+    Open a tree on a connection and forget the connection if opening the tree times out.
+
+    Parameters
+    ----------
+    connection : mds.Connection
+    tree_name : str
+    shot_number : int
+    timeout : float or None
+        Seconds to wait for the tree to open. If None, wait forever.
+    """
+    global _mds_connection, _global_tree  # noqa: PLW0603
+    try:
+        with connection_in_use():
+            call_with_deadline(
+                connection.openTree,
+                timeout,
+                f"opening shot #{shot_number} on tree '{tree_name}'",
+                tree_name,
+                shot_number,
+            )
+    except DeadlineExceeded:
+        # The connection may be stuck so don't use it again.
+        logging.error(
+            f"Timed out after {timeout} s opening shot #{shot_number} on tree '{tree_name}'. Dropping the connection."
+        )
+        if _mds_connection is connection:
+            _mds_connection = None
+        if _global_tree is connection:
+            _global_tree = None
+        raise
+
+
+def is_run_day_shot(shot_number):
+    """
+    Check whether a shot was taken today, going by MST's shot syntax.
+
+    Parameters
+    ----------
+    shot_number : int
+
+    Returns
+    -------
+    bool
+
+    Notes
+    -----
+    MST shot numbers are the date followed by three digits for the shot of
+    the day, so '1230419031' is shot 31 of April 19, 2023. Data of run-day
+    shots is still being written and is kept on its own server.
+    """
+    date_today = date.today()
+    millenium_index = math.floor(date_today.year / 1000) - 1
+    date_mst_syntax = str(millenium_index) + date_today.strftime("%y%m%d")
+    return str(shot_number)[:-3] == date_mst_syntax
+
+
+def most_recent_shot(tree_name=None, server_name=None, deadlines=None):
     """
     Get the most recent shot number from MDSplus.
 
+    Parameters
+    ----------
+    tree_name, server_name : str, default=None
+        Tree and server to look on. By default load from config file.
+    deadlines : dict or None, default=None
+        See `get_remote_shot_tree`.
+
     Returns
     -------
     int
         Most recent shot number.
     """
     try:
-        tree = get_remote_shot_tree(0)
+        tree = get_remote_shot_tree(
+            0, tree_name=tree_name, server_name=server_name, deadlines=deadlines
+        )
     except SsSUCCESS:
-        tree = get_remote_shot_tree(0, reconnect=True)
+        tree = get_remote_shot_tree(
+            0,
+            tree_name=tree_name,
+            server_name=server_name,
+            reconnect=True,
+            deadlines=deadlines,
+        )
 
     return tree.shot_number
+
+
+@contextlib.contextmanager
+def connection_in_use():
+    """
+    Use the global connection alone while opening a tree and making calls on it.
+
+    Other threads, such as those getting variables in the background, wait
+    so that they can't open another shot between opening a tree and
+    getting from it. Keepalive probes don't use the connection while it is
+    busy. Calls wait for a probe that is already running, which takes at
+    most the `probe` deadline. This can be nested within one thread.
+    """
+    global _calls_in_flight, _last_used  # noqa: PLW0603
+    with _connection_lock:
+        with _activity:
+            while _probing:
+                _activity.wait()
+            _calls_in_flight += 1
+        try:
+            yield
+        finally:
+            with _activity:
+                _calls_in_flight -= 1
+                _last_used = time.monotonic()
+                _activity.notify_all()
+
+
+def is_stale(tree):
+    """
+    Check whether a tree's connection was replaced because a keepalive probe found it dead.
+
+    Parameters
+    ----------
+    tree : mds.Connection or LocalTree
+
+    Returns
+    -------
+    bool
+    """
+    return getattr(tree, "stale", False)
+
+
+def _reopen(connection, deadlines):
+    """Replace a dead global connection with a new one and reopen its tree."""
+    server_name = connection.hostspec
+    had_tree = _global_tree is connection
+    connection.stale = True
+    if had_tree:
+        get_remote_shot_tree(
+            connection.shot_number,
+            tree_name=connection.tree_name,
+            server_name=server_name,
+            reconnect=True,
+            deadlines=deadlines,
+        )
+    else:
+        get_connector(server_name, reconnect=True, timeout=deadlines["connect"])
+
+
+def probe_connection(idle_time=0.0, deadlines=None):
+    """
+    Send a cheap call on the global connection and reconnect if it fails.
+
+    Parameters
+    ----------
+    idle_time : float, default=0.0
+        Only probe if no call has used the connection for this many seconds. Connections that are in use are known to be alive.
+    deadlines : dict or None, default=None
+        See `get_remote_shot_tree`. The `probe` deadline limits how long the probe can take.
+
+    Returns
+    -------
+    bool or None
+        True if the connection answered, False if it was dead and was replaced, and None if there was nothing to probe.
+    """
+    global _probing  # noqa: PLW0603
+    connection = _mds_connection
+    if not isinstance(connection, mds.Connection):
+        return None
+    with _activity:
+        if _probing or _calls_in_flight != 0:
+            return None
+        if time.monotonic() - _last_used < idle_time:
+            return None
+        _probing = True
+    deadlines = get_deadlines(deadlines)
+    try:
+        # `$shot` also checks that the open tree is still usable.
+        expression = "$shot" if _global_tree is connection else "1"
+        call_with_deadline(
+            connection.get,
+            deadlines["probe"],
+            f"probing the connection to {connection.hostspec}",
+            expression,
+        )
+        logging.debug(f"Connection to {connection.hostspec} is alive.")
+        return True
+    except (MDSplusException, DeadlineExceeded, OSError) as e:
+        logging.warning(
+            f"Connection to {connection.hostspec} did not answer a keepalive probe. Reconnecting. Exception was:\n{e}"
+        )
+    finally:
+        with _activity:
+            _probing = False
+            _activity.notify_all()
+
+    try:
+        with connection_in_use():
+            _reopen(connection, deadlines)
+    except Exception:
+        logging.exception(f"Could not reconnect to {connection.hostspec}.")
+    return False
+
+
+def start_keepalive(interval=DEFAULT_KEEPALIVE_INTERVAL, deadlines=None):
+    """
+    Probe the global connection in a background thread whenever it has been idle for an interval.
+
+    Parameters
+    ----------
+    interval : float, default=DEFAULT_KEEPALIVE_INTERVAL
+        Seconds a connection can be idle before it is probed.
+    deadlines : dict or None, default=None
+        See `probe_connection`.
+
+    Notes
+    -----
+    A connection that dropped while idle is otherwise only found when the
+    next call raises `SsSUCCESS` or times out, which costs the call, a
+    backoff, and a reconnect while the user waits. Probing finds it in the
+    background and replaces it so the next call goes straight to a live
+    connection. Data objects holding the dead connection see that it is
+    stale and switch to the new one. Starting the keepalive again changes
+    its interval.
+    """
+    global _keepalive_thread, _keepalive_stop  # noqa: PLW0603
+    if interval <= 0:
+        raise ValueError("The keepalive interval must be positive.")
+    stop_keepalive()
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval / 2):
+            try:
+                probe_connection(interval, deadlines)
+            except Exception:
+                logging.exception("Keepalive probe failed.")
+
+    _keepalive_stop = stop
+    _keepalive_thread = threading.Thread(
+        target=run, name="wipplpy: connection keepalive", daemon=True
+    )
+    _keepalive_thread.start()
+    logging.debug(f"Started connection keepalive every {interval} s of idle time.")
+
+
+def stop_keepalive():
+    """Stop the keepalive thread started by `start_keepalive` if it is running."""
+    global _keepalive_thread, _keepalive_stop  # noqa: PLW0603
+    if _keepalive_thread is None:
+        return
+    _keepalive_stop.set()
+    _keepalive_thread.join()
+    _keepalive_thread = None
+    _keepalive_stop = None
+
+
+def _warm_trees(shot_numbers, tree_name, server_name, deadlines):
+    """Open the trees of shots on a connection of their own so that the server has read their files."""
+    try:
+        connection = call_with_deadline(
+            mds.Connection,
+            deadlines["connect"],
+            f"connecting to {server_name}",
+            server_name,
+        )
+    except Exception as e:
+        logging.warning(f"Could not connect to {server_name} to warm up trees: {e}")
+        return
+    for shot_number in shot_numbers:
+        try:
+            call_with_deadline(
+                connection.openTree,
+                deadlines["open_tree"],
+                f"opening shot #{shot_number} on tree '{tree_name}'",
+                tree_name,
+                shot_number,
+            )
+        except DeadlineExceeded:
+            logging.warning(
+                f"Timed out warming up shot #{shot_number}. Not warming up the rest."
+            )
+            return
+        except MDSplusException as e:
+            logging.warning(f"Could not warm up shot #{shot_number}: {e}")
+    with contextlib.suppress(Exception):
+        connection.closeAllTrees()
+    logging.debug(f"Warmed up {len(shot_numbers)} trees on {server_name}.")
+
+
+def warm_up(shot_numbers, tree_name=None, server_name=None, deadlines=None):
+    """
+    Connect and open trees ahead of time for shots that are about to be loaded.
+
+    Parameters
+    ----------
+    shot_numbers : list of int
+        Shots in the order they will be loaded.
+    tree_name, server_name : str or None, default=None
+        Tree and server of the shots. By default load from config file.
+    deadlines : dict or None, default=None
+        See `get_remote_shot_tree`.
+
+    Returns
+    -------
+    threading.Thread or None
+        Thread opening the trees of the shots after the first, or None if there are none.
+
+    Notes
+    -----
+    The global connection is made and the first shot's tree is opened
+    before returning. Trees of the other shots are opened one after another
+    in a background thread on a separate connection so that the global
+    connection stays free. Opening a tree has the server read its files, so
+    opening it again when the shot is loaded is fast.
+    """
+    shot_numbers = list(shot_numbers)
+    if len(shot_numbers) == 0:
+        return None
+    if server_name is None or tree_name is None:
+        default_tree_name, default_server_name = default_location()
+        server_name = default_server_name if server_name is None else server_name
+        tree_name = default_tree_name if tree_name is None else tree_name
+
+    tree = get_remote_shot_tree(
+        shot_numbers[0],
+        tree_name=tree_name,
+        server_name=server_name,
+        deadlines=deadlines,
+    )
+    if isinstance(tree, LocalTree) or len(shot_numbers) == 1:
+        return None
+    thread = threading.Thread(
+        target=_warm_trees,
+        args=(shot_numbers[1:], tree_name, server_name, get_deadlines(deadlines)),
+        name=f"wipplpy: warming up trees on {server_name}",
+        daemon=True,
+    )
+    thread.start()
+    return thread
@@ -0,0 +1,110 @@
+"""Coalesce identical calls that are made at the same time so that only one of them does the work."""
+
+import logging
+import threading
+
+import numpy as np
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.num_waiting = 0
+
+
+def _read_only(result):
+    """Get a read-only view of a shared numpy array or the result unchanged if it isn't one."""
+    if not isinstance(result, np.ndarray):
+        return result
+    view = result.view()
+    view.setflags(write=False)
+    return view
+
+
+class SingleFlight:
+    def __init__(self):
+        """
+        Run only one call at a time for each key and give its result to every caller that asked for the same key while it ran.
+
+        Examples
+        --------
+        >>> flight = SingleFlight()
+        >>> flight.do(("shot", "call"), lambda: 1)
+        1
+        """
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, function, *args, **kwargs):
+        """
+        Call a function unless a call with the same key is running, in which case wait for that call instead.
+
+        Parameters
+        ----------
+        key : Hashable
+            Key identifying identical calls.
+        function : function
+            Function to call.
+        *args, **kwargs
+            Arguments to call the function with.
+
+        Returns
+        -------
+        Result of the function call. Callers that waited on another call get a read-only view of it if it is a numpy array so that they can't change the array the caller that made the call has.
+
+        Raises
+        ------
+        Exception
+            Any exception raised by the function call is raised for every caller waiting on it.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                call.num_waiting += 1
+
+        if not is_leader:
+            logging.debug(f"Waiting on call already in flight for key {key}.")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return _read_only(call.result)
+
+        try:
+            call.result = function(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.num_waiting != 0:
+                logging.debug(
+                    f"Sharing result of call for key {key} with {call.num_waiting} other callers."
+                )
+            call.done.set()
+
+    def in_flight(self, key):
+        """
+        Check whether a call for a key is currently running.
+
+        Parameters
+        ----------
+        key : Hashable
+
+        Returns
+        -------
+        bool
+        """
+        with self._lock:
+            return key in self._calls
+
+
+# Calls to MDSplus servers that are in flight for every Data object in this process.
+in_flight_fetches = SingleFlight()
@@ -0,0 +1,482 @@
+"""Compute spectra, cross spectra, coherence, and spectrograms of signals too long to hold in memory by fetching them in chunks."""
+
+import logging
+
+import numpy as np
+from MDSplus.mdsExceptions import MDSplusException
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import get_window
+
+from wipplpy.modules.generic_get_data import MultiGet
+from wipplpy.modules.pyramid import signal_index_range
+
+# Bytes that the samples, segments, and Fourier transforms of one chunk of all channels are kept under by default.
+DEFAULT_MEMORY_BUDGET = 256 * 2**20
+
+
+def sample_rate_of(data, get_call):
+    """
+    Get the sample rate of a signal of a data object from the first two samples of its timebase.
+
+    Parameters
+    ----------
+    data : Data
+    get_call : Get
+
+    Returns
+    -------
+    float
+        Samples per second of the signal after downsampling by the sample period of the data object.
+    """
+    times = data.get(f"DIM_OF( {get_call.call_string} )[0 : 1]")
+    return 1 / ((times[1] - times[0]) * data.sample_period)
+
+
+def _common_index_range(data, get_calls, index_range):
+    """Get the index range that every signal has data in."""
+    if index_range is not None:
+        return tuple(index_range)
+    ranges = [signal_index_range(data, get_call) for get_call in get_calls]
+    return (max(r[0] for r in ranges), min(r[1] for r in ranges))
+
+
+def _segments_per_block(num_channels, segment_length, memory_budget):
+    """Get how many segments of every channel to transform at once to stay under the memory budget."""
+    # The samples, the detrended and windowed segments, and their transforms each take about 8 bytes per sample of a segment. Leave room for one more copy.
+    bytes_per_segment = 4 * 8 * num_channels * segment_length
+    return max(1, int(memory_budget // bytes_per_segment))
+
+
+def _fetch_chunk(data, get_calls, index_range, sample_period, np_data_type):
+    """
+    Fetch the same samples of every signal without keeping them in the saved calls.
+
+    Returns
+    -------
+    np.array
+        Array with a row for each signal, cut to the length of the shortest signal.
+
+    Notes
+    -----
+    Every signal is fetched in one call. If that fails or any signal ends
+    before the index range does, the signals are fetched one at a time
+    instead since their samples can't be told apart in one array.
+    """
+    num_samples = len(range(index_range[0], index_range[1] + 1, sample_period))
+    multi_get = MultiGet([get_call.call_string for get_call in get_calls])
+    try:
+        chunk = data.get_range(
+            multi_get, index_range, sample_period, np_data_type, save=False
+        )
+    except (ValueError, MDSplusException) as e:
+        logging.debug(
+            f"Fetching {len(get_calls)} signals in one call failed. Fetching them one at a time. Exception was:\n{e}"
+        )
+    else:
+        if chunk.shape == (len(get_calls), num_samples):
+            return chunk
+
+    rows = [
+        np.asarray(
+            data.get_range(
+                get_call, index_range, sample_period, np_data_type, save=False
+            )
+        ).ravel()
+        for get_call in get_calls
+    ]
+    # Calls that failed with errors ignored return an empty array.
+    length = min(row.size for row in rows)
+    chunk = np.empty((len(rows), length), dtype=np.result_type(*rows))
+    for i, row in enumerate(rows):
+        chunk[i] = row[:length]
+    return chunk
+
+
+def iter_segment_transforms(  # noqa: PLR0913
+    data,
+    get_calls,
+    segment_length,
+    step,
+    window,
+    index_range=None,
+    memory_budget=DEFAULT_MEMORY_BUDGET,
+    np_data_type=np.float64,
+):
+    """
+    Fetch signals in chunks and Fourier transform their detrended and windowed segments.
+
+    Parameters
+    ----------
+    data : Data
+        Data object to get the signals with.
+    get_calls : list of Get
+        Calls for the signals.
+    segment_length : int
+        Number of samples in each segment.
+    step : int
+        Number of samples between the starts of neighboring segments.
+    window : np.array
+        Window multiplied with each segment after removing its mean.
+    index_range : None or tuple of two int, default=None
+        Indices of the first and last sample to use. If None, use the time index range of the data object limited to the samples every signal has.
+    memory_budget : float, default=DEFAULT_MEMORY_BUDGET
+        Bytes to keep the samples, segments, and transforms of each chunk under.
+    np_data_type : data-type, default=np.float64
+        The numpy data type to change the samples to.
+
+    Yields
+    ------
+    first_segment : int
+        Number of the first segment in the block counting from 0.
+    transforms : np.array
+        One sided Fourier transforms of the segments in an array of shape (channels, segments, frequencies).
+
+    Notes
+    -----
+    Samples at the end of a chunk that don't fill a segment are kept and
+    joined to the next chunk so that segments can cross chunk boundaries
+    without fetching samples twice. The signals are downsampled by the
+    sample period of the data object.
+    """
+    start, stop = _common_index_range(data, get_calls, index_range)
+    sample_period = data.sample_period
+    segments_per_block = _segments_per_block(
+        len(get_calls), segment_length, memory_budget
+    )
+    # Fetch enough new samples to make `segments_per_block` more segments.
+    fetch_samples = segments_per_block * step
+    logging.debug(
+        f"Transforming segments of {len(get_calls)} signals in index range ({start}, {stop}) in blocks of {segments_per_block} segments."
+    )
+
+    carry = np.empty((len(get_calls), 0), dtype=np_data_type)
+    first_segment = 0
+    while start <= stop:
+        chunk_stop = min(start + fetch_samples * sample_period - 1, stop)
+        chunk = _fetch_chunk(
+            data, get_calls, (start, chunk_stop), sample_period, np_data_type
+        )
+        start = chunk_stop + 1
+        if chunk.shape[1] == 0:
+            break
+        samples = np.concatenate((carry, chunk), axis=1)
+        if samples.shape[1] < segment_length:
+            carry = samples
+            continue
+        num_segments = (samples.shape[1] - segment_length) // step + 1
+        segments = sliding_window_view(samples, segment_length, axis=1)[
+            :, : num_segments * step : step
+        ]
+        segments = segments - segments.mean(axis=2, keepdims=True)
+        segments *= window
+        yield first_segment, np.fft.rfft(segments, axis=2)
+        first_segment += num_segments
+        carry = samples[:, num_segments * step :].copy()
+
+
+def _prepare(segment_length, overlap, window, sample_rate, scaling):
+    """
+    Get the step, window, frequencies, and scale of spectra.
+
+    Returns
+    -------
+    step : int
+    window : np.array
+    frequencies : np.array
+    scale : np.array
+        Factor for each frequency that changes summed squared transforms into one sided spectra.
+    """
+    if not 0 <= overlap < 1:
+        raise ValueError(f"Overlap must be in [0, 1) but was {overlap}.")
+    step = max(1, round(segment_length * (1 - overlap)))
+    window = get_window(window, segment_length)
+    frequencies = np.fft.rfftfreq(segment_length, 1 / sample_rate)
+    if scaling == "density":
+        scale = 1 / (sample_rate * np.sum(window**2))
+    elif scaling == "spectrum":
+        scale = 1 / np.sum(window) ** 2
+    else:
+        raise ValueError(
+            f"Scaling must be 'density' or 'spectrum' but was '{scaling}'."
+        )
+    scale = np.full(frequencies.size, scale)
+    # Fold the negative frequencies into the positive ones. The zero frequency and, for even lengths, the Nyquist frequency have no pair.
+    scale[1 : None if segment_length % 2 else -1] *= 2
+    return step, window, frequencies, scale
+
+
+def _sample_rate(data, get_calls, sample_rate):
+    if sample_rate is None:
+        sample_rate = sample_rate_of(data, get_calls[0])
+        logging.debug(f"Using sample rate {sample_rate} Hz of '{get_calls[0]}'.")
+    return sample_rate
+
+
+def welch(  # noqa: PLR0913
+    data,
+    get_calls,
+    segment_length=1024,
+    overlap=0.5,
+    window="hann",
+    sample_rate=None,
+    index_range=None,
+    scaling="density",
+    memory_budget=DEFAULT_MEMORY_BUDGET,
+):
+    """
+    Estimate the power spectrum of each signal by averaging the spectra of overlapping segments.
+
+    Parameters
+    ----------
+    data : Data
+        Data object to get the signals with.
+    get_calls : list of Get
+        Calls for the signals.
+    segment_length : int, default=1024
+        Number of samples in each segment.
+    overlap : float, default=0.5
+        Part of each segment shared with the next one.
+    window : str or tuple, default="hann"
+        Window given to `scipy.signal.get_window`.
+    sample_rate : float or None, default=None
+        Samples per second of the signals. If None, find it from the timebase of the first signal.
+    index_range : None or tuple of two int, default=None
+        Indices of the first and last sample to use. If None, use the time index range of the data object.
+    scaling : {"density", "spectrum"}, default="density"
+        Whether to give power spectral densities in units squared per hertz or power spectra in units squared.
+    memory_budget : float, default=DEFAULT_MEMORY_BUDGET
+        Bytes to keep the samples, segments, and transforms of each chunk under.
+
+    Returns
+    -------
+    frequencies : np.array
+        Frequencies in hertz.
+    spectra : np.array
+        Spectrum of each signal in an array of shape (channels, frequencies).
+
+    Notes
+    -----
+    Matches `scipy.signal.welch` with its default constant detrending and
+    one sided spectra but never holds more than a chunk of the signals.
+    """
+    return _average_spectra(
+        data,
+        get_calls,
+        segment_length,
+        overlap,
+        window,
+        sample_rate,
+        index_range,
+        scaling,
+        memory_budget,
+        cross=False,
+    )
+
+
+def cross_spectra(  # noqa: PLR0913
+    data,
+    get_calls,
+    segment_length=1024,
+    overlap=0.5,
+    window="hann",
+    sample_rate=None,
+    index_range=None,
+    scaling="density",
+    memory_budget=DEFAULT_MEMORY_BUDGET,
+):
+    """
+    Estimate the cross spectrum of every pair of signals by averaging over overlapping segments.
+
+    Parameters are the same as for `welch`.
+
+    Returns
+    -------
+    frequencies : np.array
+        Frequencies in hertz.
+    spectra : np.array
+        Complex cross spectra in an array of shape (channels, channels, frequencies). Entry [i, j] matches `scipy.signal.csd` of signal i and signal j and the diagonal holds the power spectra.
+    """
+    return _average_spectra(
+        data,
+        get_calls,
+        segment_length,
+        overlap,
+        window,
+        sample_rate,
+        index_range,
+        scaling,
+        memory_budget,
+        cross=True,
+    )
+
+
+def coherence(  # noqa: PLR0913
+    data,
+    get_calls,
+    segment_length=1024,
+    overlap=0.5,
+    window="hann",
+    sample_rate=None,
+    index_range=None,
+    memory_budget=DEFAULT_MEMORY_BUDGET,
+):
+    """
+    Estimate the magnitude squared coherence of every pair of signals.
+
+    Parameters are the same as for `welch`.
+
+    Returns
+    -------
+    frequencies : np.array
+        Frequencies in hertz.
+    coherences : np.array
+        Coherence in an array of shape (channels, channels, frequencies) with values from 0 to 1.
+    """
+    frequencies, spectra = cross_spectra(
+        data,
+        get_calls,
+        segment_length,
+        overlap,
+        window,
+        sample_rate,
+        index_range,
+        memory_budget=memory_budget,
+    )
+    powers = np.real(np.diagonal(spectra, axis1=0, axis2=1)).T
+    with np.errstate(divide="ignore", invalid="ignore"):
+        coherences = np.abs(spectra) ** 2 / (powers[:, None, :] * powers[None, :, :])
+    return frequencies, coherences
+
+
+def _average_spectra(  # noqa: PLR0913
+    data,
+    get_calls,
+    segment_length,
+    overlap,
+    window,
+    sample_rate,
+    index_range,
+    scaling,
+    memory_budget,
+    cross,
+):
+    sample_rate = _sample_rate(data, get_calls, sample_rate)
+    step, window, frequencies, scale = _prepare(
+        segment_length, overlap, window, sample_rate, scaling
+    )
+    num_channels = len(get_calls)
+    if cross:
+        sums = np.zeros((num_channels, num_channels, frequencies.size), complex)
+    else:
+        sums = np.zeros((num_channels, frequencies.size))
+    num_segments = 0
+    for _, transforms in iter_segment_transforms(
+        data, get_calls, segment_length, step, window, index_range, memory_budget
+    ):
+        if cross:
+            sums += np.einsum("isf,jsf->ijf", np.conj(transforms), transforms)
+        else:
+            sums += np.sum(transforms.real**2 + transforms.imag**2, axis=1)
+        num_segments += transforms.shape[1]
+    if num_segments == 0:
+        raise ValueError(
+            f"Signals are shorter than one segment of {segment_length} samples."
+        )
+    return frequencies, sums * scale / num_segments
+
+
+def spectrogram(  # noqa: PLR0913
+    data,
+    get_calls,
+    segment_length=1024,
+    overlap=0.5,
+    window="hann",
+    sample_rate=None,
+    index_range=None,
+    scaling="density",
+    segments_per_column=None,
+    memory_budget=DEFAULT_MEMORY_BUDGET,
+):
+    """
+    Get the spectra of signals over time.
+
+    Parameters
+    ----------
+    data : Data
+        Data object to get the signals with.
+    get_calls : list of Get
+        Calls for the signals.
+    segment_length : int, default=1024
+        Number of samples in each segment.
+    overlap : float, default=0.5
+        Part of each segment shared with the next one.
+    window : str or tuple, default="hann"
+        Window given to `scipy.signal.get_window`.
+    sample_rate : float or None, default=None
+        Samples per second of the signals. If None, find it from the timebase of the first signal.
+    index_range : None or tuple of two int, default=None
+        Indices of the first and last sample to use. If None, use the time index range of the data object.
+    scaling : {"density", "spectrum"}, default="density"
+        Whether to give power spectral densities in units squared per hertz or power spectra in units squared.
+    segments_per_column : int or None, default=None
+        Number of neighboring segments averaged into each time column. If None, use 1 unless the spectrogram wouldn't fit in half the memory budget, in which case average as few as needed to fit.
+    memory_budget : float, default=DEFAULT_MEMORY_BUDGET
+        Bytes to keep the samples, segments, and transforms of each chunk under.
+
+    Returns
+    -------
+    frequencies : np.array
+        Frequencies in hertz.
+    indices : np.array
+        Index from the start of the digitizer recording of the middle of each column. Use with the time array of the data object to get times.
+    spectrogram : np.array
+        Spectra in an array of shape (channels, frequencies, columns).
+    """
+    sample_rate = _sample_rate(data, get_calls, sample_rate)
+    step, window, frequencies, scale = _prepare(
+        segment_length, overlap, window, sample_rate, scaling
+    )
+    start, stop = _common_index_range(data, get_calls, index_range)
+    sample_period = data.sample_period
+    num_samples = (stop - start) // sample_period + 1
+    if num_samples < segment_length:
+        raise ValueError(
+            f"Signals are shorter than one segment of {segment_length} samples."
+        )
+    total_segments = (num_samples - segment_length) // step + 1
+    num_channels = len(get_calls)
+    if segments_per_column is None:
+        output_bytes = 8 * num_channels * frequencies.size * total_segments
+        segments_per_column = max(1, int(np.ceil(output_bytes / (memory_budget / 2))))
+    if segments_per_column != 1:
+        logging.info(
+            f"Averaging {segments_per_column} segments into each spectrogram column."
+        )
+    num_columns = -(-total_segments // segments_per_column)
+
+    sums = np.zeros((num_channels, frequencies.size, num_columns))
+    for first_segment, transforms in iter_segment_transforms(
+        data,
+        get_calls,
+        segment_length,
+        step,
+        window,
+        (start, stop),
+        memory_budget / 2,
+    ):
+        columns = (
+            first_segment + np.arange(transforms.shape[1])
+        ) // segments_per_column
+        powers = transforms.real**2 + transforms.imag**2
+        np.add.at(sums, (slice(None), slice(None), columns), powers.transpose(0, 2, 1))
+
+    segment_counts = np.full(num_columns, segments_per_column)
+    segment_counts[-1] = total_segments - segments_per_column * (num_columns - 1)
+    first_starts = np.arange(num_columns) * segments_per_column * step
+    last_stops = first_starts + (segment_counts - 1) * step + segment_length - 1
+    indices = start + (first_starts + last_stops) / 2 * sample_period
+    return (
+        frequencies,
+        indices,
+        sums * scale[None, :, None] / segment_counts,
+    )
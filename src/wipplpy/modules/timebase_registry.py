@@ -0,0 +1,275 @@
+"""Share timebases between signals that are recorded on the same digitizer clock."""
+
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Prefix used in saved files to point a timebase entry at an identical entry instead of saving the array twice.
+TIMEBASE_LINK_PREFIX = "wipplpy_timebase_link:"
+
+# Number of registries of shots that are kept. The least recently used are forgotten first so that a scan over many shots doesn't keep every timebase.
+MAX_TIMEBASE_REGISTRIES = 16
+# Largest relative difference of a sample period from the mean for a timebase to count as evenly spaced.
+_UNIFORM_TOLERANCE = 1e-6
+
+_registries = OrderedDict()
+_registries_lock = threading.Lock()
+
+
+def timebase_fingerprint(times):
+    """
+    Get a cheap fingerprint of a timebase that identifies it without comparing every element.
+
+    Parameters
+    ----------
+    times : np.array
+        Timebase to fingerprint.
+
+    Returns
+    -------
+    tuple
+        Tuple of `('fingerprint', start, end, length, dtype)`.
+
+    Notes
+    -----
+    For a uniformly sampled clock the start, end, and length set the sample
+    period so this identifies the clock. The end is used instead of the
+    sample period as it is known exactly while a difference of times is not.
+    """
+    times = np.asarray(times)
+    if times.size == 0:
+        return ("fingerprint", 0.0, 0.0, 0, times.dtype.str)
+    return (
+        "fingerprint",
+        float(times.flat[0]),
+        float(times.flat[-1]),
+        int(times.size),
+        times.dtype.str,
+    )
+
+
+def fingerprint_call(call_string):
+    """
+    Get the call string that has the server compute the fingerprint of a timebase.
+
+    Parameters
+    ----------
+    call_string : str
+        Call string that returns the timebase.
+
+    Returns
+    -------
+    str
+        Call string returning `[start, end, length]` of the timebase as doubles.
+    """
+    return f"[ DBLE( ({call_string})[0] ), DBLE( ({call_string})[SIZE( {call_string} ) - 1] ), DBLE( SIZE( {call_string} ) ) ]"
+
+
+def fingerprint_from_call_result(result, np_data_type=np.float64):
+    """
+    Change the result of a `fingerprint_call` into a fingerprint.
+
+    Parameters
+    ----------
+    result : np.array
+        Array of `[start, end, length]` returned by the server.
+    np_data_type : data-type, default=np.float64
+        Data type the timebase will be changed to once fetched.
+
+    Returns
+    -------
+    tuple
+    """
+    start, end, length = np.asarray(result, dtype=np.float64)
+    dtype = np.dtype(np_data_type)
+    if int(length) == 0:
+        return ("fingerprint", 0.0, 0.0, 0, dtype.str)
+    # Change the values to the type the timebase will have so they match a fingerprint computed locally.
+    return (
+        "fingerprint",
+        float(dtype.type(start)),
+        float(dtype.type(end)),
+        int(length),
+        dtype.str,
+    )
+
+
+class TimebaseRegistry:
+    def __init__(self, shot_number):
+        """
+        Hold a single read-only copy of each timebase used by a shot.
+
+        Parameters
+        ----------
+        shot_number : int
+            Shot number the timebases belong to.
+
+        Notes
+        -----
+        Timebases are identified either by a key naming the digitizer node
+        they come from or by their fingerprint (see `timebase_fingerprint`).
+        Every call string that resolved to a timebase is remembered so that
+        later calls with the same string don't need to ask the server for a
+        fingerprint. A fingerprint only identifies an evenly spaced
+        timebase, so `lookup` only gives timebases found by fingerprint
+        when they are evenly spaced and `register` checks that the arrays
+        are equal before sharing one.
+        """
+        self.shot_number = shot_number
+        self._timebases = {}
+        self._uniform_keys = set()
+        self._call_keys = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._timebases
+
+    def __getitem__(self, key):
+        return self._timebases[key]
+
+    def __len__(self):
+        return len(self._timebases)
+
+    def lookup(self, key):
+        """
+        Get a registered timebase that can be used without fetching it.
+
+        Parameters
+        ----------
+        key : Hashable
+            Key naming a digitizer node or a fingerprint computed by the server.
+
+        Returns
+        -------
+        np.array or None
+            None if the key isn't registered or is a fingerprint of a timebase that isn't evenly spaced, since other timebases can have the same fingerprint.
+        """
+        with self._lock:
+            if key not in self._timebases:
+                return None
+            if _is_fingerprint(key) and key not in self._uniform_keys:
+                return None
+            return self._timebases[key]
+
+    def key_for_call(self, call_string):
+        """
+        Get the key of the timebase a call string resolved to previously.
+
+        Parameters
+        ----------
+        call_string : str
+
+        Returns
+        -------
+        Hashable or None
+            None if the call string has not been seen before.
+        """
+        return self._call_keys.get(call_string)
+
+    def link(self, call_string, key):
+        """
+        Remember that a call string returns the timebase stored under `key`.
+
+        Parameters
+        ----------
+        call_string : str
+        key : Hashable
+        """
+        self._call_keys[call_string] = key
+
+    def register(self, times, key=None, call_string=None):
+        """
+        Add a timebase to the registry or get the identical timebase that is already registered.
+
+        Parameters
+        ----------
+        times : np.array
+            Timebase to register.
+        key : Hashable or None, default=None
+            Key naming the digitizer node the timebase is from. If None, use the fingerprint of the timebase.
+        call_string : str or None, default=None
+            Call string that returned the timebase.
+
+        Returns
+        -------
+        np.array
+            Read-only timebase shared by every user of this key, or the timebase itself if a different timebase was already registered under its key.
+        """
+        times = np.asarray(times)
+        if key is None:
+            key = timebase_fingerprint(times)
+        with self._lock:
+            shared = self._timebases.get(key)
+            if shared is not None and not (
+                shared is times or np.array_equal(shared, times)
+            ):
+                logging.debug(
+                    f"Shot #{self.shot_number}: Timebase differs from the one registered under {key}. Not sharing it."
+                )
+                return times
+            if shared is None:
+                shared = times
+                shared.setflags(write=False)
+                self._timebases[key] = shared
+                if _is_fingerprint(key) and _is_uniform(shared):
+                    self._uniform_keys.add(key)
+                logging.debug(
+                    f"Shot #{self.shot_number}: Registering new timebase under key {key}."
+                )
+            if call_string is not None:
+                self._call_keys[call_string] = key
+        return shared
+
+
+def _is_fingerprint(key):
+    return isinstance(key, tuple) and len(key) != 0 and key[0] == "fingerprint"
+
+
+def _is_uniform(times):
+    """Check whether a timebase is evenly spaced so that its fingerprint sets every sample."""
+    if times.ndim != 1:
+        return False
+    periods = np.diff(times.astype(np.float64))
+    if periods.size == 0:
+        return True
+    period = periods.mean()
+    return period != 0 and bool(
+        np.all(np.abs(periods - period) <= _UNIFORM_TOLERANCE * abs(period))
+    )
+
+
+def get_timebase_registry(shot_number, tree_name=None, server_name=None):
+    """
+    Get the timebase registry for a shot, creating it if needed.
+
+    Parameters
+    ----------
+    shot_number : int
+    tree_name, server_name : str or None, default=None
+        Tree and server the shot is from. None stands for the default tree and server of the shot loading config.
+
+    Returns
+    -------
+    TimebaseRegistry
+
+    Notes
+    -----
+    Registries are kept for each server, tree, and shot since the same shot
+    number in another tree or on another server has other timebases.
+    """
+    key = (server_name, tree_name, shot_number)
+    with _registries_lock:
+        if key not in _registries:
+            _registries[key] = TimebaseRegistry(shot_number)
+            while len(_registries) > MAX_TIMEBASE_REGISTRIES:
+                _registries.popitem(last=False)
+        _registries.move_to_end(key)
+        return _registries[key]
+
+
+def clear_timebase_registries():
+    """Forget every registered timebase so that their memory can be released."""
+    with _registries_lock:
+        _registries.clear()
@@ -0,0 +1,4 @@
+"""
+The `mst` module contains diagnostics and the machine object for the Madison
+Symmetric Torus.
+"""
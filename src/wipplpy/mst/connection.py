@@ -3,11 +3,10 @@ Create objects pertaining to accessing databases for the MST device.
 """
 
 import logging
-import math
-from datetime import date
 
-from WiPPLPy.modules.config_reader import MDSplusConfigReader
-from WiPPLPy.modules.connection import MDSPlusConnection
+from wipplpy.modules.config_reader import MDSplusConfigReader
+from wipplpy.modules.connection import MDSPlusConnection
+from wipplpy.modules.shot_loader import is_run_day_shot
 
 
 class MSTConnection(MDSPlusConnection):
@@ -15,16 +14,19 @@ class MSTConnection(MDSPlusConnection):
     Open the MST-MDSplus database for a given shot number.
     """
 
-    def __init__(self, config_reader=MDSplusConfigReader()):
+    def __init__(self, config_reader=None):
         """
         Initialize class attributes.
 
         Parameters
         ----------
-        config_reader : `WiPPLPy.modules.config_reader.MDSplusConfigReader`
+        config_reader : `wipplpy.modules.config_reader.MDSplusConfigReader`, default=None
             Class object that reads from the INI file containing MDSplus
-            labels.
+            labels. If `None`, read the standard INI file.
         """
+        super().__init__()
+        if config_reader is None:
+            config_reader = MDSplusConfigReader()
         self.config_reader = config_reader
 
     def data_location(self, shot_number):
@@ -49,15 +51,10 @@ class MSTConnection(MDSPlusConnection):
         2023, from which it can be determined whether the date is the present
         run-day or a past day.
         """
-        # Prepare the date in MST's shot syntax
-        date_today = date.today()
-        millenium_index = math.floor(date_today.year / 1000) - 1
-        date_mst_syntax = millenium_index + date_today.strftime("%y%m%d")
-
         shot_string = str(shot_number)
 
         # Compare the shot string to the date
-        if shot_string[:-3] == date_mst_syntax:
+        if is_run_day_shot(shot_number):
             server_name = self.config_reader.MST_runday_data_server
         else:
             server_name = self.config_reader.MST_past_data_server
@@ -67,6 +64,37 @@ class MSTConnection(MDSPlusConnection):
 
         return server_name
 
+    def location(self, shot_number):
+        """
+        Determine the tree and server holding the given shot number's data.
+
+        Parameters
+        ----------
+        shot_number : `int`
+            The shot number from which to extract MDSplus data.
+
+        Returns
+        -------
+        tree_name : `str`
+            String representing the tree name of the MST-MDSplus database.
+        server_name : `str`
+            String representing the server in which the shot's data is located.
+        """
+        return self.config_reader.MST_tree, self.data_location(shot_number)
+
+    def run_day_location(self):
+        """
+        Determine the tree and server that new shots are written to.
+
+        Returns
+        -------
+        tree_name : `str`
+            String representing the tree name of the MST-MDSplus database.
+        server_name : `str`
+            String representing the run-day data server.
+        """
+        return self.config_reader.MST_tree, self.config_reader.MST_runday_data_server
+
     def make_connection(self, shot_number):
         """
         Establish an MDSplus connection to the appropriate MST data server.
@@ -76,6 +104,4 @@ class MSTConnection(MDSPlusConnection):
         shot_number : `int`
             The shot number from which to extract MDSplus data.
         """
-        self._local_and_remote_connection(
-            shot_number, self.config_reader.MST_tree, self.data_location(shot_number)
-        )
+        self._local_and_remote_connection(shot_number, *self.location(shot_number))
@@ -0,0 +1,112 @@
+"""Tests for keeping saved calls under a memory budget."""
+
+import numpy as np
+from scipy.io import loadmat
+
+from wipplpy.modules.call_cache import CallCache
+from wipplpy.modules.generic_get_data import Data, Get, MultiGet
+
+SAMPLES = 100
+ENTRY_BYTES = SAMPLES * 8
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def data(self):
+        return self.value
+
+
+class FakeData(Data):
+    def __init__(self, **kwargs):
+        super().__init__(1, [], [], **kwargs)
+
+    def _fetch(self, call_string):
+        return FakeResult(np.arange(float(SAMPLES)) + len(call_string))
+
+
+def test_least_recently_used_entries_are_spilled():
+    cache = CallCache(memory_budget=2 * ENTRY_BYTES)
+    for name in "abc":
+        cache[name] = np.full(SAMPLES, float(ord(name)))
+    assert cache.nbytes == 2 * ENTRY_BYTES
+    assert isinstance(cache.peek("a"), np.memmap)
+    assert cache["a"][0] == ord("a")
+    # Restoring the spilled entry moves the next oldest out of memory.
+    assert isinstance(cache.peek("b"), np.memmap)
+    assert sorted(cache) == ["a", "b", "c"]
+
+
+def test_entries_are_dropped_without_spilling():
+    cache = CallCache(memory_budget=ENTRY_BYTES, spill=False)
+    cache["a"] = np.zeros(SAMPLES)
+    cache["b"] = np.ones(SAMPLES)
+    assert "a" not in cache
+    assert cache.dropped == {"a"}
+    cache["a"] = np.zeros(SAMPLES)
+    assert "a" not in cache.dropped
+
+
+def test_small_and_read_only_entries_stay_in_memory():
+    shared = np.zeros(SAMPLES)
+    shared.flags.writeable = False
+    cache = CallCache(memory_budget=0, spill=False)
+    cache["text"] = "kept"
+    cache["shared"] = shared
+    assert cache.dropped == set()
+    assert sorted(cache) == ["shared", "text"]
+
+
+def test_nothing_is_evicted_while_held_in_memory():
+    cache = CallCache(memory_budget=ENTRY_BYTES, spill=False)
+    with cache.hold_in_memory():
+        for name in "abc":
+            cache[name] = np.zeros(SAMPLES)
+        assert sorted(cache) == ["a", "b", "c"]
+    assert cache.nbytes <= ENTRY_BYTES
+    assert cache.dropped == {"a", "b"}
+
+
+def test_save_writes_every_call_after_dropping(tmp_path):
+    data = FakeData(memory_budget=ENTRY_BYTES, spill=False)
+    call_strings = [r"\a", r"\bb", r"\ccc"]
+    for call_string in call_strings:
+        data.get(call_string)
+    assert len(data.saved_calls.dropped) == len(call_strings) - 1
+
+    filepath = str(tmp_path / "calls.mat")
+    data.save(filepath)
+    saved = loadmat(filepath)
+    for call_string in call_strings:
+        name = call_string.lstrip("\\")
+        np.testing.assert_array_equal(
+            saved[name].ravel(), np.arange(float(SAMPLES)) + len(call_string)
+        )
+    assert data.saved_calls.nbytes <= ENTRY_BYTES
+
+
+def test_save_calls_dropped_get_subclasses_again(tmp_path):
+    def get_all(data):
+        data.get(MultiGet([r"\a", r"\b"]))
+        data.get(Get(r"\named", name="named"))
+        data.get_range(Get(r"\ranged"), (0, SAMPLES // 2 - 1))
+        data.get(r"\last")
+
+    expected = FakeData()
+    get_all(expected)
+    expected_filepath = str(tmp_path / "expected.mat")
+    expected.save(expected_filepath)
+
+    data = FakeData(memory_budget=ENTRY_BYTES, spill=False)
+    get_all(data)
+    assert len(data.saved_calls.dropped) != 0
+    filepath = str(tmp_path / "calls.mat")
+    data.save(filepath)
+
+    saved = loadmat(filepath)
+    expected_saved = loadmat(expected_filepath)
+    names = [name for name in expected_saved if not name.startswith("__")]
+    assert sorted(name for name in saved if not name.startswith("__")) == sorted(names)
+    for name in names:
+        np.testing.assert_array_equal(saved[name], expected_saved[name])
@@ -0,0 +1,114 @@
+"""Tests for writing and reading Parquet datasets of many shots."""
+
+import numpy as np
+import pytest
+
+from wipplpy.modules import columnar
+from wipplpy.modules.columnar import (
+    SHOT_COLUMN,
+    Trace,
+    existing_shots,
+    read_dataset,
+    read_spec,
+    reduce_trace,
+    write_dataset,
+)
+
+pytest.importorskip("pyarrow")
+
+TRACE_LENGTH = 4
+PARTITION_SIZE = 10
+SHOTS = [3, 12, 15]
+FAILING_SHOT = 12
+
+
+@pytest.mark.parametrize("size", [2, 4, 7, 100])
+def test_reduce_trace_keeps_length_and_mean(size):
+    signal = np.arange(size, dtype=float)
+    reduced = reduce_trace(signal, TRACE_LENGTH)
+    assert reduced.shape == (TRACE_LENGTH,)
+    assert reduced[0] == pytest.approx(signal[0], abs=size / TRACE_LENGTH)
+    if size % TRACE_LENGTH == 0:
+        assert reduced.mean() == pytest.approx(signal.mean())
+
+
+def test_reduce_trace_rejects_empty_signals():
+    with pytest.raises(ValueError, match="empty"):
+        reduce_trace([], TRACE_LENGTH)
+
+
+def test_trace_spec_round_trip():
+    trace = Trace("\\signal", TRACE_LENGTH, (0, 9), name="column")
+    copy = Trace.from_spec(trace.spec())
+    assert copy.spec() == trace.spec()
+    assert copy.index_range == (0, 9)
+
+
+def fake_rows(calls):
+    """Replace getting rows from the server with rows made from the shot number."""
+
+    def shot_row(shot_number, scalar_calls=(), trace_specs=(), **kwargs):
+        calls.append(shot_number)
+        value = None if shot_number == FAILING_SHOT else float(shot_number)
+        row = {SHOT_COLUMN: shot_number, "ip": value}
+        for spec in trace_specs:
+            row[spec["name"]] = np.full(spec["length"], float(shot_number))
+        return row
+
+    return shot_row
+
+
+def write(directory, shots, calls, monkeypatch, **kwargs):
+    monkeypatch.setattr(columnar, "shot_row", fake_rows(calls))
+    return write_dataset(
+        shots,
+        str(directory),
+        scalar_calls=["\\ip"],
+        traces=[Trace("\\signal", TRACE_LENGTH)],
+        partition_size=PARTITION_SIZE,
+        batch_size=2,
+        **kwargs,
+    )
+
+
+def test_written_shots_are_read_back(tmp_path, monkeypatch):
+    summary = write(tmp_path, SHOTS, [], monkeypatch, write_incomplete=True)
+    assert sorted(summary["written"]) == SHOTS
+    assert list(summary["failures"]) == [FAILING_SHOT]
+    assert read_spec(str(tmp_path))["partition_size"] == PARTITION_SIZE
+
+    table = read_dataset(str(tmp_path)).sort_by(SHOT_COLUMN)
+    assert table.column(SHOT_COLUMN).to_pylist() == SHOTS
+    assert table.column("ip").to_pylist() == [3.0, None, 15.0]
+    assert table.column("signal").to_pylist()[0] == [3.0] * TRACE_LENGTH
+
+
+def test_incomplete_shots_are_not_written_by_default(tmp_path, monkeypatch):
+    summary = write(tmp_path, SHOTS, [], monkeypatch)
+    assert FAILING_SHOT not in summary["written"]
+    assert existing_shots(str(tmp_path)) == set(SHOTS) - {FAILING_SHOT}
+
+
+def test_shots_already_written_are_skipped(tmp_path, monkeypatch):
+    write(tmp_path, SHOTS[:1], [], monkeypatch)
+    calls = []
+    write(tmp_path, SHOTS, calls, monkeypatch, write_incomplete=True)
+    assert calls == SHOTS[1:]
+    assert existing_shots(str(tmp_path)) == set(SHOTS)
+
+
+def test_shot_range_only_reads_its_rows(tmp_path, monkeypatch):
+    write(tmp_path, SHOTS, [], monkeypatch, write_incomplete=True)
+    table = read_dataset(str(tmp_path), columns=[SHOT_COLUMN], shots=(10, 14))
+    assert table.column(SHOT_COLUMN).to_pylist() == [FAILING_SHOT]
+
+
+def test_different_columns_need_another_directory(tmp_path, monkeypatch):
+    write(tmp_path, SHOTS[:1], [], monkeypatch)
+    with pytest.raises(ValueError, match="another directory"):
+        write_dataset(SHOTS, str(tmp_path), scalar_calls=["\\other"])
+
+
+def test_reading_without_a_dataset_fails(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        read_dataset(str(tmp_path))
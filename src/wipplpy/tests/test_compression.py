@@ -0,0 +1,83 @@
+"""Tests for quantizing signals into integer codes."""
+
+import numpy as np
+import pytest
+
+from wipplpy.modules.compression import (
+    dequantize,
+    quantize,
+    read_quantization,
+    write_quantization,
+)
+from wipplpy.modules.generic_get_data import Data, Get
+
+
+def digitized(bits=12, size=20_000, gain=2.5e-3, offset=-5.0):
+    codes = np.random.default_rng(0).integers(0, 2**bits, size)
+    return codes * gain + offset
+
+
+def test_digitized_signals_are_quantized_without_loss():
+    signal = digitized()
+    quantized = quantize(signal, 12)
+    assert quantized is not None
+    codes, scale, offset = quantized
+    assert codes.dtype == np.uint16
+    np.testing.assert_allclose(dequantize(codes, scale, offset), signal, atol=1e-12)
+
+
+def test_signals_off_a_grid_are_only_quantized_when_lossy():
+    signal = np.random.default_rng(0).normal(size=1000)
+    assert quantize(signal, 12) is None
+    codes, scale, offset = quantize(signal, 12, lossy=True)
+    step = np.ptp(signal) / (2**12 - 1)
+    np.testing.assert_allclose(dequantize(codes, scale, offset), signal, atol=step)
+
+
+@pytest.mark.parametrize(
+    "array",
+    [
+        np.array([1.0]),
+        np.arange(10),
+        np.array([0.0, np.nan, 1.0]),
+    ],
+)
+def test_arrays_that_cant_be_quantized(array):
+    assert quantize(array, 12) is None
+
+
+def test_quantization_records_round_trip():
+    records = {"ip": (2.5e-3, -5.0, "<f8")}
+    text = write_quantization(records)
+    read = read_quantization(text)
+    assert read["ip"][0] == pytest.approx(2.5e-3)
+    assert read["ip"][1] == pytest.approx(-5.0)
+
+
+class FakeData(Data):
+    def __init__(self, **kwargs):
+        super().__init__(1, [], [], **kwargs)
+
+
+def test_timebases_are_never_quantized():
+    timebase = np.arange(1000) * 1e-6
+    shared = digitized()
+    shared.flags.writeable = False
+    calls = {
+        "time": timebase,
+        "dim_of_signal": timebase.copy(),
+        "shared": shared,
+        "signal": digitized(),
+    }
+    data = FakeData()
+    data._saved_call_args["time"] = (Get("dim_of(\\signal)"),)
+    data._quantize_calls(calls, 16, lossy=True)
+    assert calls["time"] is timebase
+    np.testing.assert_array_equal(calls["dim_of_signal"], timebase)
+    assert calls["shared"] is shared
+    assert calls["signal"].dtype == np.uint16
+
+
+def test_mat_files_only_take_zlib(tmp_path):
+    with pytest.raises(ValueError, match="zlib"):
+        FakeData().save(str(tmp_path / "calls.mat"), compress="zstd")
@@ -0,0 +1,136 @@
+"""Tests for choosing and remembering the route to an MDSplus server."""
+
+import threading
+
+import MDSplus as mds
+import pytest
+
+from wipplpy.modules import connection
+
+SERVER = "server"
+TREE = "tree"
+FIRST_SHOT = 1
+SECOND_SHOT = 2
+
+
+class FakeRemote(mds.Connection):
+    def __init__(self):
+        self.opened = []
+        self.closed = False
+
+    def openTree(self, tree_name, shot_number):  # noqa: N802
+        self.opened.append((tree_name, shot_number))
+
+    def closeAllTrees(self):  # noqa: N802
+        self.closed = True
+
+
+class FakeLocal:
+    def __init__(self, shot_number):
+        self.shot_number = shot_number
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection(connection.MDSPlusConnection):
+    def make_connection(self, shot_number):
+        self._local_and_remote_connection(shot_number, TREE, SERVER)
+
+
+@pytest.fixture(autouse=True)
+def _forget_routes():
+    connection.forget_route()
+    yield
+    connection.forget_route()
+
+
+def _fail(*args):
+    raise OSError("route is down")
+
+
+def test_probe_uses_working_route_and_remembers_it(monkeypatch):
+    remotes = []
+
+    def open_remote(shot_number, tree_name, server_name):
+        remote = FakeRemote()
+        remote.openTree(tree_name, shot_number)
+        remotes.append(remote)
+        return remote
+
+    monkeypatch.setattr(connection, "_open_local_tree", _fail)
+    monkeypatch.setattr(connection, "_open_remote_tree", open_remote)
+    conn = FakeConnection()
+    conn.make_connection(FIRST_SHOT)
+
+    assert conn.connection_is_remote
+    assert conn.tree is remotes[0]
+    assert connection.route_is_local(SERVER) is False
+
+
+def test_probe_closes_losing_tree(monkeypatch):
+    release_remote = threading.Event()
+    remote = FakeRemote()
+
+    def open_remote(shot_number, tree_name, server_name):
+        release_remote.wait()
+        return remote
+
+    monkeypatch.setattr(connection, "_open_local_tree", lambda s, t: FakeLocal(s))
+    monkeypatch.setattr(connection, "_open_remote_tree", open_remote)
+    conn = FakeConnection()
+    conn.make_connection(FIRST_SHOT)
+    assert not conn.connection_is_remote
+
+    closed = threading.Event()
+    monkeypatch.setattr(FakeRemote, "closeAllTrees", lambda self: closed.set())
+    release_remote.set()
+    assert closed.wait(timeout=5)
+
+
+def test_probe_threads_are_daemons(monkeypatch):
+    daemons = []
+
+    def open_local(shot_number, tree_name):
+        daemons.append(threading.current_thread().daemon)
+        return FakeLocal(shot_number)
+
+    monkeypatch.setattr(connection, "_open_local_tree", open_local)
+    monkeypatch.setattr(connection, "_open_remote_tree", _fail)
+    FakeConnection().make_connection(FIRST_SHOT)
+    assert daemons == [True]
+
+
+def test_remembered_route_is_tried_alone(monkeypatch):
+    connection._remember_route(SERVER, is_remote=False)
+    monkeypatch.setattr(connection, "_open_local_tree", lambda s, t: FakeLocal(s))
+    monkeypatch.setattr(connection, "_open_remote_tree", pytest.fail)
+    conn = FakeConnection()
+    conn.make_connection(FIRST_SHOT)
+    assert not conn.connection_is_remote
+
+
+def test_remembered_route_expires(monkeypatch):
+    connection._remember_route(SERVER, is_remote=True)
+    monkeypatch.setattr(connection, "ROUTE_CACHE_TTL", -1)
+    assert connection.route_is_local(SERVER) is None
+
+
+def test_remote_connection_is_reused_for_next_shot(monkeypatch):
+    remotes = []
+
+    def open_remote(shot_number, tree_name, server_name):
+        remote = FakeRemote()
+        remote.openTree(tree_name, shot_number)
+        remotes.append(remote)
+        return remote
+
+    connection._remember_route(SERVER, is_remote=True)
+    monkeypatch.setattr(connection, "_open_remote_tree", open_remote)
+    conn = FakeConnection()
+    conn.make_connection(FIRST_SHOT)
+    conn.make_connection(SECOND_SHOT)
+
+    assert len(remotes) == 1
+    assert remotes[0].opened == [(TREE, FIRST_SHOT), (TREE, SECOND_SHOT)]
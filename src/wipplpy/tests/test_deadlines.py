@@ -0,0 +1,138 @@
+"""Tests for call deadlines, retry backoff, and time budgets."""
+
+import pickle
+import threading
+
+import pytest
+
+from wipplpy.modules.deadlines import (
+    DEFAULT_DEADLINES,
+    Budget,
+    DeadlineExceeded,
+    backoff_delay,
+    call_with_deadline,
+    get_deadlines,
+)
+from wipplpy.modules.generic_get_data import Data
+
+SHORT_TIMEOUT = 0.05
+LONG_TIMEOUT = 5.0
+BUDGET = 10.0
+# The first tree and the one opened again after the call times out.
+TREES_WITH_RETRY = 2
+
+
+def test_get_deadlines_overrides_defaults():
+    deadlines = get_deadlines({"call": SHORT_TIMEOUT})
+    assert deadlines["call"] == SHORT_TIMEOUT
+    assert deadlines["connect"] == DEFAULT_DEADLINES["connect"]
+    assert DEFAULT_DEADLINES["call"] != SHORT_TIMEOUT
+
+
+def test_get_deadlines_rejects_unknown_names():
+    with pytest.raises(ValueError, match="Unknown deadline"):
+        get_deadlines({"cal": SHORT_TIMEOUT})
+
+
+def test_call_with_deadline_returns_result():
+    assert call_with_deadline(sum, LONG_TIMEOUT, "adding", [1, 2]) == sum([1, 2])
+    assert call_with_deadline(sum, None, "adding", [1, 2]) == sum([1, 2])
+
+
+def test_call_with_deadline_reraises_errors():
+    def fail():
+        raise KeyError("missing")
+
+    with pytest.raises(KeyError):
+        call_with_deadline(fail, LONG_TIMEOUT, "failing")
+
+
+def test_call_with_deadline_times_out():
+    release = threading.Event()
+    try:
+        with pytest.raises(DeadlineExceeded, match="waiting"):
+            call_with_deadline(release.wait, SHORT_TIMEOUT, "waiting")
+    finally:
+        release.set()
+
+
+@pytest.mark.parametrize("attempt", range(8))
+def test_backoff_delay_is_capped(attempt):
+    base = 0.5
+    cap = 2.0
+    delay = backoff_delay(attempt, base, cap)
+    assert 0 <= delay <= min(cap, base * 2**attempt)
+
+
+def test_budget_limits_timeouts():
+    budget = Budget(BUDGET)
+    assert budget.timeout_for(None) == BUDGET
+    assert budget.timeout_for(SHORT_TIMEOUT) == SHORT_TIMEOUT
+    budget.spend(BUDGET - SHORT_TIMEOUT)
+    assert budget.timeout_for(LONG_TIMEOUT) == pytest.approx(SHORT_TIMEOUT)
+    budget.spend(SHORT_TIMEOUT)
+    with pytest.raises(DeadlineExceeded):
+        budget.timeout_for(LONG_TIMEOUT)
+
+
+def test_unlimited_budget():
+    budget = Budget()
+    budget.spend(BUDGET)
+    assert budget.remaining() is None
+    assert budget.timeout_for(None) is None
+
+
+def test_budget_pickles_without_lock():
+    budget = Budget(BUDGET)
+    budget.spend(SHORT_TIMEOUT)
+    copy = pickle.loads(pickle.dumps(budget))
+    assert copy.remaining() == budget.remaining()
+    copy.spend(SHORT_TIMEOUT)
+    assert copy.spent == pytest.approx(2 * SHORT_TIMEOUT)
+
+
+class FakeTree:
+    def __init__(self, hang):
+        self.shot_number = 1
+        self.hang = hang
+        self.release = threading.Event()
+
+    def get(self, call_string):
+        if self.hang:
+            self.release.wait()
+        return call_string
+
+
+class FakeData(Data):
+    def __init__(self, **kwargs):
+        super().__init__(1, [], [], **kwargs)
+        self.opened = []
+
+    def _open_tree(self, reconnect=False):
+        # Only the first tree hangs so the retry after reconnecting works.
+        tree = FakeTree(hang=len(self.opened) == 0)
+        self.opened.append(tree)
+        return tree
+
+
+def test_timed_out_call_reconnects_and_retries():
+    data = FakeData(deadlines={"call": SHORT_TIMEOUT, "backoff_base": 0})
+    try:
+        assert data._fetch("\\node") == "\\node"
+    finally:
+        data.opened[0].release.set()
+    assert len(data.opened) == TREES_WITH_RETRY
+    assert data.stats["timeouts"] == 1
+    assert data.stats["retries"] == 1
+
+
+def test_timed_out_call_gives_up_after_max_tries():
+    data = FakeData(
+        deadlines={"call": SHORT_TIMEOUT, "backoff_base": 0, "max_tries": 1}
+    )
+    try:
+        with pytest.raises(DeadlineExceeded):
+            data._fetch("\\node")
+    finally:
+        data.opened[0].release.set()
+    assert data.stats["retries"] == 0
@@ -0,0 +1,117 @@
+"""Tests for sending fetches to a group of workers for each server."""
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from wipplpy.modules import dispatcher
+from wipplpy.modules.dispatcher import FetchDispatcher
+
+FIRST_SERVER = "first"
+SECOND_SERVER = "second"
+TREE = "tree"
+SERVER_LIMIT = 3
+SHOTS = [1, 2, 3, 4]
+FAILING_SHOT = 4
+# Shots on the first and second server.
+SLOW_SHOT = 1
+FAST_SHOT = 2
+
+
+def server_of(shot_number):
+    return FIRST_SERVER if shot_number % 2 == 1 else SECOND_SERVER
+
+
+@pytest.fixture(autouse=True)
+def _thread_pools(monkeypatch):
+    """Run workers in threads so that test functions don't need to be pickled."""
+    monkeypatch.setattr(dispatcher, "ProcessPoolExecutor", ThreadPoolExecutor)
+
+
+@pytest.fixture
+def fake_locations(monkeypatch):
+    lookups = []
+
+    def machine_location(machine, shot_number, config_filepath):
+        lookups.append((machine, shot_number))
+        return TREE, server_of(shot_number)
+
+    monkeypatch.setattr(dispatcher, "machine_location", machine_location)
+    return lookups
+
+
+def fake_fetch_calls(shot_number, call_strings, server_name, **kwargs):
+    if shot_number == FAILING_SHOT:
+        raise KeyError(shot_number)
+    return dict.fromkeys(call_strings, (shot_number, server_name))
+
+
+def test_servers_need_a_worker():
+    with pytest.raises(ValueError, match="at least one worker"):
+        FetchDispatcher(default_limit=0)
+
+
+def test_machine_locations_are_remembered(fake_locations):
+    fetcher = FetchDispatcher()
+    assert fetcher.location(1, "MST") == (TREE, FIRST_SERVER)
+    assert fetcher.location(1, "mst") == (TREE, FIRST_SERVER)
+    assert fake_locations == [("MST", 1)]
+
+
+def test_location_without_machine_reads_load_config(tmp_path):
+    config_path = tmp_path / "config.json"
+    config_path.write_text(
+        json.dumps({"tree_name": TREE, "server_name": SECOND_SERVER})
+    )
+    fetcher = FetchDispatcher(load_config_path=str(config_path))
+    assert fetcher.location(1) == (TREE, SECOND_SERVER)
+
+
+def test_each_server_gets_its_own_pool(fake_locations, monkeypatch):
+    monkeypatch.setattr(dispatcher, "fetch_calls", fake_fetch_calls)
+    with FetchDispatcher(server_limits={FIRST_SERVER: SERVER_LIMIT}) as fetcher:
+        results = dict(fetcher.fetch(SHOTS, ["\\ip"], machine="mst"))
+        stats = fetcher.stats()
+
+    assert sorted(results) == SHOTS
+    assert results[1]() == {"\\ip": (1, FIRST_SERVER)}
+    assert results[2]() == {"\\ip": (2, SECOND_SERVER)}
+    with pytest.raises(KeyError):
+        results[FAILING_SHOT]()
+    assert stats[FIRST_SERVER] == {
+        "limit": SERVER_LIMIT,
+        "submitted": 2,
+        "finished": 2,
+        "failed": 0,
+    }
+    assert stats[SECOND_SERVER]["limit"] == dispatcher.DEFAULT_SERVER_LIMIT
+    assert stats[SECOND_SERVER]["failed"] == 1
+
+
+def test_slow_server_does_not_hold_up_others(fake_locations):
+    release = threading.Event()
+
+    def worker(shot_number):
+        if server_of(shot_number) == FIRST_SERVER:
+            release.wait()
+        return shot_number
+
+    fetcher = FetchDispatcher(default_limit=1)
+    try:
+        slow = fetcher.submit(SLOW_SHOT, machine="mst", worker=worker)
+        fast = fetcher.submit(FAST_SHOT, machine="mst", worker=worker)
+        assert fast.result(timeout=5) == FAST_SHOT
+        assert not slow.done()
+    finally:
+        release.set()
+        fetcher.close()
+    assert slow.result() == SLOW_SHOT
+
+
+def test_closed_dispatcher_refuses_fetches(fake_locations):
+    fetcher = FetchDispatcher()
+    fetcher.close()
+    with pytest.raises(RuntimeError, match="closed"):
+        fetcher.submit(1, machine="mst", worker=abs)
@@ -0,0 +1,64 @@
+"""Tests for streaming statistics of a signal over many shots."""
+
+import numpy as np
+import pytest
+
+from wipplpy.modules.ensemble import Ensemble, P2Quantile, Welford
+
+
+def test_welford_matches_numpy():
+    arrays = np.random.default_rng(0).normal(1e6, 2.0, size=(50, 3, 4))
+    welford = Welford()
+    for array in arrays:
+        welford.update(array)
+    assert welford.count == len(arrays)
+    np.testing.assert_allclose(welford.mean, arrays.mean(axis=0))
+    np.testing.assert_allclose(welford.variance(), arrays.var(axis=0, ddof=1))
+    np.testing.assert_allclose(welford.std(ddof=0), arrays.std(axis=0))
+
+
+def test_welford_rejects_other_shapes():
+    welford = Welford()
+    welford.update(np.zeros(3))
+    with pytest.raises(ValueError, match="shape"):
+        welford.update(np.zeros(4))
+
+
+def test_welford_needs_enough_arrays_for_a_variance():
+    welford = Welford()
+    welford.update(np.zeros(3))
+    with pytest.raises(ValueError, match="ddof"):
+        welford.variance()
+
+
+def test_p2_is_exact_for_the_first_arrays():
+    arrays = np.array([[3.0, 1.0], [1.0, 2.0], [2.0, 3.0]])
+    quantile = P2Quantile(0.5)
+    for array in arrays:
+        quantile.update(array)
+    np.testing.assert_allclose(quantile.value(), np.median(arrays, axis=0))
+
+
+@pytest.mark.parametrize("probability", [0.1, 0.5, 0.9])
+def test_p2_estimates_quantiles_of_many_arrays(probability):
+    arrays = np.random.default_rng(1).uniform(size=(5000, 3))
+    quantile = P2Quantile(probability)
+    for array in arrays:
+        quantile.update(array)
+    np.testing.assert_allclose(quantile.value(), probability, atol=0.03)
+
+
+def test_p2_rejects_probabilities_outside_zero_and_one():
+    with pytest.raises(ValueError, match="between 0 and 1"):
+        P2Quantile(1.0)
+
+
+def test_ensemble_gathers_moments_and_quantiles():
+    arrays = np.random.default_rng(2).normal(size=(200, 5))
+    ensemble = Ensemble(quantiles=(0.5,))
+    for array in arrays:
+        ensemble.update(array)
+    assert ensemble.count == len(arrays)
+    np.testing.assert_allclose(ensemble.mean, arrays.mean(axis=0))
+    np.testing.assert_allclose(ensemble.variance(), arrays.var(axis=0, ddof=1))
+    np.testing.assert_allclose(ensemble.quantile(0.5), 0.0, atol=0.3)
@@ -0,0 +1,83 @@
+"""Tests for reading shot numbers given to exports and writing exported files."""
+
+import os
+
+import numpy as np
+import pytest
+
+from wipplpy.modules.export import (
+    _write_atomically,
+    _written_files,
+    is_exported,
+    parse_shots,
+)
+from wipplpy.modules.generic_get_data import Data, Get
+
+SAMPLES = 10
+
+
+@pytest.mark.parametrize(
+    ("shot_ranges", "expected"),
+    [
+        ("1000", [1000]),
+        ("1000-1003", [1000, 1001, 1002, 1003]),
+        ("1000 - 1002, 1010", [1000, 1001, 1002, 1010]),
+        (["1002,1000", "1000-1001"], [1002, 1000, 1001]),
+        ("1000,,", [1000]),
+    ],
+)
+def test_parse_shots(shot_ranges, expected):
+    assert parse_shots(shot_ranges) == expected
+
+
+def test_backwards_ranges_are_rejected():
+    with pytest.raises(ValueError):
+        parse_shots("1010-1000")
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def data(self):
+        return self.value
+
+
+class FakeData(Data):
+    def __init__(self, **kwargs):
+        super().__init__(1, [], [], **kwargs)
+
+    def _fetch(self, call_string):
+        return FakeResult(np.arange(float(SAMPLES)))
+
+
+class LoadedData(Data):
+    def __init__(self, **kwargs):
+        super().__init__(1, [], [], **kwargs)
+
+    def _fetch(self, call_string):
+        pytest.fail(f"Called '{call_string}' instead of loading it.")
+
+
+@pytest.mark.parametrize(
+    ("export_format", "name"), [("mat", "calls.mat"), ("npy", "calls.npycache")]
+)
+def test_exported_files_are_recorded(tmp_path, export_format, name):
+    data = FakeData()
+    data.get(Get(r"\signal"))
+    filepath = os.path.join(tmp_path, name)
+    # Writing twice replaces what the first export left.
+    for _ in range(2):
+        _write_atomically(data, filepath, export_format)
+    written = _written_files(filepath)
+    assert written != []
+    assert all(path.startswith(name) for path in written)
+    assert [path for path in os.listdir(tmp_path) if "partial" in path] == []
+
+    files = {
+        path: {"sha256": "", "size": os.path.getsize(os.path.join(tmp_path, path))}
+        for path in written
+    }
+    assert is_exported(tmp_path, files)
+    loaded = LoadedData(load_filepath=filepath).get(Get(r"\signal"))
+    np.testing.assert_array_equal(loaded, np.arange(float(SAMPLES)))
@@ -0,0 +1,153 @@
+"""Tests for keeping idle connections alive and warming up trees ahead of time."""
+
+import threading
+
+import MDSplus as mds
+import pytest
+from MDSplus.mdsExceptions import MDSplusException
+
+from wipplpy.modules import shot_loader
+
+SERVER = "server"
+TREE = "tree"
+SHOT = 1
+SHOTS = [1, 2, 3]
+MISSING_SHOT = 2
+IDLE_TIME = 60.0
+INTERVAL = 0.02
+
+
+class FakeConnection(mds.Connection):
+    def __init__(self, hostspec=SERVER, alive=True):
+        self.hostspec = hostspec
+        self.tree_name = TREE
+        self.shot_number = SHOT
+        self.alive = alive
+        self.calls = []
+        self.opened = []
+        self.probed = threading.Event()
+
+    def get(self, expression):
+        self.calls.append(expression)
+        self.probed.set()
+        if not self.alive:
+            raise OSError("connection dropped")
+        return expression
+
+    def openTree(self, tree_name, shot_number):  # noqa: N802
+        if shot_number == MISSING_SHOT:
+            raise MDSplusException(message="no tree files")
+        self.opened.append(shot_number)
+
+    def closeAllTrees(self):  # noqa: N802
+        pass
+
+
+@pytest.fixture
+def reopened(monkeypatch):
+    """Replace opening trees with recording the arguments."""
+    calls = []
+
+    def get_remote_shot_tree(shot_number, **kwargs):
+        calls.append((shot_number, kwargs))
+
+    monkeypatch.setattr(shot_loader, "get_remote_shot_tree", get_remote_shot_tree)
+    monkeypatch.setattr(
+        shot_loader, "get_connector", lambda *args, **kwargs: calls.append(args)
+    )
+    return calls
+
+
+@pytest.fixture(autouse=True)
+def _reset(monkeypatch):
+    monkeypatch.setattr(shot_loader, "_mds_connection", None)
+    monkeypatch.setattr(shot_loader, "_global_tree", None)
+    monkeypatch.setattr(shot_loader, "_last_used", 0.0)
+    yield
+    shot_loader.stop_keepalive()
+
+
+def use_connection(monkeypatch, connection, with_tree=True):
+    monkeypatch.setattr(shot_loader, "_mds_connection", connection)
+    if with_tree:
+        monkeypatch.setattr(shot_loader, "_global_tree", connection)
+
+
+def test_nothing_to_probe_without_a_connection():
+    assert shot_loader.probe_connection() is None
+
+
+@pytest.mark.parametrize(("with_tree", "expression"), [(True, "$shot"), (False, "1")])
+def test_live_connection_answers_probe(monkeypatch, with_tree, expression):
+    connection = FakeConnection()
+    use_connection(monkeypatch, connection, with_tree=with_tree)
+    assert shot_loader.probe_connection() is True
+    assert connection.calls == [expression]
+    assert not shot_loader.is_stale(connection)
+
+
+def test_connections_in_use_are_not_probed(monkeypatch):
+    connection = FakeConnection()
+    use_connection(monkeypatch, connection)
+    with shot_loader.connection_in_use():
+        assert shot_loader.probe_connection() is None
+    # The call that just finished shows the connection is alive.
+    assert shot_loader.probe_connection(IDLE_TIME) is None
+    assert connection.calls == []
+
+
+def test_dead_connection_is_replaced(monkeypatch, reopened):
+    connection = FakeConnection(alive=False)
+    use_connection(monkeypatch, connection)
+    assert shot_loader.probe_connection() is False
+    assert shot_loader.is_stale(connection)
+    assert reopened == [
+        (
+            SHOT,
+            {
+                "tree_name": TREE,
+                "server_name": SERVER,
+                "reconnect": True,
+                "deadlines": shot_loader.get_deadlines(None),
+            },
+        )
+    ]
+
+
+def test_dead_connection_without_tree_only_reconnects(monkeypatch, reopened):
+    use_connection(monkeypatch, FakeConnection(alive=False), with_tree=False)
+    assert shot_loader.probe_connection() is False
+    assert reopened == [(SERVER,)]
+
+
+def test_keepalive_probes_idle_connection(monkeypatch):
+    connection = FakeConnection()
+    use_connection(monkeypatch, connection)
+    shot_loader.start_keepalive(INTERVAL)
+    assert connection.probed.wait(timeout=5)
+    shot_loader.stop_keepalive()
+    assert shot_loader._keepalive_thread is None
+
+
+def test_keepalive_interval_must_be_positive():
+    with pytest.raises(ValueError, match="positive"):
+        shot_loader.start_keepalive(0)
+
+
+def test_warm_up_without_shots():
+    assert shot_loader.warm_up([], TREE, SERVER) is None
+
+
+def test_warm_up_opens_later_trees_in_background(monkeypatch, reopened):
+    connections = []
+
+    def connect(server_name):
+        connections.append(FakeConnection(server_name))
+        return connections[-1]
+
+    monkeypatch.setattr(shot_loader.mds, "Connection", connect)
+    thread = shot_loader.warm_up(SHOTS, TREE, SERVER)
+    thread.join(timeout=5)
+    assert [call[0] for call in reopened] == SHOTS[:1]
+    # Shots without trees are skipped.
+    assert connections[0].opened == [SHOTS[2]]
@@ -0,0 +1,94 @@
+"""Tests for lazy get attributes and the attributes they are computed from."""
+
+import numpy as np
+import pytest
+
+from wipplpy.modules.generic_get_data import compute_lazy_gets, invalidate, lazy_get
+
+
+class Angle:
+    def __init__(self):
+        self.computed = []
+
+    @lazy_get
+    def deg(self):
+        self.computed.append("deg")
+        return 90.0
+
+    @lazy_get(depends_on="deg")
+    def rad(self):
+        self.computed.append("rad")
+        return np.deg2rad(self.deg)
+
+    @lazy_get(depends_on="rad")
+    def sine(self):
+        self.computed.append("sine")
+        return np.sin(self.rad)
+
+    @lazy_get
+    def other(self):
+        self.computed.append("other")
+        return 1.0
+
+
+def test_values_are_computed_once():
+    angle = Angle()
+    assert angle.sine == pytest.approx(1)
+    assert angle.sine == pytest.approx(1)
+    assert angle.computed == ["sine", "rad", "deg"]
+
+
+def test_setting_forgets_dependent_values():
+    angle = Angle()
+    angle.sine  # noqa: B018
+    angle.other  # noqa: B018
+    angle.computed.clear()
+    angle.deg = 180.0
+    assert angle.rad == pytest.approx(np.pi)
+    assert angle.sine == pytest.approx(0)
+    angle.other  # noqa: B018
+    assert angle.computed == ["rad", "sine"]
+
+
+def test_invalidate_forgets_values_computed_from_any_attribute():
+    angle = Angle()
+    angle.sine  # noqa: B018
+    assert invalidate(angle, "rad") == {"rad", "sine"}
+    assert angle._deg is not None
+
+
+class Failing(Angle):
+    @lazy_get
+    def deg(self):
+        raise KeyError("missing")
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_compute_lazy_gets_runs_dependencies_first(max_workers):
+    angle = Angle()
+    errors = compute_lazy_gets(angle, ["sine"], max_workers=max_workers)
+    assert errors == {}
+    assert angle.computed == ["deg", "rad", "sine"]
+
+
+def test_compute_lazy_gets_skips_values_of_failed_dependencies():
+    failing = Failing()
+    errors = compute_lazy_gets(failing, ignore_errors=True)
+    assert set(errors) == {"deg", "rad", "sine"}
+    assert failing.computed == ["other"]
+    with pytest.raises(KeyError):
+        compute_lazy_gets(Failing())
+
+
+def test_dependency_cycles_are_rejected():
+    class Cycle:
+        @lazy_get(depends_on="second")
+        def first(self):
+            return self.second
+
+        @lazy_get(depends_on="first")
+        def second(self):
+            return self.first
+
+    with pytest.raises(ValueError, match="depends on itself"):
+        compute_lazy_gets(Cycle())
@@ -0,0 +1,69 @@
+"""Tests for opening trees from the tree files on this host."""
+
+import pytest
+
+from wipplpy.modules import shot_loader
+from wipplpy.modules.connection import forget_route
+
+SERVER = "localhost:8000"
+TREE = "tree"
+SHOT = 1230419031
+
+
+class FakeTree:
+    def __init__(self, tree_name, shot_number, mode):
+        self.tree_name = tree_name
+        self.shot_number = shot_number
+
+    def tdiExecute(self, expression, *args):  # noqa: N802
+        return (expression, self.shot_number)
+
+
+@pytest.fixture(autouse=True)
+def _reset(monkeypatch):
+    forget_route()
+    monkeypatch.setattr(shot_loader, "_global_tree", None)
+    monkeypatch.setattr(shot_loader, "_local_failures", {})
+    monkeypatch.setattr(shot_loader, "_local_servers", {SERVER: True})
+    yield
+    forget_route()
+
+
+def test_local_trees_are_off_by_default():
+    assert not shot_loader._use_local_tree(SERVER, None)
+
+
+def test_local_tree_is_used_like_a_connection(monkeypatch):
+    monkeypatch.setattr(shot_loader, "prefer_local_trees", True)
+    monkeypatch.setattr(shot_loader.mds, "Tree", FakeTree, raising=False)
+    tree = shot_loader.get_remote_shot_tree(SHOT, TREE, SERVER)
+    assert isinstance(tree, shot_loader.LocalTree)
+    assert tree.hostspec == SERVER
+    assert tree.get(r"\ip") == (r"\ip", SHOT)
+    assert shot_loader.open_tree_location() == (SERVER, TREE, SHOT)
+
+
+def test_local_failures_expire(monkeypatch):
+    def fail(*args):
+        raise OSError("no tree files")
+
+    monkeypatch.setattr(shot_loader, "prefer_local_trees", True)
+    monkeypatch.setattr(shot_loader, "LocalTree", fail)
+    assert shot_loader._use_local_tree(SERVER, None)
+    assert (
+        shot_loader._open_local_shot_tree(TREE, SHOT, SERVER, local=None, timeout=None)
+        is None
+    )
+    assert not shot_loader._use_local_tree(SERVER, None)
+
+    monkeypatch.setattr(shot_loader, "LOCAL_FAILURE_TTL", -1)
+    assert shot_loader._use_local_tree(SERVER, None)
+
+
+def test_local_errors_are_raised_when_asked_for_a_local_tree(monkeypatch):
+    def fail(*args):
+        raise OSError("no tree files")
+
+    monkeypatch.setattr(shot_loader, "LocalTree", fail)
+    with pytest.raises(OSError, match="no tree files"):
+        shot_loader._open_local_shot_tree(TREE, SHOT, SERVER, local=True, timeout=None)
@@ -0,0 +1,114 @@
+"""Tests for listing shots and keeping the state of a mirror."""
+
+import pytest
+from MDSplus.mdsExceptions import MDSplusException
+
+from wipplpy.modules import mirror
+from wipplpy.modules.mirror import (
+    MAX_MISSING_IN_A_ROW,
+    MirrorState,
+    is_missing_shot_error,
+    list_shots,
+    list_tree_files,
+    sync_mirror,
+)
+
+FIRST_DAY = [1230419001, 1230419002, 1230419003]
+# April 20 has no shots.
+THIRD_DAY = [1230421001, 1230421002]
+SHOTS = FIRST_DAY + THIRD_DAY
+MISSING_MESSAGE = "%TREE-E-FOPENR, Error opening file read-only"
+
+
+def test_shots_are_listed_day_by_day():
+    checked = []
+
+    def shot_exists(shot_number):
+        checked.append(shot_number)
+        return shot_number in SHOTS
+
+    assert list_shots(FIRST_DAY[1], THIRD_DAY[-1], shot_exists) == SHOTS[1:]
+    # Each day is checked until enough shots in a row are missing.
+    assert len(checked) == len(SHOTS[1:]) + 2 * MAX_MISSING_IN_A_ROW
+    assert min(checked) == FIRST_DAY[1]
+    assert max(checked) == THIRD_DAY[-1]
+
+
+def test_shots_are_listed_across_months():
+    shots = [1230430005, 1230501001]
+    assert list_shots(shots[0], shots[-1], shots.__contains__) == shots
+
+
+def test_tree_files_are_listed(tmp_path):
+    for shot_number in SHOTS:
+        (tmp_path / f"mst_{shot_number}.tree").touch()
+    (tmp_path / "mst_model.tree").touch()
+    (tmp_path / f"other_{SHOTS[0]}.tree").touch()
+    assert list_tree_files(str(tmp_path), "MST", SHOTS[1], SHOTS[-2]) == SHOTS[1:-1]
+
+
+@pytest.mark.parametrize(
+    ("error", "expected"),
+    [
+        (MDSplusException(message=MISSING_MESSAGE), True),
+        (f"TreeFOPENR: {MISSING_MESSAGE}", True),
+        ("TreeFILE_NOT_FOUND: missing", True),
+        (MDSplusException(message="%TREE-W-NNF, Node Not Found"), False),
+        (TimeoutError("slow"), False),
+    ],
+)
+def test_missing_shot_errors(error, expected):
+    assert is_missing_shot_error(error) == expected
+
+
+def test_missing_shots_are_kept_apart(tmp_path):
+    with MirrorState(str(tmp_path)) as state:
+        state.record_failure(SHOTS[0], "TreeFOPENR", fresh=False)
+        state.record_missing(SHOTS[0])
+        state.record_success(SHOTS[1], {}, None, fresh=False)
+        assert state.missing_shots() == {SHOTS[0]}
+        assert list(state.shots()) == [SHOTS[1]]
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Fake server holding `SHOTS` where the last shot's tree can't be opened."""
+    checked = []
+    synced = []
+    missing = SHOTS[-1]
+
+    def shot_exists(shot_number, machine, config_filepath, deadlines):
+        checked.append(shot_number)
+        return shot_number in SHOTS
+
+    def mirror_shot(shot_number, **export_arguments):
+        synced.append(shot_number)
+        if shot_number == missing:
+            raise MDSplusException(message=MISSING_MESSAGE)
+        return {"files": {}, "fingerprint": None}
+
+    monkeypatch.setattr(mirror, "_shot_exists_on_server", shot_exists)
+    monkeypatch.setattr(mirror, "mirror_shot", mirror_shot)
+    return checked, synced, missing
+
+
+def test_sync_only_gets_shots_that_exist(tmp_path, server):
+    checked, synced, missing = server
+    arguments = {
+        "call_strings": (r"\ip",),
+        "first_shot": SHOTS[0],
+        "last_shot": SHOTS[-1],
+    }
+    summary = sync_mirror(str(tmp_path), **arguments)
+    assert synced == SHOTS
+    assert summary["new"] == SHOTS
+    assert summary["missing"] == [missing]
+    assert summary["failures"] == {}
+
+    # Listed days and missing shots aren't checked or tried again.
+    checked.clear()
+    synced.clear()
+    summary = sync_mirror(str(tmp_path), **arguments)
+    assert synced == []
+    assert summary["new"] == []
+    assert set(checked) <= set(range(THIRD_DAY[0], THIRD_DAY[-1] + 1))
@@ -0,0 +1,76 @@
+"""Tests for remembering calls that failed."""
+
+import math
+from datetime import date
+
+import pytest
+from MDSplus.connection import MdsIpException
+from MDSplus.mdsExceptions import MDSplusException, TreeNNF, TreeNODATA
+
+from wipplpy.modules.negative_cache import NegativeCache, is_cacheable
+
+PAST_SHOT = 1230419031
+
+
+def run_day_shot():
+    today = date.today()
+    return int(f"{math.floor(today.year / 1000) - 1}{today:%y%m%d}001")
+
+
+@pytest.mark.parametrize("error_class", [TreeNNF, TreeNODATA])
+def test_missing_nodes_and_data_are_cacheable(error_class):
+    assert is_cacheable(error_class(), PAST_SHOT)
+
+
+@pytest.mark.parametrize(
+    "error", [MdsIpException(), MDSplusException(), TimeoutError()]
+)
+def test_errors_that_may_go_away_are_not_cacheable(error):
+    assert not is_cacheable(error, PAST_SHOT)
+
+
+@pytest.mark.parametrize(
+    "message", ["%TREE-W-NNF, Node Not Found", "%TREE-E-NODATA, No data available"]
+)
+def test_remote_missing_nodes_and_data_are_cacheable(message):
+    assert is_cacheable(MdsIpException(message=message), PAST_SHOT)
+
+
+def test_failures_of_run_day_shots_are_not_cacheable():
+    assert not is_cacheable(TreeNNF(), run_day_shot())
+
+
+def test_failures_are_remembered_until_they_expire():
+    cache = NegativeCache()
+    cache.record(PAST_SHOT, r"\ip", TreeNNF())
+    cache.record(PAST_SHOT, r"\ne", TreeNNF(), ttl=-1)
+    cache.record(PAST_SHOT, r"\te", MdsIpException())
+    assert cache.lookup(PAST_SHOT, r"\ip").error_class_name == "TreeNNF"
+    assert cache.lookup(PAST_SHOT, r"\ne") is None
+    assert cache.lookup(PAST_SHOT, r"\te") is None
+    cache.forget(PAST_SHOT)
+    assert cache.lookup(PAST_SHOT, r"\ip") is None
+
+
+def test_failures_round_trip_through_text():
+    error = TreeNNF()
+    cache = NegativeCache()
+    cache.record(PAST_SHOT, r"\ip", error)
+    loaded = NegativeCache()
+    loaded.update_from_text(PAST_SHOT, cache.to_text(PAST_SHOT))
+    failure = loaded.lookup(PAST_SHOT, r"\ip")
+    assert failure.error_class_name == "TreeNNF"
+    assert failure.message == " ".join(str(error).split())
+    assert isinstance(failure.error(), TreeNNF)
+
+
+def test_remembered_errors_are_raised_as_new_errors():
+    cache = NegativeCache()
+    cache.record(PAST_SHOT, r"\ip", TreeNNF())
+    failure = cache.lookup(PAST_SHOT, r"\ip")
+    for _ in range(2):
+        with pytest.raises(TreeNNF) as raised:
+            raise failure.error()
+        # Only the frame of this test is in the traceback.
+        assert raised.value.__traceback__.tb_next is None
+    assert failure.error() is not failure.error()
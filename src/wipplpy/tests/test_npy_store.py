@@ -0,0 +1,55 @@
+"""Tests for storing arrays as `.npy` files."""
+
+import pickle
+
+import numpy as np
+import pytest
+
+from wipplpy.modules.npy_store import NpyStore
+
+
+def test_arrays_are_memory_mapped_back(tmp_path):
+    store = NpyStore(tmp_path)
+    array = np.arange(10.0)
+    store.put("shot:1:ip", array)
+    assert "shot:1:ip" in store
+    loaded = store.get("shot:1:ip")
+    assert isinstance(loaded, np.memmap)
+    np.testing.assert_array_equal(loaded, array)
+    assert not isinstance(store.get("shot:1:ip", mmap=False), np.memmap)
+
+
+def test_put_replaces_the_array_of_a_key(tmp_path):
+    store = NpyStore(tmp_path)
+    store.put("key", np.zeros(3))
+    store.put("key", np.ones(5))
+    np.testing.assert_array_equal(store.get("key"), np.ones(5))
+    assert store.keys() == ["key"]
+    assert store.read_index()["key"]["shape"] == [5]
+
+
+def test_missing_keys_raise_key_error(tmp_path):
+    store = NpyStore(tmp_path)
+    with pytest.raises(KeyError):
+        store.get("missing")
+
+
+def test_replace_all_removes_other_arrays(tmp_path):
+    store = NpyStore(tmp_path)
+    store.put("old", np.zeros(3))
+    store.replace_all({"new": np.ones(2)}, metadata={"shot": 1})
+    assert "old" not in store
+    assert sorted(store) == ["new"]
+    assert store.read_metadata() == {"shot": 1}
+
+
+def test_stores_can_be_sent_to_other_processes(tmp_path):
+    store = NpyStore(tmp_path)
+    store.put("key", np.arange(3))
+    copy = pickle.loads(pickle.dumps(store))
+    np.testing.assert_array_equal(copy.get("key"), np.arange(3))
+
+
+def test_unknown_codecs_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match="Unknown codec"):
+        NpyStore(tmp_path, codec="gzip")
@@ -0,0 +1,75 @@
+"""Tests for pickling data objects to send them to other processes."""
+
+import pickle
+
+import numpy as np
+import pytest
+
+from wipplpy.modules.generic_get_data import Data, Get
+from wipplpy.modules.npy_store import NpyStore
+
+SAMPLES = 10_000
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def data(self):
+        return self.value
+
+
+class FakeData(Data):
+    def __init__(self, **kwargs):
+        super().__init__(1, [], [], **kwargs)
+        self.num_fetches = 0
+
+    def _fetch(self, call_string):
+        self.num_fetches += 1
+        return FakeResult(np.arange(float(SAMPLES)))
+
+
+@pytest.fixture
+def data():
+    data = FakeData()
+    data.get(Get(r"\signal"))
+    return data
+
+
+def test_full_mode_carries_data(data):
+    copy = pickle.loads(pickle.dumps(data))
+    np.testing.assert_array_equal(copy.get(Get(r"\signal")), np.arange(SAMPLES))
+    assert copy.num_fetches == 1
+    assert copy._tree is None
+
+
+def test_keys_mode_shares_arrays_through_the_store(data, tmp_path):
+    store = NpyStore(str(tmp_path))
+    data.set_pickle_mode("keys", store)
+    pickled = pickle.dumps(data)
+    assert len(store.read_index()) == 1
+    # Only the key of the array is pickled.
+    assert len(pickled) < SAMPLES * np.dtype(float).itemsize
+
+    copy = pickle.loads(pickled)
+    signal = copy.get(Get(r"\signal"))
+    assert isinstance(signal, np.memmap)
+    np.testing.assert_array_equal(signal, np.arange(SAMPLES))
+    assert copy.num_fetches == 1
+
+    # Pickling again doesn't write the array again.
+    pickle.dumps(copy)
+    assert len(store.read_index()) == 1
+
+
+def test_none_mode_calls_again(data):
+    data.set_pickle_mode("none")
+    copy = pickle.loads(pickle.dumps(data))
+    assert len(copy.saved_calls) == 0
+    np.testing.assert_array_equal(copy.get(Get(r"\signal")), np.arange(SAMPLES))
+    assert copy.num_fetches == data.num_fetches + 1
+
+
+def test_keys_mode_needs_a_store(data):
+    with pytest.raises(ValueError, match="store"):
+        data.set_pickle_mode("keys")
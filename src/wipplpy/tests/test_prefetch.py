@@ -0,0 +1,96 @@
+"""Tests for getting data in the background in priority order."""
+
+import threading
+import time
+
+import pytest
+
+from wipplpy.modules import shot_loader
+from wipplpy.modules.generic_get_data import Data
+from wipplpy.modules.prefetch import Prefetch, PrefetchQueue
+
+TIMEOUT = 5
+POLL_INTERVAL = 0.001
+
+
+def test_queue_runs_lowest_priority_first():
+    release = threading.Event()
+    order = []
+    queue = PrefetchQueue()
+    # Hold the background thread so that the others are all queued before any runs.
+    blocker = Prefetch(release.wait, TIMEOUT)
+    queue.put(blocker)
+    prefetches = [Prefetch(order.append, priority) for priority in (3, 1, 2)]
+    for prefetch, priority in zip(prefetches, (3, 1, 2), strict=True):
+        queue.put(prefetch, priority)
+    release.set()
+    # Wait without calling `result` since that runs a pending prefetch right away.
+    deadline = time.monotonic() + TIMEOUT
+    while not all(prefetch.done() for prefetch in prefetches):
+        assert time.monotonic() < deadline
+        time.sleep(POLL_INTERVAL)
+    assert order == [1, 2, 3]
+
+
+def test_pending_prefetch_runs_in_the_thread_that_needs_it():
+    prefetch = Prefetch(threading.current_thread)
+    assert prefetch.result() is threading.current_thread()
+    assert prefetch.done()
+
+
+def test_prefetch_errors_are_raised_when_used():
+    def fail():
+        raise KeyError("missing")
+
+    prefetch = Prefetch(fail)
+    queue = PrefetchQueue()
+    queue.put(prefetch)
+    with pytest.raises(KeyError):
+        prefetch.result(TIMEOUT)
+
+
+def test_result_times_out_while_running():
+    started = threading.Event()
+    release = threading.Event()
+
+    def wait():
+        started.set()
+        release.wait(TIMEOUT)
+
+    prefetch = Prefetch(wait)
+    PrefetchQueue().put(prefetch)
+    started.wait(TIMEOUT)
+    try:
+        with pytest.raises(TimeoutError):
+            prefetch.result(timeout=0)
+    finally:
+        release.set()
+
+
+class FakeTree:
+    shot_number = 1
+
+    def get(self, call_string):
+        # Another thread must not be able to open another shot while the call runs.
+        other = threading.Thread(target=self.try_lock)
+        other.start()
+        other.join()
+        return self.locked_elsewhere
+
+    def try_lock(self):
+        acquired = shot_loader._connection_lock.acquire(blocking=False)
+        if acquired:
+            shot_loader._connection_lock.release()
+        self.locked_elsewhere = not acquired
+
+
+class FakeData(Data):
+    def __init__(self):
+        super().__init__(1, [], [])
+
+    def _open_tree(self, reconnect=False):
+        return FakeTree()
+
+
+def test_connection_is_held_during_calls():
+    assert FakeData()._fetch(r"\ip")
@@ -0,0 +1,90 @@
+"""Tests for min/max pyramids of signals."""
+
+import numpy as np
+import pytest
+
+from wipplpy.modules.pyramid import SignalPyramid
+
+FACTOR = 4
+# Not a multiple of the block sizes so that some samples are left pending.
+SAMPLES = 1003
+CHUNK_SIZE = 37
+
+
+@pytest.fixture
+def signal():
+    return np.random.default_rng(0).normal(size=SAMPLES)
+
+
+def _expected_level(signal, block_size):
+    num_blocks = signal.size // block_size
+    blocks = signal[: num_blocks * block_size].reshape(num_blocks, block_size)
+    return blocks.min(axis=1), blocks.max(axis=1)
+
+
+def test_levels_hold_block_extremes(signal):
+    pyramid = SignalPyramid.from_array(signal, FACTOR)
+    assert pyramid.length == SAMPLES
+    assert pyramid.block_size(pyramid.num_levels - 1) <= SAMPLES
+    assert pyramid.block_size(pyramid.num_levels) > SAMPLES
+    for level in range(pyramid.num_levels):
+        mins, maxs = pyramid.level(level)
+        expected_mins, expected_maxs = _expected_level(
+            signal, pyramid.block_size(level)
+        )
+        np.testing.assert_array_equal(mins, expected_mins)
+        np.testing.assert_array_equal(maxs, expected_maxs)
+
+
+def test_extending_in_chunks_matches_full_signal(signal):
+    full = SignalPyramid.from_array(signal, FACTOR)
+    chunked = SignalPyramid(FACTOR)
+    for start in range(0, SAMPLES, CHUNK_SIZE):
+        chunked.extend(signal[start : start + CHUNK_SIZE])
+    assert chunked.num_levels == full.num_levels
+    for level in range(full.num_levels):
+        np.testing.assert_array_equal(chunked.level(level)[0], full.level(level)[0])
+        np.testing.assert_array_equal(chunked.level(level)[1], full.level(level)[1])
+
+
+def test_choose_level_keeps_a_block_per_pixel():
+    pyramid = SignalPyramid.from_array(np.zeros(SAMPLES), FACTOR)
+    num_pixels = SAMPLES // FACTOR**2
+    assert pyramid.choose_level(SAMPLES, num_pixels) == 1
+    assert pyramid.choose_level(SAMPLES, SAMPLES) is None
+
+
+def test_view_covers_range_and_pending_samples(signal):
+    pyramid = SignalPyramid.from_array(signal, FACTOR)
+    num_pixels = SAMPLES // FACTOR
+    indices, mins, maxs = pyramid.view(num_pixels=num_pixels)
+    block_size = FACTOR
+    # The samples after the last full block are summarized by one more block.
+    tail_start = SAMPLES // block_size * block_size
+    assert indices[-1] == tail_start
+    assert mins[-1] == signal[tail_start:].min()
+    assert maxs[-1] == signal[tail_start:].max()
+    assert mins.min() == signal.min()
+    assert maxs.max() == signal.max()
+
+    start = 2 * block_size + 1
+    stop = SAMPLES // 2
+    indices, mins, maxs = pyramid.view((start, stop), num_pixels=FACTOR)
+    block_size = pyramid.block_size(pyramid.choose_level(stop - start + 1, FACTOR))
+    assert indices[0] == start // block_size * block_size
+    assert indices[-1] == stop // block_size * block_size
+    np.testing.assert_array_equal(np.diff(indices), block_size)
+    for index, low, high in zip(indices, mins, maxs, strict=True):
+        block = signal[index : index + block_size]
+        assert low == block.min()
+        assert high == block.max()
+
+
+def test_view_needs_full_resolution_when_zoomed_in(signal):
+    pyramid = SignalPyramid.from_array(signal, FACTOR)
+    assert pyramid.view((0, FACTOR), num_pixels=FACTOR * 2) is None
+
+
+def test_factor_must_group_blocks():
+    with pytest.raises(ValueError, match="at least"):
+        SignalPyramid(1)
@@ -0,0 +1,96 @@
+"""Tests for merging requests for slices of signals into fetches."""
+
+import numpy as np
+import pytest
+
+from wipplpy.modules.generic_get_data import Data, Get
+from wipplpy.modules.query_planner import SliceRequest, contained_slice, plan_fetches
+
+SAMPLES = 100
+
+
+def test_overlapping_requests_are_merged():
+    signal = Get(r"\signal")
+    requests = [
+        SliceRequest(signal, (0, 49)),
+        SliceRequest(signal, (40, 99)),
+        SliceRequest(Get(r"\other"), (0, 9)),
+    ]
+    fetches = plan_fetches(requests)
+    assert sorted(f.get_call.call_string for f in fetches) == [r"\other", r"\signal"]
+    merged = next(f for f in fetches if f.get_call is signal)
+    assert merged.index_range == (0, 99)
+    assert dict(merged.requests) == {0: slice(0, 50, 1), 1: slice(40, 100, 1)}
+
+
+def test_gaps_are_merged_up_to_the_largest_gap():
+    signal = Get(r"\signal")
+    requests = [SliceRequest(signal, (0, 9)), SliceRequest(signal, (15, 19))]
+    assert len(plan_fetches(requests)) == len(requests)
+    assert len(plan_fetches(requests, max_gap=5)) == 1
+
+
+def test_merged_fetch_uses_a_common_sample_period():
+    signal = Get(r"\signal")
+    requests = [SliceRequest(signal, (0, 40), 4), SliceRequest(signal, (2, 40), 6)]
+    (fetch,) = plan_fetches(requests)
+    assert (fetch.index_range, fetch.sample_period) == ((0, 40), 2)
+    assert dict(fetch.requests) == {0: slice(0, 21, 2), 1: slice(1, 21, 3)}
+
+
+def test_requests_to_the_end_fetch_the_whole_signal():
+    signal = Get(r"\signal")
+    requests = [SliceRequest(signal, (10, 20)), SliceRequest(signal, (15, None))]
+    (fetch,) = plan_fetches(requests)
+    assert fetch.index_range is None
+    assert fetch.start == 0
+    assert dict(fetch.requests) == {0: slice(10, 21, 1), 1: slice(15, None, 1)}
+
+
+def test_only_signals_can_be_planned():
+    with pytest.raises(ValueError, match="not a signal"):
+        plan_fetches([SliceRequest(Get(r"\scalar", signal=False), (0, 9))])
+
+
+@pytest.mark.parametrize(
+    ("entry", "request_", "expected"),
+    [
+        ((0, None, 1), (10, 19, 1), slice(10, 20, 1)),
+        ((0, 99, 1), (10, None, 1), None),
+        ((10, 99, 1), (0, 19, 1), None),
+        ((10, 99, 2), (20, 40, 4), slice(5, 16, 2)),
+        ((10, 99, 2), (11, 41, 2), None),
+        ((0, 99, 2), (0, 99, 3), None),
+        ((0, 99, 1), (10, 99, 1), slice(10, 100, 1)),
+    ],
+)
+def test_contained_slice(entry, request_, expected):
+    assert contained_slice(entry, request_) == expected
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def data(self):
+        return self.value
+
+
+class FakeData(Data):
+    def __init__(self, **kwargs):
+        super().__init__(1, [], [], **kwargs)
+        self.fetched = []
+
+    def _fetch(self, call_string):
+        self.fetched.append(call_string)
+        return FakeResult(np.arange(float(SAMPLES)))
+
+
+def test_parts_of_saved_signals_are_sliced_locally():
+    data = FakeData()
+    signal = Get(r"\signal")
+    full = data.get_range(signal, None)
+    part = data.get_range(signal, (10, 29), sample_period=2)
+    assert data.fetched == [signal.full_str()]
+    assert np.shares_memory(part, full)
+    np.testing.assert_array_equal(part, full[10:30:2])
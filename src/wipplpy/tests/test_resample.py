@@ -0,0 +1,77 @@
+"""Tests for resampling signals onto a common timebase."""
+
+import numpy as np
+import pytest
+
+from wipplpy.modules.resample import (
+    ResampleWeights,
+    clear_resample_cache,
+    resample,
+    resample_weights,
+)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    clear_resample_cache()
+    yield
+    clear_resample_cache()
+
+
+def test_linear_resampling_of_a_line_is_exact():
+    source = np.linspace(0, 1, 11)
+    target = np.linspace(0.05, 0.95, 7)
+    np.testing.assert_allclose(resample(3 * source + 1, source, target), 3 * target + 1)
+
+
+def test_targets_outside_the_source_are_nan():
+    source = np.linspace(0, 1, 11)
+    resampled = resample(source, source, [-0.5, 0.5, 1.5], method="linear")
+    assert np.isnan(resampled[0]) and np.isnan(resampled[2])
+    assert resampled[1] == pytest.approx(0.5)
+
+
+def test_boxcar_averages_each_bin():
+    source = np.arange(100.0)
+    target = np.arange(5.0, 95.0, 10.0)
+    signal = np.where(np.arange(100) % 2 == 0, 1.0, -1.0)
+    weights = ResampleWeights(source, target, "boxcar")
+    assert weights.method == "boxcar"
+    np.testing.assert_allclose(weights.apply(signal), 0.0)
+
+
+def test_boxcar_end_bins_are_not_biased():
+    source = np.linspace(0, 1, 1000)
+    target = np.linspace(0, 1, 11)
+    # Bins cut off by the ends of the source would be off by about a quarter of the target spacing.
+    np.testing.assert_allclose(
+        resample(source, source, target, "boxcar"), target, atol=np.diff(source)[0]
+    )
+
+
+def test_auto_method_follows_the_spacing():
+    source = np.linspace(0, 1, 1001)
+    assert resample_weights(source, np.linspace(0, 1, 11)).method == "boxcar"
+    assert resample_weights(source, np.linspace(0, 1, 2001)).method == "linear"
+
+
+def test_weights_are_reused_for_the_same_timebases():
+    source = np.linspace(0, 1, 11)
+    target = np.linspace(0, 1, 5)
+    assert resample_weights(source, target) is resample_weights(source.copy(), target)
+
+
+def test_timebases_with_the_same_fingerprint_get_their_own_weights():
+    target = np.linspace(0, 1, 11)
+    uniform = np.linspace(0, 1, 5)
+    gapped = np.array([0.0, 0.1, 0.2, 0.3, 1.0])
+    resample_weights(uniform, target)
+    weights = resample_weights(gapped, target)
+    assert weights.matches(gapped, target)
+    np.testing.assert_allclose(resample(gapped, gapped, target), target)
+
+
+def test_signals_must_be_on_the_source_timebase():
+    weights = ResampleWeights(np.arange(10.0), np.arange(5.0))
+    with pytest.raises(ValueError, match="samples"):
+        weights.apply(np.zeros(9))
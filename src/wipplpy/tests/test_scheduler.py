@@ -0,0 +1,86 @@
+"""Tests for running queued gets grouped by the tree they need."""
+
+import numpy as np
+import pytest
+
+from wipplpy.modules import scheduler
+from wipplpy.modules.generic_get_data import Data, Get
+from wipplpy.modules.scheduler import GetScheduler
+
+TREE = "tree"
+FIRST_SERVER = "first"
+SECOND_SERVER = "second"
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def data(self):
+        return self.value
+
+
+class FakeData(Data):
+    def __init__(self, shot_number, server_name, fetched):
+        super().__init__(shot_number, [], [])
+        self.tree_name = TREE
+        self.server_name = server_name
+        self.fetched = fetched
+
+    def _fetch(self, call_string):
+        if r"\missing" in call_string:
+            raise KeyError(call_string)
+        self.fetched.append((self.server_name, self.shot_number))
+        return FakeResult(np.full(1, float(self.shot_number)))
+
+
+@pytest.fixture
+def open_location(monkeypatch):
+    location = [None]
+    monkeypatch.setattr(scheduler, "open_tree_location", lambda: location[0])
+    return location
+
+
+def test_requests_are_grouped_by_tree(open_location):
+    fetched = []
+    first = FakeData(1, FIRST_SERVER, fetched)
+    second = FakeData(2, SECOND_SERVER, fetched)
+    third = FakeData(3, FIRST_SERVER, fetched)
+    # The shot that is already open is run first and shots on its server after it.
+    open_location[0] = (SECOND_SERVER, TREE, 2)
+
+    requests = [
+        (data, Get(call)) for call in (r"\a", r"\b") for data in (first, second, third)
+    ]
+    sched = GetScheduler()
+    results = sched.get_many(requests)
+
+    assert [result[0] for result in results] == [1, 2, 3, 1, 2, 3]
+    assert fetched == [
+        (SECOND_SERVER, 2),
+        (SECOND_SERVER, 2),
+        (FIRST_SERVER, 1),
+        (FIRST_SERVER, 1),
+        (FIRST_SERVER, 3),
+        (FIRST_SERVER, 3),
+    ]
+    assert sched.stats == {"requests": len(requests), "groups": len(fetched) // 2}
+
+
+def test_errors_only_fail_their_request(open_location):
+    data = FakeData(1, FIRST_SERVER, [])
+    with GetScheduler() as sched:
+        failing = sched.submit(data, Get(r"\missing"))
+        working = sched.submit(data, Get(r"\a"))
+    with pytest.raises(KeyError):
+        failing.result()
+    assert working.result()[0] == 1
+
+
+def test_requests_are_cancelled_when_the_block_fails(open_location):
+    data = FakeData(1, FIRST_SERVER, [])
+    with pytest.raises(RuntimeError), GetScheduler() as sched:
+        future = sched.submit(data, Get(r"\a"))
+        raise RuntimeError
+    assert future.cancelled()
+    assert data.fetched == []
@@ -0,0 +1,77 @@
+"""Tests for sharing identical calls that are in flight at the same time."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from wipplpy.modules.single_flight import SingleFlight
+
+KEY = ("shot", "call")
+NUM_FOLLOWERS = 3
+TIMEOUT = 5
+POLL_INTERVAL = 0.001
+
+
+def _run_together(flight, function):
+    """Call `function` once through `flight` and make followers wait on it."""
+    started = threading.Event()
+    release = threading.Event()
+
+    def leader():
+        started.set()
+        release.wait(TIMEOUT)
+        return function()
+
+    with ThreadPoolExecutor(NUM_FOLLOWERS + 1) as executor:
+        first = executor.submit(flight.do, KEY, leader)
+        started.wait(TIMEOUT)
+        followers = [
+            executor.submit(flight.do, KEY, pytest.fail) for _ in range(NUM_FOLLOWERS)
+        ]
+        # Let the followers start waiting before the leader finishes.
+        while flight._calls[KEY].num_waiting < NUM_FOLLOWERS:
+            time.sleep(POLL_INTERVAL)
+        release.set()
+        return first, followers
+
+
+def test_followers_share_leader_result():
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return np.arange(4.0)
+
+    flight = SingleFlight()
+    first, followers = _run_together(flight, fetch)
+    assert len(calls) == 1
+    for follower in followers:
+        np.testing.assert_array_equal(follower.result(), first.result())
+    assert not flight.in_flight(KEY)
+
+
+def test_followers_get_read_only_views():
+    flight = SingleFlight()
+    first, followers = _run_together(flight, lambda: np.zeros(4))
+    leader_result = first.result()
+    assert leader_result.flags.writeable
+    for follower in followers:
+        result = follower.result()
+        assert np.shares_memory(result, leader_result)
+        with pytest.raises(ValueError, match="read-only"):
+            result[0] = 1
+
+
+def test_followers_get_leader_error():
+    def fail():
+        raise KeyError("missing")
+
+    flight = SingleFlight()
+    first, followers = _run_together(flight, fail)
+    for future in [first, *followers]:
+        with pytest.raises(KeyError):
+            future.result()
+    assert not flight.in_flight(KEY)
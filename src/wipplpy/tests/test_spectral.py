@@ -0,0 +1,126 @@
+"""Tests for spectra of signals fetched in chunks."""
+
+import numpy as np
+import pytest
+import scipy.signal
+
+from wipplpy.modules import spectral
+from wipplpy.modules.generic_get_data import Data, Get, MultiGet
+
+SAMPLE_RATE = 1000.0
+SAMPLES = 2000
+SEGMENT_LENGTH = 64
+NUM_CHANNELS = 2
+# Small enough that the signals are fetched in many chunks.
+MEMORY_BUDGET = 3 * 4 * 8 * NUM_CHANNELS * SEGMENT_LENGTH
+INDEX_RANGE = (0, SAMPLES - 1)
+
+
+class FakeData(Data):
+    def __init__(self, signals, multi_get_fails=False):
+        super().__init__(1, [], [])
+        self.signals = signals
+        self.multi_get_fails = multi_get_fails
+        self.num_fetches = 0
+
+    def get_range(  # noqa: PLR0913
+        self,
+        get_call,
+        index_range,
+        sample_period=1,
+        np_data_type=np.float64,
+        change_data=True,
+        load_from_saved=True,
+        save=True,
+    ):
+        self.num_fetches += 1
+        samples = slice(index_range[0], index_range[1] + 1, sample_period)
+        if isinstance(get_call, MultiGet):
+            if self.multi_get_fails:
+                raise ValueError("Signals have different lengths.")
+            return np.stack([self.signals[c][samples] for c in get_call.call_strings])
+        return self.signals[get_call.call_string][samples]
+
+
+@pytest.fixture
+def signals():
+    rng = np.random.default_rng(0)
+    times = np.arange(SAMPLES) / SAMPLE_RATE
+    common = np.sin(2 * np.pi * 50 * times)
+    return {
+        rf"\signal_{i}": common + rng.normal(size=SAMPLES) for i in range(NUM_CHANNELS)
+    }
+
+
+def _arguments(signals):
+    return {
+        "get_calls": [Get(call) for call in signals],
+        "segment_length": SEGMENT_LENGTH,
+        "sample_rate": SAMPLE_RATE,
+        "index_range": INDEX_RANGE,
+        "memory_budget": MEMORY_BUDGET,
+    }
+
+
+@pytest.mark.parametrize("multi_get_fails", [False, True])
+@pytest.mark.parametrize("scaling", ["density", "spectrum"])
+def test_welch_matches_scipy(signals, multi_get_fails, scaling):
+    data = FakeData(signals, multi_get_fails)
+    frequencies, spectra = spectral.welch(data, scaling=scaling, **_arguments(signals))
+    assert data.num_fetches > NUM_CHANNELS * 2
+    for spectrum, signal in zip(spectra, signals.values(), strict=True):
+        expected_frequencies, expected = scipy.signal.welch(
+            signal, SAMPLE_RATE, nperseg=SEGMENT_LENGTH, scaling=scaling
+        )
+        np.testing.assert_allclose(frequencies, expected_frequencies)
+        np.testing.assert_allclose(spectrum, expected)
+
+
+def test_cross_spectra_and_coherence_match_scipy(signals):
+    data = FakeData(signals)
+    _, spectra = spectral.cross_spectra(data, **_arguments(signals))
+    _, coherences = spectral.coherence(data, **_arguments(signals))
+    first, second = signals.values()
+    _, expected = scipy.signal.csd(first, second, SAMPLE_RATE, nperseg=SEGMENT_LENGTH)
+    np.testing.assert_allclose(spectra[0, 1], expected)
+    np.testing.assert_allclose(spectra[1, 0], np.conj(expected))
+    _, expected = scipy.signal.coherence(
+        first, second, SAMPLE_RATE, nperseg=SEGMENT_LENGTH
+    )
+    np.testing.assert_allclose(coherences[0, 1], expected)
+    np.testing.assert_allclose(np.diagonal(coherences).T, 1)
+
+
+def test_spectrogram_matches_scipy(signals):
+    data = FakeData(signals)
+    frequencies, indices, spectrograms = spectral.spectrogram(
+        data, segments_per_column=1, **_arguments(signals)
+    )
+    for spectrogram, signal in zip(spectrograms, signals.values(), strict=True):
+        expected_frequencies, expected_times, expected = scipy.signal.spectrogram(
+            signal,
+            SAMPLE_RATE,
+            window="hann",
+            nperseg=SEGMENT_LENGTH,
+            noverlap=SEGMENT_LENGTH // 2,
+        )
+        np.testing.assert_allclose(frequencies, expected_frequencies)
+        np.testing.assert_allclose(spectrogram, expected)
+        # scipy gives the time of the middle of each segment from the first sample.
+        np.testing.assert_allclose(
+            indices / SAMPLE_RATE, expected_times - 0.5 / SAMPLE_RATE
+        )
+
+
+def test_spectrogram_columns_average_segments(signals):
+    data = FakeData(signals)
+    segments_per_column = 3
+    _, _, single = spectral.spectrogram(
+        data, segments_per_column=1, **_arguments(signals)
+    )
+    _, _, averaged = spectral.spectrogram(
+        data, segments_per_column=segments_per_column, **_arguments(signals)
+    )
+    np.testing.assert_allclose(
+        averaged[..., 0], single[..., :segments_per_column].mean(axis=-1)
+    )
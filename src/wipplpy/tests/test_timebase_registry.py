@@ -0,0 +1,67 @@
+"""Tests for sharing timebases between signals on the same digitizer clock."""
+
+import numpy as np
+import pytest
+
+from wipplpy.modules.timebase_registry import (
+    MAX_TIMEBASE_REGISTRIES,
+    TimebaseRegistry,
+    clear_timebase_registries,
+    fingerprint_from_call_result,
+    get_timebase_registry,
+    timebase_fingerprint,
+)
+
+SHOT = 1230419031
+
+
+@pytest.fixture(autouse=True)
+def empty_registries():
+    clear_timebase_registries()
+    yield
+    clear_timebase_registries()
+
+
+def test_identical_timebases_are_shared_read_only():
+    registry = TimebaseRegistry(SHOT)
+    first = registry.register(np.linspace(0, 1, 11), key="digitizer_1")
+    second = registry.register(np.linspace(0, 1, 11), key="digitizer_1")
+    assert second is first
+    assert not first.flags.writeable
+
+
+def test_different_timebases_under_one_key_are_not_shared():
+    registry = TimebaseRegistry(SHOT)
+    registry.register(np.linspace(0, 1, 11), key="digitizer_1")
+    other = np.linspace(0, 2, 11)
+    assert registry.register(other, key="digitizer_1") is other
+
+
+def test_only_uniform_timebases_are_found_by_fingerprint():
+    registry = TimebaseRegistry(SHOT)
+    uniform = registry.register(np.linspace(0, 1, 5))
+    gapped = registry.register(np.array([0.0, 0.1, 0.2, 0.3, 2.0]))
+    assert registry.lookup(timebase_fingerprint(uniform)) is uniform
+    assert registry.lookup(timebase_fingerprint(gapped)) is None
+
+
+def test_server_fingerprints_match_local_ones():
+    times = np.linspace(-0.5, 1.5, 101, dtype=np.float32)
+    result = np.array([times[0], times[-1], times.size], dtype=np.float64)
+    assert fingerprint_from_call_result(result, np.float32) == timebase_fingerprint(
+        times
+    )
+
+
+def test_registries_are_kept_for_each_server_tree_and_shot():
+    registry = get_timebase_registry(SHOT, "mst", "dave")
+    assert get_timebase_registry(SHOT, "mst", "dave") is registry
+    assert get_timebase_registry(SHOT, "mst", "aurora") is not registry
+    assert get_timebase_registry(SHOT, "brb", "dave") is not registry
+
+
+def test_least_recently_used_registries_are_forgotten():
+    first = get_timebase_registry(0)
+    for shot_number in range(1, MAX_TIMEBASE_REGISTRIES + 1):
+        get_timebase_registry(shot_number)
+    assert get_timebase_registry(0) is not first